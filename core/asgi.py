@@ -5,6 +5,12 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+События в реальном времени (/api/events, SSE) работают только под ASGI-сервером,
+например: uvicorn core.asgi:application --workers 2 (и EVENTS_ENABLED = True).
+Под WSGI (core/wsgi.py, runserver) /api/events отвечает 204, и клиенты остаются на опросе.
+Открытое подключение не занимает поток, а все подключения процесса делят одно
+соединение PostgreSQL (LISTEN, orders/events.py).
 """
 
 import os
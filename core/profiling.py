@@ -0,0 +1,193 @@
+# core/profiling.py
+# Профилирование запросов (включается PROFILING_ENABLED): время ответа, число SQL-запросов
+# и их суммарное время, повторяющиеся запросы (признак N+1) и время HTTP-запросов к биржам.
+# Профилируется только доля запросов (PROFILING_SAMPLE_RATE), самые медленные хранятся
+# в памяти процесса и видны в админке (/p2p-admin/profiling/).
+import contextvars
+import heapq
+import itertools
+import random
+import re
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+SQL_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+SQL_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+SQL_IN_RE = re.compile(r'\bIN \((?:\s*%s\s*,?)+\)', re.IGNORECASE)
+SQL_SPACE_RE = re.compile(r'\s+')
+
+MAX_QUERIES_KEPT = 200  # на один запрос: для отчёта хватает, память не растёт на тяжёлых страницах
+
+_current = contextvars.ContextVar('request_profile', default=None)
+
+
+def profiling_setting(name, default):
+    return getattr(settings, name, default)
+
+
+def fingerprint(sql):
+    # Один и тот же запрос с разными значениями -> одинаковый отпечаток
+    sql = SQL_STRING_RE.sub('?', sql)
+    sql = SQL_NUMBER_RE.sub('?', sql)
+    sql = SQL_IN_RE.sub('IN (...)', sql)
+    return SQL_SPACE_RE.sub(' ', sql).strip()
+
+
+class RequestProfile:
+    def __init__(self, method='', path=''):
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.wall_ms = 0.0
+        self.queries = 0
+        self.db_ms = 0.0
+        self.statements = {}  # отпечаток -> [число, время мс, пример SQL]
+        self.exact = {}  # (sql, params) -> число: одинаковые запросы с одинаковыми параметрами
+        self.external = {}  # имя сервиса -> [число, время мс]
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            self.queries += 1
+            self.db_ms += elapsed
+            key = fingerprint(sql)
+            stat = self.statements.get(key)
+            if stat is None:
+                if len(self.statements) < MAX_QUERIES_KEPT:
+                    self.statements[key] = [1, elapsed, sql]
+            else:
+                stat[0] += 1
+                stat[1] += elapsed
+            if not many and len(self.exact) < MAX_QUERIES_KEPT:
+                try:
+                    exact = (sql, tuple(params or ()))
+                    self.exact[exact] = self.exact.get(exact, 0) + 1
+                except TypeError:
+                    pass  # несравнимые параметры (dict/list) — только по отпечатку
+
+    def add_external(self, name, seconds):
+        stat = self.external.setdefault(name, [0, 0.0])
+        stat[0] += 1
+        stat[1] += seconds * 1000
+
+    def finish(self, status=None):
+        self.wall_ms = (time.perf_counter() - self.started) * 1000
+        self.status = status
+        return self
+
+    def similar_queries(self, threshold=None):
+        # Один отпечаток много раз за запрос — скорее всего запрос в цикле (N+1)
+        threshold = threshold or profiling_setting('PROFILING_N1_THRESHOLD', 5)
+        return sorted(
+            (
+                {'fingerprint': key, 'count': count, 'ms': round(ms, 1), 'sql': sql}
+                for key, (count, ms, sql) in self.statements.items() if count >= threshold
+            ),
+            key=lambda item: -item['count'],
+        )
+
+    def duplicate_queries(self):
+        return sum(count - 1 for count in self.exact.values() if count > 1)
+
+    def external_ms(self):
+        return sum(ms for _, ms in self.external.values())
+
+    def summary(self):
+        return {
+            'method': self.method,
+            'path': self.path,
+            'status': self.status,
+            'at': timezone.now(),
+            'wall_ms': round(self.wall_ms, 1),
+            'queries': self.queries,
+            'db_ms': round(self.db_ms, 1),
+            'duplicates': self.duplicate_queries(),
+            'similar': self.similar_queries(),
+            'external': {name: {'count': count, 'ms': round(ms, 1)} for name, (count, ms) in self.external.items()},
+            'external_ms': round(self.external_ms(), 1),
+        }
+
+
+def record_external(name, seconds):
+    # Вызывается HTTP-клиентами (orders/exchange_client.py): без активного профиля ничего не делает
+    profile = _current.get()
+    if profile is not None:
+        profile.add_external(name, seconds)
+
+
+class SlowestRequests:
+    # Кольцевой буфер N самых медленных запросов процесса (min-heap по времени ответа)
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.heap = []
+        self.counter = itertools.count()
+        self.sampled = 0
+
+    def add(self, summary):
+        size = profiling_setting('PROFILING_BUFFER_SIZE', 50)
+        item = (summary['wall_ms'], next(self.counter), summary)
+        with self.lock:
+            self.sampled += 1
+            if len(self.heap) < size:
+                heapq.heappush(self.heap, item)
+            elif item[0] > self.heap[0][0]:
+                heapq.heapreplace(self.heap, item)
+
+    def snapshot(self):
+        with self.lock:
+            return [summary for _, _, summary in sorted(self.heap, reverse=True)], self.sampled
+
+    def clear(self):
+        with self.lock:
+            self.heap = []
+            self.sampled = 0
+
+
+slowest_requests = SlowestRequests()
+
+
+class ProfilingMiddleware:
+    # Ставить первым в MIDDLEWARE, чтобы время включало остальные middleware
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def should_profile(self, request):
+        if not profiling_setting('PROFILING_ENABLED', False):
+            return False
+        return random.random() < profiling_setting('PROFILING_SAMPLE_RATE', 0.05)
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        profile = RequestProfile(request.method, request.path)
+        token = _current.set(profile)
+        status = None
+        try:
+            with ExitStack() as stack:
+                # Обёртка вешается на объект соединения Django, само подключение к БД не открывается
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile.execute_wrapper))
+                response = self.get_response(request)
+            status = response.status_code
+            # Server-Timing видно во вкладке Network браузера
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={profile.db_ms:.1f};desc="{profile.queries} SQL"',
+                f'ext;dur={profile.external_ms():.1f}',
+                f'app;dur={(time.perf_counter() - profile.started) * 1000:.1f}',
+            ])
+            if getattr(response, 'streaming', False):
+                # Тело потокового ответа (выгрузки) отдаётся уже после выхода из view
+                profile.path += ' (stream)'
+            return response
+        finally:
+            _current.reset(token)
+            slowest_requests.add(profile.finish(status).summary())
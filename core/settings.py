@@ -40,6 +40,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.humanize',
+    'django.contrib.postgres',
     # Сторонние библиотеки
     'rest_framework',
     'rest_framework.authtoken',
@@ -50,6 +51,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.profiling.ProfilingMiddleware',  # первым: меряет всю обработку запроса
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -75,6 +77,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'orders.context_processors.live_events',
             ],
         },
     },
@@ -141,6 +144,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = 'orders.User'
 
 
+# Файлы из MEDIA_ROOT наружу не публикуются: скриншоты отдаёт order_screenshot (orders/media.py)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
@@ -177,3 +181,80 @@ REST_FRAMEWORK = {
     ],
 }
 
+
+# Фоновая синхронизация ордеров (manage.py sync_orders)
+ORDERS_SYNC_INTERVAL = 60   # секунд между синхронизациями одного пользователя
+# Биржи для синхронизации. HTX и MEXC: эндпоинты и поля ответов не сверены с живыми данными —
+# добавлять ('HTX', 'MEXC') только после проверки на реальных ключах
+ORDERS_SYNC_EXCHANGES = ['BYBIT']
+ORDERS_SYNC_JITTER = 15     # случайный разброс, чтобы не синхронизировать всех разом
+ORDERS_SYNC_LEASE = 120     # сколько секунд воркер держит пользователя за собой
+ORDERS_SYNC_PAGE_SIZE = 50          # записей на страницу запроса к бирже
+ORDERS_SYNC_WINDOW_DAYS = 7         # ширина временного окна одного запроса истории
+ORDERS_SYNC_OVERLAP_SECONDS = 300   # перекрытие окон, чтобы не терять ордера на границе
+ORDERS_SYNC_HISTORY_DAYS = 180      # насколько глубоко загружать историю при первой синхронизации
+ORDERS_SYNC_MAX_PAGES = 20          # лимит страниц за один запуск синхронизации пользователя
+ORDERS_SYNC_MAX_WINDOW_PAGES = 200  # предохранитель от бесконечной пагинации одного окна
+
+# Поток ордеров Bybit в реальном времени (manage.py bybit_stream)
+BYBIT_STREAM_URL = "wss://stream.bybit.com/v5/private"
+# P2P-ордеров в этих темах нет (сделки идут по Funding-счёту): событие — лишь повод дозагрузить раньше
+BYBIT_STREAM_TOPICS = ['order', 'execution', 'wallet']  # любое событие -> дозагрузка ордеров по REST
+BYBIT_STREAM_PING = 20             # секунд между ping (Bybit закрывает соединение без них через ~30 с)
+BYBIT_STREAM_STALE = 60            # нет сообщений столько секунд — переподключаемся
+BYBIT_STREAM_HEARTBEAT = 30        # как часто продлевать SyncCursor.stream_until
+BYBIT_STREAM_REFRESH = 60          # как часто перечитывать список пользователей с ключами
+BYBIT_STREAM_SAFETY_INTERVAL = 60  # дозагрузка по REST без событий; не больше ORDERS_SYNC_INTERVAL
+BYBIT_STREAM_RETRY_BASE = 1        # секунд до переподключения, удваивается с каждой попыткой
+BYBIT_STREAM_RETRY_MAX = 300
+BYBIT_STREAM_AUTH_RETRY = 1800     # ключ отклонён — пробуем снова не раньше чем через столько секунд
+
+# Переопределение настроек HTTP-клиентов бирж (см. orders/exchange_client.py),
+# например {'BYBIT': {'base_url': 'http://127.0.0.1:9000', 'key_rate': 2}}
+EXCHANGE_CLIENTS = {}
+
+# Обработка скриншотов (manage.py process_screenshots)
+SCREENSHOT_FORMAT = 'WEBP'        # или 'AVIF', если Pillow собран с его поддержкой
+SCREENSHOT_MAX_SIDE = 1920        # длинная сторона после пережатия, px
+SCREENSHOT_QUALITY = 80
+SCREENSHOT_THUMB_SIDE = 320       # миниатюра для списков ордеров
+SCREENSHOT_THUMB_QUALITY = 70
+
+# Отдача скриншотов (orders/media.py): Django проверяет владельца, файл отдаёт фронтовой сервер.
+# 'nginx' — X-Accel-Redirect на internal-location:
+#     location /protected-media/ { internal; alias /path/to/media/; }
+# 'sendfile' — X-Sendfile (Apache mod_xsendfile, lighttpd). None — отдаёт сам Django (разработка).
+# Каталог media/screenshots/ не должен быть доступен напрямую.
+SCREENSHOT_SENDFILE = None
+SCREENSHOT_ACCEL_PREFIX = '/protected-media/'
+
+# Фискальные чеки через облачную кассу Эвотора (manage.py send_receipts, orders/receipts.py)
+EVOTOR_API_URL = 'https://fiscalization.evotor.ru/possystem/v4'
+EVOTOR_RECEIPT_OPERATIONS = ['SELL']  # для каких ордеров пробивать чек
+EVOTOR_RATE = 10          # запросов в секунду к API всего
+EVOTOR_GROUP_RATE = 5     # ...и на одну группу ККТ
+EVOTOR_POLL_DELAY = 2     # секунд до запроса результата пробития
+EVOTOR_CLIENT = {}        # переопределение параметров HTTP-клиента (timeout, max_retries, ...)
+RECEIPT_MAX_ATTEMPTS = 8  # после стольких ошибок подряд чек помечается FAILED
+RECEIPT_RETRY_BASE = 5    # секунд, удваивается с каждой попыткой
+RECEIPT_RETRY_MAX = 3600
+RECEIPT_LEASE = 120       # сколько секунд воркер держит взятые задачи
+
+# Ключи идемпотентности пакетной записи ордеров (api/orders/batch): сколько дней помнить ответ
+ORDER_WRITE_KEY_TTL_DAYS = 7
+
+# События в реальном времени (/api/events, orders/events.py): нужен ASGI-сервер (core/asgi.py).
+# Под WSGI (runserver, gunicorn) держать поток нельзя — страницы и расширение остаются на опросе
+EVENTS_ENABLED = False          # включить, когда /api/events обслуживает ASGI-сервер
+EVENTS_CHANNEL = 'p2p_events'  # канал PostgreSQL LISTEN/NOTIFY
+EVENTS_HEARTBEAT = 15          # секунд между комментариями-пингами в молчащем потоке
+EVENTS_RETRY_MS = 3000         # пауза переподключения EventSource
+EVENTS_QUEUE_SIZE = 100        # событий в очереди клиента, дальше — одно "resync"
+EVENTS_TOKEN_MAX_AGE = 60      # секунд жизни токена подключения расширения (/api/events/token)
+
+# Профилирование запросов (core/profiling.py): SQL, N+1, время запросов к биржам.
+# Самые медленные запросы — в админке /p2p-admin/profiling/ (в памяти каждого процесса)
+PROFILING_ENABLED = False
+PROFILING_SAMPLE_RATE = 0.05   # доля профилируемых запросов
+PROFILING_BUFFER_SIZE = 50     # сколько самых медленных запросов хранить
+PROFILING_N1_THRESHOLD = 5     # повторов одного запроса, после которых он считается N+1
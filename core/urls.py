@@ -3,8 +3,6 @@ from django.contrib import admin
 from django.urls import path, include
 from django.contrib.auth import views as auth_views
 from django.views.generic import RedirectView
-from django.conf import settings
-from django.conf.urls.static import static
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -20,5 +18,5 @@ urlpatterns = [
     path('', include('orders.urls')),
 ]
 
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+# /media/ напрямую не отдаём ни в каком режиме: в MEDIA_ROOT только скриншоты ордеров,
+# и их отдаёт order_screenshot после проверки владельца (orders/media.py)
\ No newline at end of file
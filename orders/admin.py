@@ -1,9 +1,12 @@
 from django.contrib import admin
 
 from django.contrib import admin
-from .models import User, BankDetail, Order, OrderScreenshot
+from .models import User, BankDetail, Order, OrderScreenshot, SyncState, SyncCursor, DailyTurnover
 
 admin.site.register(User)
 admin.site.register(BankDetail)
 admin.site.register(Order)
-admin.site.register(OrderScreenshot)
\ No newline at end of file
+admin.site.register(OrderScreenshot)
+admin.site.register(SyncState)
+admin.site.register(SyncCursor)
+admin.site.register(DailyTurnover)
\ No newline at end of file
@@ -0,0 +1,57 @@
+# orders/bank_details.py
+# Реквизиты пользователя: upsert по уникальному (user, name) вместо get_or_create
+# и кэш списка реквизитов, привязанный к User.details_version.
+from django.core.cache import cache
+
+from .models import BankDetail
+from .versions import bump_details_version
+
+DETAILS_CACHE_TTL = 3600
+
+
+def details_cache_key(user):
+    # Версия растёт при любом изменении реквизитов, старые ключи просто истекают
+    return f'bank_details:{user.pk}:{user.details_version}'
+
+
+def get_bank_details(user):
+    # [{'id': ..., 'name': ...}] активных реквизитов пользователя
+    key = details_cache_key(user)
+    details = cache.get(key)
+    if details is None:
+        details = [
+            {'id': pk, 'name': name}
+            for pk, name in BankDetail.objects.filter(user=user, is_deleted=False).order_by('name').values_list('id', 'name')
+        ]
+        cache.set(key, details, DETAILS_CACHE_TTL)
+    return details
+
+
+def resolve_bank_detail(user, name):
+    # Реквизит по названию: из кэша, иначе одним INSERT ... ON CONFLICT (user, name) DO UPDATE.
+    # Удалённый (is_deleted) реквизит с тем же названием при этом восстанавливается.
+    name = (name or '').strip()
+    if not name:
+        return None
+
+    for detail in get_bank_details(user):
+        if detail['name'] == name:
+            return BankDetail(pk=detail['id'], user=user, name=name)
+
+    detail, = BankDetail.objects.bulk_create(
+        [BankDetail(user=user, name=name, is_deleted=False)],
+        update_conflicts=True,
+        unique_fields=['user', 'name'],
+        update_fields=['is_deleted'],
+    )
+    # bulk_create не шлёт сигналы — версию поднимаем сами
+    bump_details_version(user.pk)
+    return detail
+
+
+def delete_bank_detail(user, detail_id):
+    # Мягкое удаление: ордера сохраняют ссылку на реквизит, а из списков он пропадает
+    updated = BankDetail.objects.filter(user=user, pk=detail_id, is_deleted=False).update(is_deleted=True)
+    if updated:
+        bump_details_version(user.pk)
+    return bool(updated)
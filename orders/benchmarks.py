@@ -0,0 +1,424 @@
+# orders/benchmarks.py
+# Замеры производительности (manage.py bench): генератор данных, сценарии и сравнение
+# с базовой линией. Сценарий — страница или API, которые ходят в БД (и в биржи — через
+# локальную заглушку FakeExchangeServer). По каждому сценарию считаются p50/p95 времени
+# ответа, число SQL-запросов и пропускная способность; рост относительно базовой линии
+# (JSON) — регрессия.
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from core.profiling import RequestProfile
+from .exchange_client import reset_clients
+from .fake_servers import FakeExchangeServer
+from .importers import OrderImporter
+from .models import Order, OrderScreenshot, RealizedTrade, ReceiptJob, SyncCursor, UnprocessedOrder, User
+from .rollups import rebuild_turnover
+from .search import search_cache_key
+from .services import sync_bybit_orders
+
+BENCH_PREFIX = 'bench_'
+ADMIN_USERNAME = 'bench_admin'
+SYNC_USERNAME = 'bench_sync'
+BENCH_PASSWORD = 'bench'
+
+BANK_NAMES = ['Тинькофф', 'Сбербанк', 'Альфа-Банк', 'ВТБ', 'Райффайзен', 'Газпромбанк', 'Озон Банк']
+# Биржа -> доля ордеров
+EXCHANGE_WEIGHTS = {'Bybit': 6, 'HTX': 3, 'MEXC': 1}
+EXTENSION_TYPES = {'Bybit': 1, 'HTX': 2, 'MEXC': 3}
+ID_BASE = 1_000_000_000_000_000_000
+USERS_BATCH_SIZE = 1000
+
+
+# --- Данные ---
+
+def bench_users():
+    return User.objects.filter(username__startswith=BENCH_PREFIX)
+
+
+def generate_dataset(users=1000, orders_per_user=1000, unprocessed_per_user=20, days=180, seed=42, progress=None):
+    # Ордера пишет тот же OrderImporter, что и импорт CSV (на PostgreSQL — через COPY),
+    # оборот пересобирается одним GROUP BY в конце. P&L считается лениво при первом запросе
+    rng = random.Random(seed)
+    now = timezone.now()
+    password = make_password(BENCH_PASSWORD)
+    exchanges, weights = zip(*EXCHANGE_WEIGHTS.items())
+
+    User.objects.create_superuser(ADMIN_USERNAME, 'bench_admin@example.com', BENCH_PASSWORD)
+    User.objects.create_user(
+        SYNC_USERNAME, 'bench_sync@example.com', BENCH_PASSWORD,
+        bybit_api_key='bench-key', bybit_api_secret='bench-secret',
+    )
+    for offset in range(0, users, USERS_BATCH_SIZE):
+        User.objects.bulk_create([
+            User(username=f'{BENCH_PREFIX}{index:06d}', email=f'{BENCH_PREFIX}{index:06d}@example.com', password=password)
+            for index in range(offset, min(users, offset + USERS_BATCH_SIZE))
+        ])
+
+    created = 0
+    rows = bench_users().exclude(username__in=[ADMIN_USERNAME, SYNC_USERNAME]).order_by('id').values_list('id', flat=True)
+    for number, user_id in enumerate(rows.iterator()):
+        user = User(pk=user_id)
+        banks = rng.sample(BANK_NAMES, rng.randint(1, 4))
+        importer = OrderImporter(user, use_copy=True)
+        orders = []
+        for index in range(orders_per_user):
+            price = Decimal(rng.randint(9000, 10500)) / 100
+            amount = Decimal(rng.randint(1000, 500000)) / 100
+            orders.append({
+                'external_id': str(ID_BASE + number * 10_000_000 + index),
+                'price': price,
+                'amount': amount,
+                'cost': (price * amount).quantize(Decimal('0.01')),
+                'operation_type': rng.choice(('BUY', 'SELL')),
+                'exchange_type': rng.choices(exchanges, weights)[0],
+                'asset': 'USDT',
+                'commission': Decimal(rng.choice(('0', '0', '0.1', '0.2', '0.5'))),
+                'commission_type': 'PERCENT',
+                'created_at': now - timedelta(seconds=rng.randint(0, days * 24 * 60 * 60)),
+                'bank': rng.choice(banks),
+            })
+            if len(orders) >= importer.chunk_size:
+                importer.flush(orders)
+                orders = []
+        importer.flush(orders)
+        created += importer.result['created']
+
+        UnprocessedOrder.objects.bulk_create([
+            UnprocessedOrder(
+                user_id=user_id,
+                order_id=str(ID_BASE + number * 10_000_000 + orders_per_user + index),
+                exchange_type='BYBIT',
+                operation_type=rng.choice(('BUY', 'SELL')),
+                price=Decimal(rng.randint(9000, 10500)) / 100,
+                amount=Decimal(rng.randint(1000, 500000)) / 100,
+                created_at=now - timedelta(seconds=rng.randint(0, 7 * 24 * 60 * 60)),
+            )
+            for index in range(unprocessed_per_user)
+        ])
+        if progress:
+            progress(number + 1, created)
+
+    rebuild_turnover()
+    return created
+
+
+def delete_dataset():
+    # Ордера удаляются одним DELETE на пачку пользователей: через ORM каждый ордер
+    # прошёл бы post_delete (пересчёт оборота и P&L) — на миллионах строк это часы
+    users = bench_users()
+    ids = list(users.values_list('id', flat=True))
+    for offset in range(0, len(ids), USERS_BATCH_SIZE):
+        chunk = ids[offset:offset + USERS_BATCH_SIZE]
+        with transaction.atomic():
+            for model in (RealizedTrade, ReceiptJob):
+                model.objects.filter(user_id__in=chunk).delete()
+            OrderScreenshot.objects.filter(order__user_id__in=chunk).delete()
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"DELETE FROM {Order._meta.db_table} WHERE user_id IN ({', '.join(['%s'] * len(chunk))})", chunk,
+                )
+    return users.delete()[0]
+
+
+# --- Сценарии ---
+
+class Bench:
+    # Общее состояние прогона: случайные (но воспроизводимые по seed) пользователи-субъекты
+    # и HTTP-клиенты под ними
+    def __init__(self, seed=42, subjects=20, latency=0.02, error_rate=0):
+        self.rng = random.Random(seed)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.admin = User.objects.get(username=ADMIN_USERNAME)
+        self.sync_user = User.objects.get(username=SYNC_USERNAME)
+        ids = list(
+            bench_users().exclude(pk__in=[self.admin.pk, self.sync_user.pk])
+            .order_by('id').values_list('id', flat=True)
+        )
+        if not ids:
+            raise ValueError("Нет данных для замеров: сначала manage.py bench --generate")
+        self.users = list(User.objects.filter(pk__in=self.rng.sample(ids, min(subjects, len(ids)))).order_by('id'))
+        # Вход и токены — заранее, чтобы они не попали в замеры
+        self.clients = {}
+        self.client(self.admin)
+        for user in self.users:
+            self.client(user)
+            self.api_client(user)
+
+    def subject(self, i):
+        return self.users[i % len(self.users)]
+
+    def client(self, user):
+        # Сессия для страниц под login_required
+        key = ('session', user.pk)
+        if key not in self.clients:
+            client = Client()
+            client.force_login(user)
+            self.clients[key] = client
+        return self.clients[key]
+
+    def api_client(self, user):
+        # Токен, как у браузерного расширения
+        key = ('token', user.pk)
+        if key not in self.clients:
+            token, _ = Token.objects.get_or_create(user=user)
+            self.clients[key] = Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return self.clients[key]
+
+
+class Scenario:
+    name = None
+    iterations = None  # None — сколько задано в команде
+
+    def setup(self, bench):
+        pass
+
+    def prepare(self, bench, i):
+        # Подготовка итерации, в замер не входит
+        pass
+
+    def run(self, bench, i):
+        # Замеряемая часть; True — успешный ответ
+        raise NotImplementedError
+
+    def teardown(self, bench):
+        pass
+
+
+class MyOrdersList(Scenario):
+    name = 'my_orders_list'
+    FILTERS = [{}, {'exchange': 'Bybit'}, {'operation': 'SELL'}]
+
+    def run(self, bench, i):
+        params = dict(self.FILTERS[i % len(self.FILTERS)])
+        if i % 2:
+            params['date_from'] = (timezone.localdate() - timedelta(days=30)).isoformat()
+        return bench.client(bench.subject(i)).get(reverse('my_orders'), params).status_code == 200
+
+
+class ApiGetTurnover(Scenario):
+    name = 'api_get_turnover'
+    PERIODS = [1, 7, 30, 90]
+
+    def run(self, bench, i):
+        today = timezone.localdate()
+        params = {
+            'start': (today - timedelta(days=self.PERIODS[i % len(self.PERIODS)])).isoformat(),
+            'end': today.isoformat(),
+        }
+        url = reverse('api_get_turnover', args=[bench.subject(i).pk])
+        return bench.client(bench.admin).get(url, params).status_code == 200
+
+
+class ApiSearchUsers(Scenario):
+    name = 'api_search_users'
+
+    def query(self, bench, i):
+        # Чередуем ID, префикс логина и нечёткий поиск
+        user = bench.subject(i)
+        kind = i % 3
+        if kind == 0:
+            return str(user.pk)
+        if kind == 1:
+            return user.username[:len(BENCH_PREFIX) + 4]
+        return user.username[len(BENCH_PREFIX) - 2:]
+
+    def prepare(self, bench, i):
+        # Замеряем сам поиск, а не ответ из кэша
+        cache.delete(search_cache_key(self.query(bench, i)))
+
+    def run(self, bench, i):
+        response = bench.client(bench.admin).get(reverse('api_search_users'), {'q': self.query(bench, i)})
+        return response.status_code == 200
+
+
+class ExtensionScenario(Scenario):
+    sample_size = 50
+
+    def setup(self, bench):
+        # Номера существующих ордеров субъектов: (биржа, external_id)
+        self.orders = {
+            user.pk: list(
+                Order.objects.filter(user=user).exclude(external_id='')
+                .order_by('-created_at').values_list('exchange_type', 'external_id')[:self.sample_size]
+            )
+            for user in bench.users
+        }
+
+
+class ExtensionOrderLookup(ExtensionScenario):
+    name = 'api_order'
+
+    def run(self, bench, i):
+        user = bench.subject(i)
+        orders = self.orders[user.pk]
+        if not orders:
+            return False
+        exchange, external_id = orders[i % len(orders)]
+        params = {'exchangeType': EXTENSION_TYPES[exchange]}
+        if exchange == 'MEXC':
+            url, params['stringOrderId'] = reverse('api_order_by_string_id'), external_id
+        else:
+            url, params['id'] = reverse('api_order'), external_id
+        return bench.api_client(user).get(url, params).status_code == 200
+
+
+class ExtensionStatusBatch(ExtensionScenario):
+    name = 'api_orders_status_batch'
+
+    def run(self, bench, i):
+        user = bench.subject(i)
+        exchange = 'Bybit'
+        ids = [external_id for order_exchange, external_id in self.orders[user.pk] if order_exchange == exchange]
+        response = bench.api_client(user).post(
+            reverse('api_orders_status_batch'),
+            {'exchangeType': EXTENSION_TYPES[exchange], 'ids': ids},
+            content_type='application/json',
+        )
+        return response.status_code == 200
+
+
+class ExtensionDetails(Scenario):
+    name = 'api_details'
+
+    def run(self, bench, i):
+        return bench.api_client(bench.subject(i)).get(reverse('api_details')).status_code == 200
+
+
+class SyncBybitOrders(Scenario):
+    # Первая синхронизация пользователя против заглушки Bybit: окна, страницы, дедупликация
+    name = 'sync_bybit_orders'
+    iterations = 10
+
+    def setup(self, bench):
+        self.server = FakeExchangeServer(latency=bench.latency, error_rate=bench.error_rate, seed=0).start()
+        # Лимиты запросов подняты: замеряем свой код, а не token bucket
+        config = {'base_url': self.server.url, 'rate': 1000, 'burst': 1000, 'key_rate': 1000, 'key_burst': 1000,
+                  'backoff_base': 0.05, 'timeout': 5}
+        self.settings = override_settings(EXCHANGE_CLIENTS={'BYBIT': config})
+        self.settings.enable()
+        reset_clients()
+
+    def prepare(self, bench, i):
+        SyncCursor.objects.filter(user=bench.sync_user).delete()
+        UnprocessedOrder.objects.filter(user=bench.sync_user).delete()
+
+    def run(self, bench, i):
+        return sync_bybit_orders(bench.sync_user)['status'] == 'success'
+
+    def teardown(self, bench):
+        self.settings.disable()
+        reset_clients()
+        self.server.stop()
+
+
+SCENARIOS = {
+    scenario.name: scenario
+    for scenario in (
+        MyOrdersList, ApiGetTurnover, ApiSearchUsers,
+        ExtensionOrderLookup, ExtensionStatusBatch, ExtensionDetails, SyncBybitOrders,
+    )
+}
+
+
+# --- Прогон и сравнение ---
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+def run_scenario(scenario, bench, iterations=50, warmup=5):
+    iterations = scenario.iterations or iterations
+    timings = []
+    queries = []
+    db_times = []
+    errors = 0
+    scenario.setup(bench)
+    try:
+        # Прогрев: кэши, ленивый пересчёт P&L, соединения — хотя бы раз для каждого субъекта
+        warmup = max(warmup, len(bench.users))
+        for i in range(warmup):
+            scenario.prepare(bench, i)
+            scenario.run(bench, i)
+
+        for i in range(warmup, warmup + iterations):
+            scenario.prepare(bench, i)
+            profile = RequestProfile(path=scenario.name)
+            with connection.execute_wrapper(profile.execute_wrapper):
+                started = time.perf_counter()
+                ok = scenario.run(bench, i)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries.append(profile.queries)
+            db_times.append(profile.db_ms)
+            errors += not ok
+    finally:
+        scenario.teardown(bench)
+
+    return {
+        'iterations': iterations,
+        'errors': errors,
+        'p50_ms': round(percentile(timings, 0.50), 2),
+        'p95_ms': round(percentile(timings, 0.95), 2),
+        'max_ms': round(max(timings), 2),
+        'db_p50_ms': round(percentile(db_times, 0.50), 2),
+        # Число запросов детерминировано, поэтому берём худшую итерацию: так виден N+1
+        'queries': max(queries),
+        'throughput_rps': round(len(timings) / (sum(timings) / 1000), 2),
+    }
+
+
+def run_benchmarks(names=None, iterations=50, warmup=5, progress=None, **options):
+    bench = Bench(**options)
+    results = {}
+    # Тестовый клиент ходит с Host: testserver
+    with override_settings(ALLOWED_HOSTS=['testserver']):
+        for name in names or SCENARIOS:
+            results[name] = run_scenario(SCENARIOS[name](), bench, iterations, warmup)
+            if progress:
+                progress(name, results[name])
+    return {
+        'meta': {
+            'created_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'users': bench_users().count(),
+            'orders': Order.objects.filter(user__username__startswith=BENCH_PREFIX).count(),
+            'iterations': iterations,
+        },
+        'scenarios': results,
+    }
+
+
+def compare(results, baseline, tolerance=0.25, slack_ms=2.0):
+    # Регрессия: p95 или среднее время выросли больше чем на tolerance (+ slack_ms на шум
+    # у быстрых сценариев), стало больше SQL-запросов или появились ошибки
+    regressions = []
+    for name, current in results['scenarios'].items():
+        if current['errors']:
+            regressions.append(f"{name}: ошибок {current['errors']} из {current['iterations']}")
+        base = baseline.get('scenarios', {}).get(name)
+        if base is None:
+            continue
+        p95_limit = base['p95_ms'] * (1 + tolerance) + slack_ms
+        if current['p95_ms'] > p95_limit:
+            regressions.append(f"{name}: p95 {current['p95_ms']} мс > {p95_limit:.2f} мс (база {base['p95_ms']})")
+        if current['queries'] > base['queries']:
+            regressions.append(f"{name}: SQL-запросов {current['queries']} > {base['queries']}")
+        min_rps = 1000 / (1000 / base['throughput_rps'] * (1 + tolerance) + slack_ms)
+        if current['throughput_rps'] < min_rps:
+            regressions.append(
+                f"{name}: {current['throughput_rps']} запросов/с < {min_rps:.2f} (база {base['throughput_rps']})"
+            )
+    return regressions
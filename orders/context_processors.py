@@ -0,0 +1,7 @@
+# orders/context_processors.py
+from .events import events_enabled
+
+
+def live_events(request):
+    # base.html подключается к /api/events, только если события включены (EVENTS_ENABLED)
+    return {'live_events_enabled': events_enabled()}
@@ -0,0 +1,210 @@
+# orders/events.py
+# События пользователя для страниц и расширения (SSE, /api/events): новые синхронизированные
+# ордера, сохранение ордера, чек, скриншот. Вместо опроса — рассылка:
+#   * publish() из кода, меняющего данные: на PostgreSQL это NOTIFY в той же транзакции
+#     (уйдёт только после COMMIT и из любого процесса — воркеры, поток Bybit), иначе — после
+#     коммита сразу подписчикам этого процесса;
+#   * в процессе ASGI-сервера одно соединение с БД слушает канал (LISTEN) в отдельном потоке
+#     и раздаёт события очередям открытых подключений. Тысячи ждущих клиентов — это тысячи
+#     HTTP-соединений и одно соединение с БД, без опроса таблиц.
+import asyncio
+import itertools
+import json
+import select
+import threading
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connection, connections, transaction
+
+PAYLOAD_LIMIT = 7000  # NOTIFY принимает до 8000 байт — события маленькие, но страхуемся
+TOKEN_SALT = 'orders.events'
+
+
+def events_setting(name, default):
+    return getattr(settings, name, default)
+
+
+def channel():
+    return events_setting('EVENTS_CHANNEL', 'p2p_events')
+
+
+def events_enabled():
+    # Включается, когда /api/events обслуживает ASGI-сервер (core/asgi.py)
+    return events_setting('EVENTS_ENABLED', False)
+
+
+def can_stream(request):
+    # Бесконечный ответ держим только под ASGI: WSGI-сервер (runserver, gunicorn) собрал бы
+    # его в список и занял поток навсегда — такой клиент пусть остаётся на опросе
+    return events_enabled() and isinstance(request, ASGIRequest)
+
+
+# --- Токен подключения ---
+# EventSource не умеет заголовки, а постоянный токен API в адресе попал бы в логи прокси
+# и историю. Поэтому расширение получает короткоживущую подпись id пользователя
+# (POST /api/events/token) и передаёт её в ?token=. Проверяется только при подключении:
+# живой поток истечение не обрывает, а переподключаться клиент идёт уже с новым токеном
+
+def issue_stream_token(user_id):
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(str(user_id))
+
+
+def stream_token_user_id(token):
+    try:
+        value = signing.TimestampSigner(salt=TOKEN_SALT).unsign(
+            token, max_age=events_setting('EVENTS_TOKEN_MAX_AGE', 60),
+        )
+    except signing.BadSignature:  # в том числе SignatureExpired
+        return None
+    return int(value) if value.isdigit() else None
+
+
+# --- Публикация ---
+
+def publish(user_id, event, **data):
+    message = json.dumps({'user': user_id, 'event': event, 'data': data}, default=str, ensure_ascii=False)
+    if len(message.encode()) > PAYLOAD_LIMIT:
+        message = json.dumps({'user': user_id, 'event': event, 'data': {}})
+    if connection.vendor == 'postgresql':
+        # NOTIFY транзакционный: при откате события не будет, одинаковые в одной транзакции схлопнутся
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [channel(), message])
+    else:
+        transaction.on_commit(lambda: broker.dispatch(message))
+
+
+# --- Раздача подписчикам ---
+
+class EventBroker:
+    # Очереди открытых SSE-подключений процесса по пользователям. dispatch() вызывается из
+    # любого потока (слушатель LISTEN, синхронные view), очереди живут в цикле событий ASGI
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = {}  # user_id -> {очередь: её цикл событий}
+        self.ids = itertools.count(1)
+        self.listener = None
+
+    def subscribe(self, user_id):
+        queue = asyncio.Queue(maxsize=events_setting('EVENTS_QUEUE_SIZE', 100))
+        with self.lock:
+            self.subscribers.setdefault(user_id, {})[queue] = asyncio.get_running_loop()
+            if self.listener is None and connection.vendor == 'postgresql':
+                self.listener = NotifyListener(self)
+                self.listener.start()
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        with self.lock:
+            queues = self.subscribers.get(user_id, {})
+            queues.pop(queue, None)
+            if not queues:
+                self.subscribers.pop(user_id, None)
+
+    def dispatch(self, message):
+        try:
+            payload = json.loads(message)
+        except ValueError:
+            return
+        with self.lock:
+            targets = list(self.subscribers.get(payload.get('user'), {}).items())
+        event = (next(self.ids), payload['event'], payload.get('data') or {})
+        for queue, loop in targets:
+            self.send(loop, queue, event)
+
+    def broadcast(self, event):
+        # Всем подписчикам процесса (например, resync после обрыва LISTEN)
+        with self.lock:
+            targets = [item for queues in self.subscribers.values() for item in queues.items()]
+        for queue, loop in targets:
+            self.send(loop, queue, (next(self.ids), event, {}))
+
+    def send(self, loop, queue, event):
+        try:
+            loop.call_soon_threadsafe(self.put, queue, event)
+        except RuntimeError:
+            pass  # цикл событий уже закрыт (остановка сервера)
+
+    @staticmethod
+    def put(queue, event):
+        # Клиент не успевает читать — вместо накопленного одно "перечитайте всё"
+        if queue.full():
+            while not queue.empty():
+                queue.get_nowait()
+            event = (event[0], 'resync', {})
+        queue.put_nowait(event)
+
+
+class NotifyListener(threading.Thread):
+    # Одно соединение PostgreSQL на процесс: LISTEN и ожидание в select() без опроса
+    def __init__(self, broker):
+        super().__init__(name='events-listener', daemon=True)
+        self.broker = broker
+
+    def connect(self):
+        # Отдельное соединение в autocommit, мимо пула Django: LISTEN должен жить всё время процесса
+        wrapper = connections['default']
+        raw = wrapper.get_new_connection(wrapper.get_connection_params())
+        raw.autocommit = True
+        with raw.cursor() as cursor:
+            cursor.execute(f'LISTEN "{channel()}"')
+        return raw
+
+    def run(self):
+        delay = 1
+        first = True
+        while True:
+            try:
+                raw = self.connect()
+                if not first:
+                    # Пока слушателя не было, события могли потеряться
+                    self.broker.broadcast('resync')
+                first = False
+                delay = 1
+                self.listen(raw)
+            except Exception as e:
+                print(f"⚠️ События: соединение LISTEN потеряно ({e}), переподключение через {delay} с")
+                time.sleep(delay)
+                delay = min(delay * 2, 60)
+
+    def listen(self, raw):
+        try:
+            while True:
+                # Таймаут — только чтобы заметить разрыв соединения, запросов к БД нет
+                if select.select([raw], [], [], 60) == ([], [], []):
+                    continue
+                raw.poll()
+                while raw.notifies:
+                    self.broker.dispatch(raw.notifies.pop(0).payload)
+        finally:
+            raw.close()
+
+
+broker = EventBroker()
+
+
+# --- Поток SSE ---
+
+def format_event(event_id, event, data):
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data, default=str, ensure_ascii=False)}\n\n"
+
+
+async def event_stream(user_id):
+    # Подписка создаётся при первом чтении ответа — уже в цикле событий ASGI-сервера
+    queue = broker.subscribe(user_id)
+    heartbeat = events_setting('EVENTS_HEARTBEAT', 15)
+    try:
+        # retry — пауза переподключения EventSource; hello — повод перечитать данные после него
+        yield f"retry: {events_setting('EVENTS_RETRY_MS', 3000)}\n" + format_event(0, 'hello', {})
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                # Комментарий не даёт прокси закрыть "молчащее" соединение
+                yield ": ping\n\n"
+                continue
+            yield format_event(*event)
+    finally:
+        broker.unsubscribe(user_id, queue)
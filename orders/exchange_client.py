@@ -0,0 +1,262 @@
+# orders/exchange_client.py
+# Общий HTTP-клиент для API бирж: пул keep-alive соединений, лимиты запросов
+# (token bucket на биржу и на API-ключ), повторы с экспоненциальной задержкой,
+# поправка на часы сервера и метрики по задержкам и повторам.
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from core.profiling import record_external
+
+# Статусы, после которых запрос имеет смысл повторить
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+DEFAULT_CLIENTS = {
+    'BYBIT': {
+        'base_url': "https://api.bybit.com",
+        'time_path': "/v5/market/time",
+        'rate': 20, 'burst': 40,          # на биржу целиком (наш IP)
+        'key_rate': 5, 'key_burst': 10,   # на один API-ключ
+    },
+    'HTX': {
+        'base_url': "https://api.huobi.pro",
+        'time_path': "/v1/common/timestamp",
+        'rate': 10, 'burst': 20,
+        'key_rate': 5, 'key_burst': 10,
+    },
+    'MEXC': {
+        'base_url': "https://api.mexc.com",
+        'time_path': "/api/v3/time",
+        'rate': 10, 'burst': 20,
+        'key_rate': 5, 'key_burst': 10,
+    },
+}
+
+
+class ExchangeError(Exception):
+    pass
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        # Блокирует поток, пока не появится токен
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class ClientMetrics:
+    def __init__(self, sample_size=1000):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.latencies = deque(maxlen=sample_size)
+
+    def record(self, latency, retries, failed):
+        with self.lock:
+            self.requests += 1
+            self.retries += retries
+            self.errors += int(failed)
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            self.latencies.append(latency)
+
+    def snapshot(self):
+        with self.lock:
+            samples = sorted(self.latencies)
+            count, retries, errors = self.requests, self.retries, self.errors
+            total_latency, max_latency = self.total_latency, self.max_latency
+
+        def percentile(p):
+            if not samples:
+                return 0.0
+            return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+        return {
+            'requests': count,
+            'retries': retries,
+            'errors': errors,
+            'avg_latency_ms': round(total_latency / count * 1000, 1) if count else 0.0,
+            'p50_latency_ms': round(percentile(0.50) * 1000, 1),
+            'p95_latency_ms': round(percentile(0.95) * 1000, 1),
+            'max_latency_ms': round(max_latency * 1000, 1),
+        }
+
+
+class ExchangeClient:
+    def __init__(self, name, base_url, rate=20, burst=40, key_rate=5, key_burst=10,
+                 time_path=None, timeout=15, max_retries=4, backoff_base=0.5, backoff_max=8,
+                 clock_ttl=300, pool_size=20):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.time_path = time_path
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.clock_ttl = clock_ttl
+
+        # Одна сессия на биржу: TCP+TLS рукопожатие делается один раз на соединение пула
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers['User-Agent'] = (
+            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+            '(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+        )
+
+        self.bucket = TokenBucket(rate, burst)
+        self.key_rate = key_rate
+        self.key_burst = key_burst
+        self.key_buckets = {}
+        self.lock = threading.Lock()
+
+        self.clock_offset_ms = 0
+        self.clock_synced_at = None
+        self.metrics = ClientMetrics()
+
+    def key_bucket(self, api_key):
+        with self.lock:
+            bucket = self.key_buckets.get(api_key)
+            if bucket is None:
+                bucket = self.key_buckets[api_key] = TokenBucket(self.key_rate, self.key_burst)
+            return bucket
+
+    # --- Часы сервера ---
+
+    def now_ms(self):
+        # Локальное время с поправкой на часы биржи (для подписи запросов)
+        if self.time_path and (self.clock_synced_at is None or time.monotonic() - self.clock_synced_at > self.clock_ttl):
+            self.sync_clock()
+        return int(time.time() * 1000) + self.clock_offset_ms
+
+    def invalidate_clock(self):
+        self.clock_synced_at = None
+
+    def sync_clock(self):
+        try:
+            started = time.time()
+            response = self.session.get(self.base_url + self.time_path, timeout=self.timeout)
+            finished = time.time()
+            server_ms = self.parse_server_time(response.json())
+        except Exception as e:
+            print(f"⚠️ {self.name}: не удалось получить время сервера: {e}")
+            # Не долбим эндпоинт времени на каждом запросе, попробуем позже
+            self.clock_synced_at = time.monotonic()
+            return
+
+        # Считаем, что сервер ответил в середине пути запроса
+        local_ms = (started + finished) / 2 * 1000
+        self.clock_offset_ms = int(server_ms - local_ms)
+        self.clock_synced_at = time.monotonic()
+
+    def parse_server_time(self, data):
+        # Bybit: result.timeNano/timeSecond, HTX: data (мс), MEXC: serverTime (мс)
+        result = data.get('result') or {}
+        if result.get('timeNano'):
+            return int(result['timeNano']) / 1_000_000
+        if result.get('timeSecond'):
+            return int(result['timeSecond']) * 1000
+        if data.get('serverTime'):
+            return int(data['serverTime'])
+        if isinstance(data.get('data'), int):
+            return data['data']
+        return int(data['time'])
+
+    # --- Запросы ---
+
+    def backoff(self, attempt, response=None):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.backoff_max)
+        # Экспоненциальная задержка с полным джиттером
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def request(self, method, path, prepare=None, api_key=None):
+        # prepare() вызывается на каждой попытке заново: подпись зависит от времени запроса
+        # и должна вернуть kwargs для requests (params, headers, data, json)
+        started = time.monotonic()
+        retries = 0
+        failed = True
+        try:
+            while True:
+                self.bucket.acquire()
+                if api_key:
+                    self.key_bucket(api_key).acquire()
+
+                kwargs = prepare() if prepare else {}
+                response = None
+                sent = time.monotonic()
+                try:
+                    response = self.session.request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    if retries >= self.max_retries:
+                        print(f"❌ {self.name}: ошибка соединения: {e}")
+                        raise ExchangeError(f"Не удалось связаться с {self.name}")
+                finally:
+                    # Время запросов к биржам — в профиль текущего HTTP-запроса (core/profiling.py)
+                    record_external(self.name, time.monotonic() - sent)
+                if response is not None:
+                    if response.status_code not in RETRY_STATUSES or retries >= self.max_retries:
+                        failed = response.status_code >= 400
+                        return response
+
+                print(f"🔁 {self.name}: повтор {retries + 1} для {path}")
+                time.sleep(self.backoff(retries, response))
+                retries += 1
+        finally:
+            self.metrics.record(time.monotonic() - started, retries, failed)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(name):
+    # Клиенты живут всё время процесса, чтобы переиспользовать соединения и лимиты
+    with _clients_lock:
+        client = _clients.get(name)
+        if client is None:
+            config = dict(DEFAULT_CLIENTS.get(name, {}))
+            config.update(getattr(settings, 'EXCHANGE_CLIENTS', {}).get(name, {}))
+            client = _clients[name] = ExchangeClient(name, **config)
+        return client
+
+
+def reset_clients():
+    # Забыть созданные клиенты: следующий get_client() прочитает EXCHANGE_CLIENTS заново
+    # (замеры с заглушкой бирж, orders/benchmarks.py)
+    with _clients_lock:
+        _clients.clear()
+
+
+def get_metrics():
+    with _clients_lock:
+        clients = list(_clients.values())
+    return {client.name: client.metrics.snapshot() for client in clients}
@@ -0,0 +1,214 @@
+# orders/exports.py
+# Выгрузка ордеров и дневного оборота в CSV/XLSX для бухгалтерии.
+# Строки читаются серверным курсором (iterator) и сразу уходят клиенту через
+# StreamingHttpResponse: память не зависит от числа строк, первый байт — сразу.
+import csv
+import io
+import zipfile
+from xml.sax.saxutils import escape
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .models import DailyTurnover, Order
+
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_FORMATS = ('csv', 'xlsx')
+
+# (заголовок, поле values_list) — порядок колонок в файле
+ORDER_COLUMNS = [
+    ('ID', 'id'),
+    ('Пользователь', 'user__username'),
+    ('Номер ордера', 'external_id'),
+    ('Дата', 'created_at'),
+    ('Биржа', 'exchange_type'),
+    ('Тип', 'operation_type'),
+    ('Курс', 'price'),
+    ('Кол-во', 'amount'),
+    ('Сумма', 'cost'),
+    ('Комиссия', 'commission'),
+    ('Тип комиссии', 'commission_type'),
+    ('Комиссия ₽', 'commission_rub'),
+    ('Итого с комиссией', 'net_cost'),
+    ('Реквизиты', 'bank_detail__name'),
+]
+
+TURNOVER_COLUMNS = [
+    ('День', 'day'),
+    ('Пользователь', 'user__username'),
+    ('Биржа', 'exchange_type'),
+    ('Тип', 'operation_type'),
+    ('Реквизиты', 'bank_detail__name'),
+    ('Кол-во', 'amount_sum'),
+    ('Сумма', 'cost_sum'),
+    ('Комиссия ₽', 'commission_sum'),
+    ('Ордеров', 'orders_count'),
+]
+
+
+def export_orders(start, end, user_id=None, operation_type=None):
+    # Те же фильтры, что на странице оборота: [start, end) по created_at, пользователь, сторона
+    orders = Order.objects.filter(created_at__gte=start, created_at__lt=end)
+    if user_id:
+        orders = orders.filter(user_id=user_id)
+    if operation_type:
+        orders = orders.filter(operation_type=operation_type)
+    return ORDER_COLUMNS, orders.order_by('created_at', 'id')
+
+
+def export_turnover(start, end, user_id=None, operation_type=None):
+    rows = DailyTurnover.objects.filter(day__gte=start.date(), day__lt=end.date())
+    if user_id:
+        rows = rows.filter(user_id=user_id)
+    if operation_type:
+        rows = rows.filter(operation_type=operation_type)
+    return TURNOVER_COLUMNS, rows.order_by('day', 'user_id', 'exchange_type', 'operation_type', 'bank_detail_id')
+
+
+def iter_rows(columns, queryset):
+    # Только нужные колонки кортежами, без моделей; на PostgreSQL iterator() — серверный курсор
+    fields = [field for _, field in columns]
+    tz = timezone.get_current_timezone()
+    for row in queryset.values_list(*fields).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield [
+            value.astimezone(tz).strftime('%Y-%m-%d %H:%M:%S') if hasattr(value, 'astimezone') else value
+            for value in row
+        ]
+
+
+# --- CSV ---
+
+def stream_csv(columns, rows):
+    # BOM и ";" — чтобы Excel с русской локалью открыл файл без мастера импорта.
+    # Заголовок уходит сразу, дальше — пачками по EXPORT_CHUNK_SIZE строк, а не по одной
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';')
+    writer.writerow([title for title, _ in columns])
+    yield '\ufeff' + buffer.getvalue()
+
+    count = 0
+    buffer.seek(0)
+    buffer.truncate()
+    for row in rows:
+        writer.writerow(['' if value is None else value for value in row])
+        count += 1
+        if count % EXPORT_CHUNK_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+# --- XLSX ---
+# Минимальная книга из одного листа. Строки пишутся inline-строками (без sharedStrings),
+# а zip собирается "на лету": zipfile умеет писать в поток без seek (data descriptor).
+
+XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+XLSX_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+XLSX_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+XLSX_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+XLSX_SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+XLSX_SHEET_END = '</sheetData></worksheet>'
+
+
+class StreamBuffer:
+    # Файл только на запись без tell(): zipfile переходит в потоковый режим,
+    # а накопленные байты генератор забирает после каждой пачки строк
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def xlsx_cell(value):
+    if value is None or value == '':
+        return '<c/>'
+    if isinstance(value, (int, float)) or hasattr(value, 'is_finite'):  # числа и Decimal
+        return f'<c><v>{value}</v></c>'
+    return f'<c t="inlineStr"><is><t>{escape(str(value))}</t></is></c>'
+
+
+def xlsx_row(values):
+    return '<row>' + ''.join(xlsx_cell(value) for value in values) + '</row>'
+
+
+def stream_xlsx(columns, rows, sheet_name='Export'):
+    buffer = StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as book:
+        book.writestr('[Content_Types].xml', XLSX_CONTENT_TYPES)
+        book.writestr('_rels/.rels', XLSX_ROOT_RELS)
+        book.writestr('xl/workbook.xml', XLSX_WORKBOOK.format(name=escape(sheet_name)))
+        book.writestr('xl/_rels/workbook.xml.rels', XLSX_WORKBOOK_RELS)
+        yield buffer.take()
+
+        # force_zip64: размер листа заранее неизвестен и может превысить 4 ГБ
+        with book.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            lines = [XLSX_SHEET_START, xlsx_row([title for title, _ in columns])]
+            for row in rows:
+                lines.append(xlsx_row(row))
+                if len(lines) >= EXPORT_CHUNK_SIZE:
+                    sheet.write(''.join(lines).encode())
+                    lines = []
+                    yield buffer.take()
+            lines.append(XLSX_SHEET_END)
+            sheet.write(''.join(lines).encode())
+    yield buffer.take()
+
+
+def export_response(columns, queryset, fmt, filename):
+    rows = iter_rows(columns, queryset)
+    if fmt == 'xlsx':
+        response = StreamingHttpResponse(
+            stream_xlsx(columns, rows),
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        )
+    else:
+        fmt = 'csv'
+        response = StreamingHttpResponse(stream_csv(columns, rows), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    # Не даём прокси (nginx) буферизовать ответ целиком — иначе теряется смысл потоковой отдачи
+    response['X-Accel-Buffering'] = 'no'
+    return response
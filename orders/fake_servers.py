@@ -0,0 +1,305 @@
+# orders/fake_servers.py
+# Локальные HTTP-заглушки внешних API для тестов и замеров: поднимаются в отдельном
+# потоке на 127.0.0.1 со свободным портом, запоминают запросы и умеют отвечать ошибками.
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass  # не шумим в выводе тестов
+
+    def do_GET(self):
+        self.server.fake.dispatch(self, 'GET')
+
+    def do_POST(self):
+        self.server.fake.dispatch(self, 'POST')
+
+
+class FakeServer:
+    # Маршруты: [(метод, регулярное выражение пути, обработчик(request) -> (статус, тело))]
+    routes = []
+
+    def __init__(self, latency=0, jitter=0, error_rate=0, error_statuses=(429, 503), seed=None):
+        self.lock = threading.Lock()
+        self.requests = []
+        self.failures = []  # статусы, которыми ответить на ближайшие запросы
+        self.latency = latency  # секунд на ответ (+ случайно до jitter)
+        self.jitter = jitter
+        self.error_rate = error_rate  # доля случайных ответов с ошибкой из error_statuses
+        self.error_statuses = error_statuses
+        self.random = random.Random(seed)
+        self.httpd = None
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), FakeHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.fake = self
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset(self):
+        with self.lock:
+            self.requests.clear()
+            self.failures.clear()
+
+    def fail_next(self, *statuses):
+        with self.lock:
+            self.failures.extend(statuses)
+
+    def dispatch(self, handler, method):
+        parsed = urlparse(handler.path)
+        length = int(handler.headers.get('Content-Length') or 0)
+        body = handler.rfile.read(length) if length else b''
+        request = {
+            'method': method,
+            'path': parsed.path,
+            'query': {key: values[-1] for key, values in parse_qs(parsed.query).items()},
+            'headers': dict(handler.headers),
+            'json': json.loads(body) if body else None,
+        }
+        with self.lock:
+            self.requests.append(request)
+            failure = self.failures.pop(0) if self.failures else None
+            if failure is None and self.error_rate and self.random.random() < self.error_rate:
+                failure = self.random.choice(self.error_statuses)
+            delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            time.sleep(delay)  # вне блокировки: медленные ответы идут параллельно
+
+        if failure is not None:
+            status, payload = failure, {'error': {'code': failure, 'text': 'Fake failure', 'type': 'system'}}
+        else:
+            status, payload = 404, {'error': {'code': 404, 'text': 'Not found', 'type': 'system'}}
+            for route_method, pattern, name in self.routes:
+                match = re.fullmatch(pattern, parsed.path)
+                if route_method == method and match:
+                    with self.lock:
+                        status, payload = getattr(self, name)(request, *match.groups())
+                    break
+
+        data = json.dumps(payload).encode()
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def requests_to(self, pattern):
+        with self.lock:
+            return [request for request in self.requests if re.fullmatch(pattern, request['path'])]
+
+
+class FakeEvotorServer(FakeServer):
+    # Облачная касса в формате API Эвотора (v4): getToken, регистрация документа
+    # и отчёт о его обработке. Документ с тем же external_id повторно не регистрируется
+    routes = [
+        ('POST', r'/getToken', 'get_token'),
+        ('POST', r'/([^/]+)/(sell|sell_refund|buy|buy_refund)', 'register'),
+        ('GET', r'/([^/]+)/report/([^/]+)', 'report'),
+    ]
+
+    def __init__(self, login='login', password='password', polls_until_done=0, **options):
+        super().__init__(**options)
+        self.login = login
+        self.password = password
+        self.polls_until_done = polls_until_done
+        self.tokens = set()
+        self.documents = {}  # uuid -> документ
+        self.by_external_id = {}
+        self.reject = {}  # external_id -> ошибка валидации
+
+    def reset(self):
+        super().reset()
+        with self.lock:
+            self.tokens.clear()
+            self.documents.clear()
+            self.by_external_id.clear()
+            self.reject.clear()
+
+    def expire_tokens(self):
+        with self.lock:
+            self.tokens.clear()
+
+    def get_token(self, request):
+        data = request['json'] or {}
+        if data.get('login') != self.login or data.get('pass') != self.password:
+            return 200, {'token': None, 'error': {'code': 12, 'text': 'Неверный логин или пароль', 'type': 'system'}}
+        token = uuid.uuid4().hex
+        self.tokens.add(token)
+        return 200, {'token': token, 'error': None}
+
+    def register(self, request, group_code, operation):
+        if request['headers'].get('Token') not in self.tokens:
+            return 401, {'error': {'code': 11, 'text': 'Токен не действителен', 'type': 'system'}}
+        data = request['json'] or {}
+        external_id = data.get('external_id')
+        if external_id in self.reject:
+            return 400, {'error': {'code': 32, 'text': self.reject[external_id], 'type': 'system'}}
+        key = (group_code, external_id)
+        if key in self.by_external_id:
+            # Повтор того же документа: возвращаем уже выданный uuid
+            document = self.documents[self.by_external_id[key]]
+            return 200, {
+                'uuid': document['uuid'], 'status': 'wait',
+                'error': {'code': 10, 'text': 'Документ уже существует', 'type': 'system'},
+            }
+        document = {
+            'uuid': uuid.uuid4().hex,
+            'group_code': group_code,
+            'operation': operation,
+            'external_id': external_id,
+            'receipt': data.get('receipt'),
+            'polls': 0,
+            'number': len(self.documents) + 1,
+        }
+        self.documents[document['uuid']] = document
+        self.by_external_id[key] = document['uuid']
+        return 200, {'uuid': document['uuid'], 'status': 'wait', 'error': None}
+
+    def report(self, request, group_code, document_uuid):
+        if request['headers'].get('Token') not in self.tokens:
+            return 401, {'error': {'code': 11, 'text': 'Токен не действителен', 'type': 'system'}}
+        document = self.documents.get(document_uuid)
+        if document is None or document['group_code'] != group_code:
+            return 404, {'error': {'code': 34, 'text': 'Документ не найден', 'type': 'system'}}
+        document['polls'] += 1
+        if document['polls'] <= self.polls_until_done:
+            return 200, {'uuid': document_uuid, 'status': 'wait', 'error': None, 'payload': None}
+        total = (document['receipt'] or {}).get('total')
+        return 200, {
+            'uuid': document_uuid,
+            'status': 'done',
+            'error': None,
+            'payload': {
+                'total': total,
+                'fiscal_receipt_number': document['number'],
+                'fiscal_document_number': 1000 + document['number'],
+                'fiscal_document_attribute': 3000000000 + document['number'],
+                'fn_number': '9999078900000001',
+                'receipt_datetime': '01.01.2026 12:00:00',
+            },
+        }
+
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+
+class FakeExchangeServer(FakeServer):
+    # История P2P-ордеров Bybit, HTX и MEXC в форматах, которые разбирают коннекторы
+    # orders/services.py, плюс эндпоинты времени. Ордера не хранятся: ордер k создан
+    # в момент k * interval, поэтому любое окно и любая страница считаются на лету.
+    # Подписи не проверяются
+    routes = [
+        ('GET', r'/v5/market/time', 'bybit_time'),
+        ('GET', r'/v1/common/timestamp', 'htx_time'),
+        ('GET', r'/api/v3/time', 'mexc_time'),
+        ('GET', r'/v5/fiat/order-record', 'bybit_orders'),
+        ('GET', r'/v1/otc/order/list', 'htx_orders'),
+        ('GET', r'/api/v3/c2c/order/list', 'mexc_orders'),
+    ]
+
+    # Разные диапазоны номеров, чтобы ордера бирж не совпадали
+    ID_BASES = {'BYBIT': 1800000000000000000, 'HTX': 2800000000000000000, 'MEXC': 3800000000000000000}
+
+    def __init__(self, orders_per_day=48, **options):
+        super().__init__(**options)
+        self.interval_ms = max(1, DAY_MS // orders_per_day)
+
+    def now_ms(self):
+        return int(time.time() * 1000)
+
+    def window(self, exchange, request, offset, limit):
+        # Ордера окна [startTime, endTime] от новых к старым: (страница, есть ли ещё)
+        start_ms = int(request['query'].get('startTime') or 0)
+        end_ms = int(request['query'].get('endTime') or self.now_ms())
+        first = -(-start_ms // self.interval_ms)
+        last = end_ms // self.interval_ms
+        items = []
+        for k in range(last - offset, max(first - 1, last - offset - limit), -1):
+            items.append({
+                'id': str(self.ID_BASES[exchange] + k),
+                'side': 'BUY' if k % 2 else 'SELL',
+                'amount': str(10 + k % 90),
+                'price': f'{90 + k % 1000 / 100:.2f}',
+                'time': k * self.interval_ms,
+            })
+        return items, last - offset - len(items) >= first
+
+    def bybit_time(self, request):
+        now = self.now_ms()
+        return 200, {'retCode': 0, 'result': {'timeSecond': str(now // 1000), 'timeNano': str(now * 1_000_000)}}
+
+    def htx_time(self, request):
+        return 200, {'status': 'ok', 'data': self.now_ms()}
+
+    def mexc_time(self, request):
+        return 200, {'serverTime': self.now_ms()}
+
+    def bybit_orders(self, request):
+        limit = int(request['query'].get('limit') or 50)
+        offset = int(request['query'].get('cursor') or 0)
+        items, more = self.window('BYBIT', request, offset, limit)
+        return 200, {
+            'retCode': 0,
+            'retMsg': 'OK',
+            'result': {
+                'list': [
+                    {'orderId': item['id'], 'side': item['side'], 'amount': item['amount'],
+                     'price': item['price'], 'createTime': str(item['time'])}
+                    for item in items
+                ],
+                'nextPageCursor': str(offset + limit) if more else '',
+            },
+        }
+
+    def htx_orders(self, request):
+        size = int(request['query'].get('size') or 50)
+        page = int(request['query'].get('page') or 1)
+        items, _ = self.window('HTX', request, (page - 1) * size, size)
+        return 200, {
+            'code': 200,
+            'data': [
+                {'orderNo': item['id'], 'side': item['side'], 'quantity': item['amount'],
+                 'price': item['price'], 'gmtCreate': item['time']}
+                for item in items
+            ],
+        }
+
+    def mexc_orders(self, request):
+        limit = int(request['query'].get('limit') or 50)
+        page = int(request['query'].get('page') or 1)
+        items, _ = self.window('MEXC', request, (page - 1) * limit, limit)
+        return 200, {
+            'code': 0,
+            'data': [
+                {'orderId': item['id'], 'side': item['side'], 'quantity': item['amount'],
+                 'price': item['price'], 'createTime': item['time']}
+                for item in items
+            ],
+        }
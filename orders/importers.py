@@ -0,0 +1,397 @@
+# orders/importers.py
+# Массовый импорт ордеров из CSV (выгрузки Bybit/HTX/MEXC или общий формат):
+# файл читается построчно, ордера пишутся пачками через bulk_create или COPY (PostgreSQL),
+# дубли по номеру ордера пропускаются, оборот пересобирается один раз в конце.
+import csv
+import io
+import re
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import BankDetail, Order
+from .rollups import order_day
+from .services import ORDER_EXCHANGE_NAMES
+from .signals import orders_bulk_changed
+from .versions import bump_details_version
+
+IMPORT_CHUNK_SIZE = 5000
+MAX_REPORTED_ERRORS = 100
+
+# Поле ордера -> возможные заголовки колонки (без учёта регистра)
+GENERIC_COLUMNS = {
+    'external_id': ['external_id', 'order_id', 'order no.', 'номер ордера'],
+    'operation_type': ['operation_type', 'type', 'side', 'тип'],
+    'price': ['price', 'курс'],
+    'amount': ['amount', 'quantity', 'кол-во'],
+    'cost': ['cost', 'total', 'стоимость'],
+    'exchange_type': ['exchange_type', 'exchange', 'биржа'],
+    'asset': ['asset', 'coin', 'token', 'актив'],
+    'bank': ['bank', 'details', 'реквизиты', 'банк'],
+    'commission': ['commission', 'комиссия'],
+    'commission_type': ['commission_type', 'тип комиссии'],
+    'created_at': ['created_at', 'date', 'time', 'дата'],
+    'status': ['status', 'статус'],
+}
+
+IMPORT_FORMATS = {
+    'generic': {'exchange': None, 'columns': GENERIC_COLUMNS},
+    'bybit': {
+        'exchange': 'Bybit',
+        'columns': {
+            'external_id': ['order no.', 'order id', 'order no'],
+            'operation_type': ['type', 'side'],
+            'price': ['price'],
+            'amount': ['coin amount', 'quantity'],
+            'cost': ['fiat amount', 'total amount'],
+            'asset': ['cryptocurrency', 'coin'],
+            'bank': ['payment method'],
+            'created_at': ['time', 'create time', 'created time'],
+            'status': ['status'],
+        },
+    },
+    'htx': {
+        'exchange': 'HTX',
+        'columns': {
+            'external_id': ['order id', 'order no', 'order no.'],
+            'operation_type': ['type', 'direction', 'side'],
+            'price': ['price', 'unit price'],
+            'amount': ['amount', 'quantity'],
+            'cost': ['total', 'total amount'],
+            'bank': ['payment method'],
+            'created_at': ['time', 'order time', 'create time'],
+            'status': ['status'],
+        },
+    },
+    'mexc': {
+        'exchange': 'MEXC',
+        'columns': {
+            'external_id': ['order id', 'order no.', 'order no'],
+            'operation_type': ['side', 'type'],
+            'price': ['unit price', 'price'],
+            'amount': ['quantity', 'amount'],
+            'cost': ['total amount', 'total'],
+            'bank': ['payment method'],
+            'created_at': ['create time', 'time'],
+            'status': ['status'],
+        },
+    },
+}
+
+OPERATION_TYPES = {
+    'buy': 'BUY', 'покупка': 'BUY', 'купить': 'BUY',
+    'sell': 'SELL', 'продажа': 'SELL', 'продать': 'SELL',
+}
+
+# Отменённые и спорные ордера из выгрузок бирж не импортируем
+SKIP_STATUSES = {'cancelled', 'canceled', 'отменен', 'отменён', 'appeal', 'апелляция'}
+
+DATE_FORMATS = ['%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%d.%m.%Y %H:%M:%S', '%d.%m.%Y %H:%M', '%d.%m.%Y', '%Y-%m-%d']
+
+# Число целиком, с необязательной валютой/активом перед ним или после ("1 500 ₽", "$12", "100 USDT", "0.5%").
+# Всё прочее ("abc 12 xyz", "1-2") — ошибка строки, а не первое попавшееся число
+UNITS = r'[₽$€]|rub|rur|usd|eur|usdt|usdc|btc|eth|руб\.?|р\.?'
+AMOUNT_RE = re.compile(rf'(?:{UNITS})?([-+]?[\d.,]+)(?:{UNITS}|%)?', re.IGNORECASE)
+NUMBER_RE = re.compile(r'[-+]?\d+(?:\.\d+)?')
+
+# Колонки orders_order для COPY (остальные — значения по умолчанию)
+COPY_COLUMNS = [
+    'user_id', 'external_id', 'price', 'amount', 'cost', 'operation_type', 'exchange_type', 'asset',
+    'bank_detail_id', 'commission', 'commission_type', 'screenshot_thumbnail', 'receipt_status', 'created_at', 'version',
+]
+
+
+def normalize_number(raw):
+    # Разделители по их числу: "1,234.56" и "1.234,56" — последний из двух разный десятичный;
+    # "1,234,567" и "1.234.567" — повторяющийся только разряды; один — десятичный ("1234,56").
+    # Группы разрядов проверяются: первая 1–3 цифры, остальные ровно по 3 ("12,34,567" — ошибка)
+    sign, digits = (raw[0], raw[1:]) if raw[:1] in ('-', '+') else ('', raw)
+    separators = [char for char in ',.' if char in digits]
+    if len(separators) == 2:
+        point = max(separators, key=digits.rfind)
+        grouping = ',' if point == '.' else '.'
+    elif separators and digits.count(separators[0]) > 1:
+        point, grouping = None, separators[0]
+    else:
+        point, grouping = (separators[0] if separators else None), None
+
+    whole, _, fraction = digits.partition(point) if point else (digits, '', '')
+    groups = whole.split(grouping) if grouping else [whole]
+    if len(groups) > 1 and not (1 <= len(groups[0]) <= 3 and all(len(group) == 3 for group in groups[1:])):
+        return None
+    number = sign + ''.join(groups) + (f'.{fraction}' if point else '')
+    return number if NUMBER_RE.fullmatch(number) else None
+
+
+def parse_decimal(value, field, allow_zero=False):
+    # Суммы, цены и количества должны быть больше нуля (комиссия — не меньше: allow_zero).
+    # Пробелы-разделители разрядов: обычный, неразрывный и узкий неразрывный
+    match = AMOUNT_RE.fullmatch(re.sub(r'[\s\xa0\u202f]', '', value or ''))
+    raw = normalize_number(match.group(1)) if match else None
+    if raw is None:
+        raise ValueError(f"{field}: не число ({value!r})")
+    try:
+        number = Decimal(raw)
+    except InvalidOperation:
+        raise ValueError(f"{field}: не число ({value!r})")
+    if number < 0 or (number == 0 and not allow_zero):
+        raise ValueError(f"{field}: должно быть {'не меньше' if allow_zero else 'больше'} нуля ({value!r})")
+    return number
+
+
+def parse_datetime(value, tz):
+    raw = (value or '').strip()
+    if not raw:
+        return timezone.now()
+    if raw.isdigit():
+        # Unix-время в секундах или миллисекундах
+        stamp = int(raw)
+        return datetime.fromtimestamp(stamp / 1000 if stamp > 10 ** 11 else stamp, tz=tz)
+    for parser in [datetime.fromisoformat] + [lambda s, f=f: datetime.strptime(s, f) for f in DATE_FORMATS]:
+        try:
+            parsed = parser(raw)
+        except ValueError:
+            continue
+        # Часовой пояс берём один раз на импорт: make_aware на каждой строке заметно дороже
+        return parsed.replace(tzinfo=tz) if parsed.tzinfo is None else parsed
+    raise ValueError(f"created_at: непонятная дата ({value!r})")
+
+
+class OrderImporter:
+    def __init__(self, user, fmt='generic', exchange=None, use_copy=False, chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+        if fmt not in IMPORT_FORMATS:
+            raise ValueError(f"Неизвестный формат: {fmt}")
+        self.user = user
+        self.format = IMPORT_FORMATS[fmt]
+        self.exchange = exchange or self.format['exchange'] or 'Bybit'
+        self.use_copy = use_copy and connection.vendor == 'postgresql'
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.tz = timezone.get_current_timezone()
+
+        self.banks = {}  # название -> id, живёт весь импорт
+        self.banks_created = False
+        self.first_day = None
+        self.last_day = None
+        self.result = {'rows': 0, 'created': 0, 'duplicates': 0, 'skipped': 0, 'errors': []}
+
+    # --- Разбор ---
+
+    def resolve_columns(self, header):
+        positions = {name.strip().lower(): index for index, name in enumerate(header)}
+        mapping = {}
+        for field, aliases in self.format['columns'].items():
+            for alias in aliases:
+                if alias in positions:
+                    mapping[field] = positions[alias]
+                    break
+        missing = {'operation_type', 'amount'} - set(mapping)
+        if missing or not ({'price', 'cost'} & set(mapping)):
+            raise ValueError(f"В файле нет нужных колонок: {', '.join(sorted(missing)) or 'price/cost'}")
+        return mapping
+
+    def parse_row(self, row, mapping):
+        # Ячейки строки разбираем один раз; отсутствующие колонки — пустые строки
+        size = len(row)
+        cells = {field: row[index].strip() for field, index in mapping.items() if index < size}
+        get = lambda field: cells.get(field, '')
+
+        if get('status').lower() in SKIP_STATUSES:
+            return None
+
+        operation_type = OPERATION_TYPES.get(get('operation_type').lower())
+        if operation_type is None:
+            raise ValueError(f"operation_type: ожидается BUY/SELL ({get('operation_type')!r})")
+
+        amount = parse_decimal(get('amount'), 'amount')
+        price = parse_decimal(get('price'), 'price') if get('price') else None
+        cost = parse_decimal(get('cost'), 'cost') if get('cost') else None
+        if cost is None:
+            cost = (price * amount).quantize(Decimal('0.01'))
+        if price is None:
+            price = (cost / amount).quantize(Decimal('0.01')) if amount else Decimal(0)
+
+        exchange = self.exchange
+        if get('exchange_type'):
+            exchange = ORDER_EXCHANGE_NAMES.get(get('exchange_type').upper())
+            if exchange is None:
+                raise ValueError(f"exchange_type: неизвестная биржа ({get('exchange_type')!r})")
+
+        # Строка ордера — словарь полей: модель собираем только для bulk_create, COPY обходится без неё
+        return {
+            'external_id': get('external_id')[:100],
+            'price': price,
+            'amount': amount,
+            'cost': cost,
+            'operation_type': operation_type,
+            'exchange_type': exchange,
+            'asset': get('asset').upper()[:20] or 'USDT',
+            'commission': parse_decimal(get('commission'), 'commission', allow_zero=True) if get('commission') else Decimal(0),
+            'commission_type': 'PERCENT' if get('commission_type').upper() in ('', 'PERCENT', '%') else 'FIX',
+            'created_at': parse_datetime(get('created_at'), self.tz),
+            'bank': get('bank')[:255],
+        }
+
+    def error(self, line, message):
+        if len(self.result['errors']) < MAX_REPORTED_ERRORS:
+            self.result['errors'].append((line, str(message)))
+
+    # --- Запись ---
+
+    def resolve_banks(self, orders):
+        names = {order['bank'] for order in orders if order['bank']} - set(self.banks)
+        if names:
+            created = BankDetail.objects.bulk_create(
+                [BankDetail(user_id=self.user.pk, name=name) for name in names], ignore_conflicts=True,
+            )
+            self.banks_created = self.banks_created or bool(created)
+            self.banks.update(
+                BankDetail.objects.filter(user_id=self.user.pk, name__in=names).values_list('name', 'id')
+            )
+        for order in orders:
+            order['bank_detail_id'] = self.banks.get(order.pop('bank'))
+
+    def drop_duplicates(self, orders):
+        # Дубли внутри пачки и уже сохранённые ордера — одним IN-запросом на биржу
+        unique = {}
+        manual = []
+        for order in orders:
+            key = (order['exchange_type'], order['external_id'])
+            if not order['external_id']:
+                manual.append(order)
+            elif key not in unique:
+                unique[key] = order
+
+        by_exchange = {}
+        for exchange, external_id in unique:
+            by_exchange.setdefault(exchange, []).append(external_id)
+        for exchange, ids in by_exchange.items():
+            existing = Order.objects.filter(
+                user_id=self.user.pk, exchange_type=exchange, external_id__in=ids,
+            ).values_list('external_id', flat=True)
+            for external_id in existing:
+                del unique[(exchange, external_id)]
+
+        fresh = manual + list(unique.values())
+        self.result['duplicates'] += len(orders) - len(fresh)
+        return fresh
+
+    def count_existing(self, orders):
+        # Сколько ордеров с номерами из пачки уже есть у пользователя
+        by_exchange = {}
+        for order in orders:
+            if order['external_id']:
+                by_exchange.setdefault(order['exchange_type'], []).append(order['external_id'])
+        return sum(
+            Order.objects.filter(user_id=self.user.pk, exchange_type=exchange, external_id__in=ids).count()
+            for exchange, ids in by_exchange.items()
+        )
+
+    def copy_orders(self, orders):
+        # COPY во временную таблицу и INSERT ... ON CONFLICT DO NOTHING:
+        # сам COPY не умеет пропускать дубли по уникальному индексу
+        table = Order._meta.db_table
+        columns = ', '.join(COPY_COLUMNS)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for order in orders:
+            writer.writerow([
+                self.user.pk, order['external_id'], order['price'], order['amount'], order['cost'],
+                order['operation_type'], order['exchange_type'], order['asset'], order['bank_detail_id'] or '',
+                order['commission'], order['commission_type'], '', '', order['created_at'].isoformat(), 1,
+            ])
+        buffer.seek(0)
+
+        copy_sql = (
+            f"COPY order_import ({columns}) FROM STDIN "
+            f"WITH (FORMAT csv, FORCE_NOT_NULL (external_id, screenshot_thumbnail, receipt_status))"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TEMP TABLE order_import ON COMMIT DROP AS SELECT {columns} FROM {table} WITH NO DATA"
+            )
+            if hasattr(cursor, 'copy_expert'):  # psycopg2
+                cursor.copy_expert(copy_sql, buffer)
+            else:  # psycopg 3
+                with cursor.copy(copy_sql) as copy:
+                    copy.write(buffer.getvalue())
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}) SELECT {columns} FROM order_import ON CONFLICT DO NOTHING"
+            )
+            return cursor.rowcount
+
+    def flush(self, orders):
+        if not orders:
+            return
+        with transaction.atomic():
+            orders = self.drop_duplicates(orders)
+            self.resolve_banks(orders)
+            if self.use_copy:
+                created = self.copy_orders(orders)
+                self.result['duplicates'] += len(orders) - created
+            else:
+                # ignore_conflicts не сообщает, сколько строк пропущено (ордер мог сохраниться
+                # параллельно после drop_duplicates) — считаем ордера с номерами до и после
+                before = self.count_existing(orders)
+                Order.objects.bulk_create(
+                    [Order(user_id=self.user.pk, **order) for order in orders], batch_size=1000, ignore_conflicts=True,
+                )
+                manual = sum(1 for order in orders if not order['external_id'])
+                created = manual + self.count_existing(orders) - before
+                self.result['duplicates'] += len(orders) - created
+        self.result['created'] += created
+
+        if orders:
+            dates = [order['created_at'] for order in orders]
+            first, last = order_day(min(dates)), order_day(max(dates))
+            self.first_day = min(self.first_day or first, first)
+            self.last_day = max(self.last_day or last, last)
+
+        if self.progress:
+            self.progress(self.result)
+
+    def run(self, file):
+        # file — бинарный файл (загрузка из формы или open(path, 'rb'))
+        text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+        sample = text.read(8192)
+        text.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.reader(text, dialect)
+
+        try:
+            mapping = self.resolve_columns(next(reader, []))
+            chunk = []
+            for line, row in enumerate(reader, start=2):
+                if not any(cell.strip() for cell in row):
+                    continue
+                self.result['rows'] += 1
+                try:
+                    order = self.parse_row(row, mapping)
+                except ValueError as e:
+                    self.error(line, e)
+                    continue
+                if order is None:
+                    self.result['skipped'] += 1
+                    continue
+                chunk.append(order)
+                if len(chunk) >= self.chunk_size:
+                    self.flush(chunk)
+                    chunk = []
+            self.flush(chunk)
+        finally:
+            text.detach()
+            # Сигналы bulk_create не шлёт — оборот и версии обновляем один раз за импорт
+            if self.result['created']:
+                orders_bulk_changed(self.user.pk, self.first_day, self.last_day)
+            if self.banks_created:
+                bump_details_version(self.user.pk)
+        return self.result
+
+
+def import_orders(user, file, fmt='generic', **options):
+    return OrderImporter(user, fmt, **options).run(file)
@@ -0,0 +1,105 @@
+# orders/management/commands/bench.py
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.benchmarks import SCENARIOS, bench_users, compare, delete_dataset, generate_dataset, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеры производительности на синтетических данных (пользователи bench_*). "
+        "Не запускать на рабочей базе: --generate пишет миллионы ордеров"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--generate', action='store_true', help="Сгенерировать данные для замеров")
+        parser.add_argument('--reset', action='store_true', help="Удалить данные замеров")
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--orders-per-user', type=int, default=1000)
+        parser.add_argument('--unprocessed-per-user', type=int, default=20)
+        parser.add_argument('--days', type=int, default=180, help="Глубина истории ордеров")
+        parser.add_argument('--seed', type=int, default=42)
+
+        parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help="Только эти сценарии")
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--subjects', type=int, default=20, help="Сколько пользователей опрашивать")
+        parser.add_argument('--latency', type=float, default=0.02, help="Задержка ответа заглушки бирж, сек")
+        parser.add_argument('--error-rate', type=float, default=0, help="Доля ответов заглушки с 429/503")
+        parser.add_argument('--output', help="Сохранить результаты в JSON")
+        parser.add_argument('--baseline', default='bench_baseline.json', help="Базовая линия для сравнения")
+        parser.add_argument('--save-baseline', action='store_true', help="Записать результаты как базовую линию")
+        parser.add_argument('--tolerance', type=float, default=0.25, help="Допустимый рост времени (0.25 = 25%%)")
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            deleted = delete_dataset()
+            self.stdout.write(f"Удалено объектов: {deleted}")
+
+        if options['generate']:
+            if bench_users().exists():
+                raise CommandError("Данные замеров уже есть: сначала --reset")
+
+            def progress(users, orders):
+                if users % 100 == 0:
+                    self.stdout.write(f"  пользователей: {users}, ордеров: {orders}")
+
+            created = generate_dataset(
+                users=options['users'],
+                orders_per_user=options['orders_per_user'],
+                unprocessed_per_user=options['unprocessed_per_user'],
+                days=options['days'],
+                seed=options['seed'],
+                progress=progress,
+            )
+            self.stdout.write(self.style.SUCCESS(f"Готово. Ордеров: {created}"))
+
+        if options['reset'] or options['generate']:
+            return
+
+        def report(name, result):
+            self.stdout.write(
+                f"{name:<26} p50 {result['p50_ms']:>9.2f} мс  p95 {result['p95_ms']:>9.2f} мс  "
+                f"SQL {result['queries']:>4}  {result['throughput_rps']:>8.2f} запр/с"
+                + (f"  ошибок: {result['errors']}" if result['errors'] else "")
+            )
+
+        try:
+            results = run_benchmarks(
+                options['scenario'],
+                iterations=options['iterations'],
+                warmup=options['warmup'],
+                progress=report,
+                seed=options['seed'],
+                subjects=options['subjects'],
+                latency=options['latency'],
+                error_rate=options['error_rate'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(results, ensure_ascii=False, indent=2))
+
+        baseline_path = Path(options['baseline'])
+        if options['save_baseline']:
+            baseline = json.loads(baseline_path.read_text()) if baseline_path.exists() else {'scenarios': {}}
+            # Прогон части сценариев обновляет только их
+            baseline['meta'] = results['meta']
+            baseline['scenarios'].update(results['scenarios'])
+            baseline_path.write_text(json.dumps(baseline, ensure_ascii=False, indent=2))
+            self.stdout.write(self.style.SUCCESS(f"Базовая линия записана в {baseline_path}"))
+            return
+
+        if not baseline_path.exists():
+            self.stdout.write(f"Базовой линии {baseline_path} нет — сравнивать не с чем (--save-baseline)")
+            return
+
+        regressions = compare(results, json.loads(baseline_path.read_text()), tolerance=options['tolerance'])
+        if regressions:
+            for line in regressions:
+                self.stderr.write(f"❌ {line}")
+            raise CommandError(f"Регрессий: {len(regressions)}")
+        self.stdout.write(self.style.SUCCESS("Регрессий нет"))
@@ -0,0 +1,33 @@
+# orders/management/commands/bybit_stream.py
+import os
+import socket
+
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.streams import BybitStreamDaemon
+
+
+class Command(BaseCommand):
+    help = (
+        "Ордера Bybit в реальном времени: приватные WebSocket-соединения пользователей с ключами "
+        "в одном процессе. Несколько процессов делят пользователей через --shard/--shards"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shard', type=int, default=0, help="Номер процесса (с нуля)")
+        parser.add_argument('--shards', type=int, default=1, help="Сколько всего процессов")
+        parser.add_argument('--fetch-workers', type=int, default=4, help="Потоков для дозагрузки по REST")
+
+    def handle(self, *args, **options):
+        if not 0 <= options['shard'] < options['shards']:
+            raise CommandError("--shard должен быть от 0 до --shards - 1")
+
+        worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.stdout.write(f"Поток Bybit {worker_id} запущен (шард {options['shard']} из {options['shards']})")
+        daemon = BybitStreamDaemon(
+            shard=options['shard'], shards=options['shards'], fetch_workers=options['fetch_workers'],
+        )
+        try:
+            daemon.run_forever()
+        except KeyboardInterrupt:
+            self.stdout.write("Остановлен")
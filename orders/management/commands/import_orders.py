@@ -0,0 +1,50 @@
+# orders/management/commands/import_orders.py
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.importers import IMPORT_CHUNK_SIZE, IMPORT_FORMATS, import_orders
+from orders.models import User
+
+
+class Command(BaseCommand):
+    help = "Массовый импорт ордеров пользователя из CSV (выгрузки Bybit/HTX/MEXC или общий формат)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Путь к CSV-файлу")
+        parser.add_argument('--user', required=True, help="Логин или ID пользователя")
+        parser.add_argument('--format', default='generic', choices=sorted(IMPORT_FORMATS), help="Формат файла")
+        parser.add_argument('--exchange', help="Биржа для общего формата без колонки exchange (Bybit/HTX/MEXC)")
+        parser.add_argument('--copy', action='store_true', help="Загрузка через COPY (PostgreSQL, для больших файлов)")
+        parser.add_argument('--chunk', type=int, default=IMPORT_CHUNK_SIZE, help="Строк в одной пачке")
+
+    def handle(self, *args, **options):
+        lookup = {'pk': options['user']} if options['user'].isdigit() else {'username': options['user']}
+        user = User.objects.filter(**lookup).first()
+        if user is None:
+            raise CommandError(f"Пользователь {options['user']} не найден")
+
+        started = time.monotonic()
+
+        def progress(result):
+            self.stdout.write(
+                f"Строк: {result['rows']}, создано: {result['created']}, дублей: {result['duplicates']}, "
+                f"ошибок: {len(result['errors'])} ({time.monotonic() - started:.0f} с)"
+            )
+
+        try:
+            with open(options['path'], 'rb') as file:
+                result = import_orders(
+                    user, file, options['format'],
+                    exchange=options['exchange'], use_copy=options['copy'],
+                    chunk_size=options['chunk'], progress=progress,
+                )
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for line, message in result['errors']:
+            self.stderr.write(f"Строка {line}: {message}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово за {time.monotonic() - started:.1f} с. Создано: {result['created']}, "
+            f"дублей: {result['duplicates']}, пропущено: {result['skipped']}, ошибок: {len(result['errors'])}"
+        ))
@@ -0,0 +1,33 @@
+# orders/management/commands/process_screenshots.py
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from orders.screenshots import enqueue_legacy_screenshots, process_pending
+
+
+class Command(BaseCommand):
+    help = "Фоновая обработка скриншотов: пережатие, миниатюры, дедупликация по хэшу"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Один проход и выход (для cron)")
+        parser.add_argument('--batch', type=int, default=20, help="Сколько скриншотов обрабатывать за проход")
+        parser.add_argument('--idle', type=float, default=5, help="Пауза в секундах, если очередь пуста")
+        parser.add_argument('--backfill', action='store_true', help="Поставить в очередь скриншоты, загруженные до обработки")
+
+    def handle(self, *args, **options):
+        if options['backfill']:
+            count = enqueue_legacy_screenshots()
+            self.stdout.write(f"В очередь поставлено старых скриншотов: {count}")
+
+        while True:
+            close_old_connections()
+            count = process_pending(limit=options['batch'])
+            if count:
+                self.stdout.write(f"Обработано скриншотов: {count}")
+
+            if options['once']:
+                break
+            if not count:
+                time.sleep(options['idle'])
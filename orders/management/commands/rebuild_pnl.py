@@ -0,0 +1,16 @@
+# orders/management/commands/rebuild_pnl.py
+from django.core.management.base import BaseCommand
+
+from orders.pnl import PNL_METHODS, rebuild
+
+
+class Command(BaseCommand):
+    help = "Пересчитать реализованную прибыль (P&L) с нуля: сделки и снимки остатков"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help="ID пользователя (по умолчанию все)")
+        parser.add_argument('--method', choices=PNL_METHODS, help="Метод (по умолчанию все)")
+
+    def handle(self, *args, **options):
+        processed = rebuild(user_id=options['user'], method=options['method'])
+        self.stdout.write(self.style.SUCCESS(f"Готово. Обработано ордеров: {processed}"))
@@ -0,0 +1,25 @@
+# orders/management/commands/rebuild_turnover.py
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.rollups import rebuild_turnover
+
+
+class Command(BaseCommand):
+    help = "Пересобрать дневной оборот (DailyTurnover) из таблицы ордеров"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help="ID пользователя (по умолчанию все)")
+        parser.add_argument('--start', help="Первый день, ГГГГ-ММ-ДД")
+        parser.add_argument('--end', help="Последний день, ГГГГ-ММ-ДД")
+
+    def handle(self, *args, **options):
+        try:
+            start = datetime.date.fromisoformat(options['start']) if options['start'] else None
+            end = datetime.date.fromisoformat(options['end']) if options['end'] else None
+        except ValueError:
+            raise CommandError("Даты должны быть в формате ГГГГ-ММ-ДД")
+
+        created = rebuild_turnover(user_id=options['user'], start=start, end=end)
+        self.stdout.write(self.style.SUCCESS(f"Готово. Строк оборота: {created}"))
@@ -0,0 +1,33 @@
+# orders/management/commands/send_receipts.py
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from orders.receipts import process_pending, retry_failed
+
+
+class Command(BaseCommand):
+    help = "Фоновая отправка фискальных чеков в Эвотор из очереди ReceiptJob"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Один проход и выход (для cron)")
+        parser.add_argument('--batch', type=int, default=50, help="Сколько задач брать за один проход")
+        parser.add_argument('--idle', type=float, default=2, help="Пауза в секундах, если очередь пуста")
+        parser.add_argument('--retry-failed', action='store_true', help="Вернуть чеки с ошибкой в очередь")
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            count = retry_failed()
+            self.stdout.write(f"Возвращено в очередь чеков: {count}")
+
+        while True:
+            close_old_connections()
+            count = process_pending(limit=options['batch'])
+            if count:
+                self.stdout.write(f"Обработано задач на чеки: {count}")
+
+            if options['once']:
+                break
+            if not count:
+                time.sleep(options['idle'])
@@ -0,0 +1,34 @@
+# orders/management/commands/sync_orders.py
+import os
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from orders.sync import run_due_syncs
+
+
+class Command(BaseCommand):
+    help = "Фоновая синхронизация ордеров с бирж по расписанию"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Один проход и выход (для cron)")
+        parser.add_argument('--batch', type=int, default=10, help="Сколько пользователей брать за один проход")
+        parser.add_argument('--idle', type=float, default=5, help="Пауза в секундах, если синхронизировать некого")
+
+    def handle(self, *args, **options):
+        worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.stdout.write(f"Воркер синхронизации {worker_id} запущен")
+
+        while True:
+            # Долгоживущий процесс: не держим протухшие соединения с БД
+            close_old_connections()
+            count = run_due_syncs(worker_id, limit=options['batch'])
+            if count:
+                self.stdout.write(f"Синхронизировано пользователей: {count}")
+
+            if options['once']:
+                break
+            if not count:
+                time.sleep(options['idle'])
@@ -0,0 +1,112 @@
+# orders/media.py
+# Отдача скриншотов только владельцу. Сам файл отдаёт фронтовой сервер
+# (nginx X-Accel-Redirect / Apache X-Sendfile), Django лишь проверяет доступ;
+# без него (разработка) — отдаём из Python с поддержкой Range.
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.urls import reverse
+from django.utils.http import parse_etags, quote_etag
+
+IMMUTABLE_CACHE = 'private, max-age=31536000, immutable'
+REVALIDATE_CACHE = 'private, no-cache'
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+# Обработанные файлы: screenshots/ab/cd/<sha256><суффикс>.<ext> (screenshots.content_path)
+CONTENT_NAME_RE = re.compile(r'^screenshots/([0-9a-f]{2})/([0-9a-f]{2})/\1\2[0-9a-f]{60}[\w-]*\.\w+$')
+
+
+def file_version(name):
+    # Версия для URL (?v=): у обработанных это хэш содержимого, у сырых загрузок — имя файла
+    return os.path.splitext(os.path.basename(name))[0]
+
+
+def is_content_named(name):
+    # Только файл с хэшем содержимого в имени никогда не меняется под тем же именем.
+    # Сырую загрузку хранилище может перезаписать (имя освободилось после удаления)
+    return bool(CONTENT_NAME_RE.match(name))
+
+
+def file_etag(name):
+    if is_content_named(name):
+        return quote_etag(file_version(name))
+    # Сырая загрузка: к имени добавляем размер и время изменения
+    try:
+        modified = int(default_storage.get_modified_time(name).timestamp())
+        return quote_etag(f"{file_version(name)}-{default_storage.size(name)}-{modified}")
+    except (OSError, NotImplementedError):
+        return quote_etag(file_version(name))
+
+
+def screenshot_url(order, thumbnail=False):
+    field = order.screenshot_thumbnail if thumbnail else order.screenshot
+    if not field:
+        return None
+    name = 'order_screenshot_thumb' if thumbnail else 'order_screenshot'
+    return f"{reverse(name, args=[order.pk])}?v={quote(file_version(field.name))}"
+
+
+def serve_file(request, name):
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    etag = file_etag(name)
+    # Обработанный файл с актуальной версией в URL можно кэшировать навсегда: новый файл — новый URL.
+    # Сырые загрузки — только с проверкой по ETag
+    immutable = is_content_named(name) and request.GET.get('v') == file_version(name)
+    cache_control = IMMUTABLE_CACHE if immutable else REVALIDATE_CACHE
+
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        mode = getattr(settings, 'SCREENSHOT_SENDFILE', None)
+        if mode == 'nginx':
+            # nginx сам отдаёт файл из internal-location (и сам обрабатывает Range)
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = settings.SCREENSHOT_ACCEL_PREFIX.rstrip('/') + '/' + quote(name)
+        elif mode == 'sendfile':
+            response = HttpResponse(content_type=content_type)
+            response['X-Sendfile'] = default_storage.path(name)
+        else:
+            response = python_file_response(request, name, content_type)
+            if response.status_code == 416:
+                return response
+
+    response['ETag'] = etag
+    response['Cache-Control'] = cache_control
+    return response
+
+
+def python_file_response(request, name, content_type):
+    # Запасной путь для разработки: без фронтового сервера, но с Range (докачка, превью PDF)
+    size = default_storage.size(name)
+    header = request.headers.get('Range', '')
+    match = RANGE_RE.match(header.strip())
+    if not match or not any(match.groups()):
+        response = FileResponse(default_storage.open(name, 'rb'), content_type=content_type)
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+    start, end = match.groups()
+    if start:
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+    else:
+        # bytes=-N — последние N байт
+        start = max(size - int(end), 0)
+        end = size - 1
+    if start > end or start >= size:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    with default_storage.open(name, 'rb') as file:
+        file.seek(start)
+        data = file.read(end - start + 1)
+    response = HttpResponse(data, status=206, content_type=content_type)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    return response
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.9 on 2026-10-18 14:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_remove_order_bank_name_order_bank_detail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('NEVER', 'Ещё не синхронизировано'), ('RUNNING', 'Синхронизация'), ('SUCCESS', 'Успешно'), ('WARNING', 'Предупреждение'), ('ERROR', 'Ошибка')], default='NEVER', max_length=10)),
+                ('message', models.CharField(blank=True, default='', max_length=255)),
+                ('last_sync_at', models.DateTimeField(blank=True, null=True, verbose_name='Последняя синхронизация')),
+                ('last_success_at', models.DateTimeField(blank=True, null=True, verbose_name='Последняя успешная синхронизация')),
+                ('next_sync_at', models.DateTimeField(blank=True, null=True, verbose_name='Следующая синхронизация')),
+                ('lease_owner', models.CharField(blank=True, default='', max_length=100)),
+                ('lease_expires_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='sync_state', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['next_sync_at'], name='syncstate_next_sync_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.9 on 2026-10-18 14:46
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_unprocessed(apps, schema_editor):
+    # Необработанные ордера — это кэш биржи, дубликаты можно просто удалить
+    UnprocessedOrder = apps.get_model('orders', 'UnprocessedOrder')
+    duplicates = (
+        UnprocessedOrder.objects.values('user_id', 'exchange_type', 'order_id')
+        .annotate(keep_id=Min('id'), total=Count('id'))
+        .filter(total__gt=1)
+    )
+    for row in duplicates:
+        UnprocessedOrder.objects.filter(
+            user_id=row['user_id'], exchange_type=row['exchange_type'], order_id=row['order_id']
+        ).exclude(id=row['keep_id']).delete()
+
+
+def merge_duplicate_orders(apps, schema_editor):
+    # До этой миграции ничто не мешало сохранить ордер биржи дважды. Оставляем самый ранний,
+    # скриншоты дублей переносим на него (в этой схеме чеков ещё нет — переносить нечего)
+    Order = apps.get_model('orders', 'Order')
+    OrderScreenshot = apps.get_model('orders', 'OrderScreenshot')
+    duplicates = (
+        Order.objects.exclude(external_id='')
+        .values('user_id', 'exchange_type', 'external_id')
+        .annotate(keep_id=Min('id'), total=Count('id'))
+        .filter(total__gt=1)
+    )
+    for row in duplicates:
+        extra = Order.objects.filter(
+            user_id=row['user_id'], exchange_type=row['exchange_type'], external_id=row['external_id']
+        ).exclude(id=row['keep_id'])
+        OrderScreenshot.objects.filter(order__in=extra).update(order_id=row['keep_id'])
+        kept = Order.objects.get(id=row['keep_id'])
+        if not kept.screenshot:
+            screenshot = extra.exclude(screenshot='').exclude(screenshot__isnull=True).values_list('screenshot', flat=True).first()
+            if screenshot:
+                Order.objects.filter(id=kept.id).update(screenshot=screenshot)
+        extra.delete()
+
+
+class Migration(migrations.Migration):
+    # Только данные: ограничения добавляет 0007. В одной транзакции с перенесёнными
+    # ссылками на orders_order PostgreSQL не даст создать уникальный индекс
+
+    dependencies = [
+        ('orders', '0005_syncstate'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_unprocessed, migrations.RunPython.noop),
+        migrations.RunPython(merge_duplicate_orders, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.9 on 2026-10-18 14:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Ограничения — отдельной миграцией после слияния дублей (0006), как 0015 после 0014
+
+    dependencies = [
+        ('orders', '0006_merge_duplicate_orders'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(('external_id', ''), _negated=True), fields=('user', 'exchange_type', 'external_id'), name='order_unique_external_id'),
+        ),
+        migrations.AddConstraint(
+            model_name='unprocessedorder',
+            constraint=models.UniqueConstraint(fields=('user', 'exchange_type', 'order_id'), name='unprocessed_unique_order_id'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.9 on 2026-10-18 14:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_order_unique_external_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('exchange_type', models.CharField(default='BYBIT', max_length=20)),
+                ('high_water_ms', models.BigIntegerField(blank=True, null=True)),
+                ('low_water_ms', models.BigIntegerField(blank=True, null=True)),
+                ('backfill_done', models.BooleanField(default=False, verbose_name='История загружена')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sync_cursors', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'exchange_type'), name='synccursor_unique_exchange')],
+            },
+        ),
+    ]
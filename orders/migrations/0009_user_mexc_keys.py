@@ -0,0 +1,23 @@
+# Generated by Django 5.2.9 on 2026-10-18 14:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0008_synccursor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='mexc_api_key',
+            field=models.CharField(blank=True, max_length=255, null=True, verbose_name='MEXC API Key'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='mexc_api_secret',
+            field=models.CharField(blank=True, max_length=255, null=True, verbose_name='MEXC API Secret'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.9 on 2026-10-18 14:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0010_order_user_created_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyTurnover',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('exchange_type', models.CharField(max_length=50)),
+                ('operation_type', models.CharField(max_length=4)),
+                ('amount_sum', models.DecimalField(decimal_places=8, default=0, max_digits=28)),
+                ('cost_sum', models.DecimalField(decimal_places=2, default=0, max_digits=28)),
+                ('commission_sum', models.DecimalField(decimal_places=2, default=0, max_digits=28)),
+                ('orders_count', models.IntegerField(default=0)),
+                ('bank_detail', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='orders.bankdetail')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_turnover', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='dailyturnover_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'day', 'exchange_type', 'operation_type', 'bank_detail'), name='dailyturnover_unique_key', nulls_distinct=False)],
+            },
+        ),
+    ]
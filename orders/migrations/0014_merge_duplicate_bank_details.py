@@ -0,0 +1,54 @@
+# Generated by Django 5.2.9 on 2026-10-18 14:57
+
+from django.db import migrations
+from django.db.models import Count, F, Min
+
+
+TURNOVER_FIELDS = ('amount_sum', 'cost_sum', 'commission_sum', 'orders_count')
+
+
+def merge_duplicate_details(apps, schema_editor):
+    # Дубликаты от гонок get_or_create: оставляем самый ранний реквизит,
+    # переносим на него ордера и складываем дневной оборот
+    BankDetail = apps.get_model('orders', 'BankDetail')
+    Order = apps.get_model('orders', 'Order')
+    DailyTurnover = apps.get_model('orders', 'DailyTurnover')
+
+    duplicates = (
+        BankDetail.objects.values('user_id', 'name')
+        .annotate(keep_id=Min('id'), total=Count('id'))
+        .filter(total__gt=1)
+    )
+    for row in duplicates:
+        extra = BankDetail.objects.filter(user_id=row['user_id'], name=row['name']).exclude(id=row['keep_id'])
+        extra_ids = list(extra.values_list('id', flat=True))
+
+        # Реквизит активен, если активен хотя бы один из дублей
+        if extra.filter(is_deleted=False).exists():
+            BankDetail.objects.filter(id=row['keep_id']).update(is_deleted=False)
+
+        Order.objects.filter(bank_detail_id__in=extra_ids).update(bank_detail_id=row['keep_id'])
+
+        for turnover in DailyTurnover.objects.filter(bank_detail_id__in=extra_ids):
+            target = DailyTurnover.objects.filter(
+                user_id=turnover.user_id, day=turnover.day, exchange_type=turnover.exchange_type,
+                operation_type=turnover.operation_type, bank_detail_id=row['keep_id'],
+            )
+            if target.update(**{name: F(name) + getattr(turnover, name) for name in TURNOVER_FIELDS}):
+                turnover.delete()
+            else:
+                turnover.bank_detail_id = row['keep_id']
+                turnover.save(update_fields=['bank_detail'])
+
+        extra.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0013_user_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_details, migrations.RunPython.noop),
+    ]
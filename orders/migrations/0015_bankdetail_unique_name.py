@@ -0,0 +1,19 @@
+# Generated by Django 5.2.9 on 2026-10-18 14:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Ограничение — отдельной миграцией: PostgreSQL не даёт менять таблицу
+    # в одной транзакции с только что перенесёнными ссылками на неё
+
+    dependencies = [
+        ('orders', '0014_merge_duplicate_bank_details'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='bankdetail',
+            constraint=models.UniqueConstraint(fields=('user', 'name'), name='bankdetail_unique_name'),
+        ),
+    ]
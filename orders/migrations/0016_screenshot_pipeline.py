@@ -0,0 +1,72 @@
+# Generated by Django 5.2.9 on 2026-10-18 14:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0015_bankdetail_unique_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='screenshot_thumbnail',
+            field=models.ImageField(blank=True, default='', max_length=255, upload_to=''),
+        ),
+        migrations.AddField(
+            model_name='orderscreenshot',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='orderscreenshot',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='orderscreenshot',
+            name='original_bytes',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Исходный размер'),
+        ),
+        migrations.AddField(
+            model_name='orderscreenshot',
+            name='processed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='orderscreenshot',
+            name='size_bytes',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Размер после обработки'),
+        ),
+        migrations.AddField(
+            model_name='orderscreenshot',
+            name='status',
+            field=models.CharField(choices=[('PENDING', 'Ожидает обработки'), ('READY', 'Готов'), ('FAILED', 'Ошибка')], default='PENDING', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='orderscreenshot',
+            name='thumbnail',
+            field=models.ImageField(blank=True, default='', max_length=255, upload_to='', verbose_name='Миниатюра'),
+        ),
+        migrations.AddField(
+            model_name='orderscreenshot',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='screenshot',
+            field=models.ImageField(blank=True, max_length=255, null=True, upload_to='orders/screenshots/'),
+        ),
+        migrations.AlterField(
+            model_name='orderscreenshot',
+            name='image',
+            field=models.ImageField(max_length=255, upload_to='screenshots/%Y/%m/%d/', verbose_name='Скриншот'),
+        ),
+        migrations.AddIndex(
+            model_name='orderscreenshot',
+            index=models.Index(fields=['status', 'id'], name='screenshot_status_idx'),
+        ),
+    ]
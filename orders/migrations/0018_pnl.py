@@ -0,0 +1,59 @@
+# Generated by Django 5.2.9 on 2026-10-18 15:13
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0017_order_created_at_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='asset',
+            field=models.CharField(default='USDT', max_length=20, verbose_name='Актив'),
+        ),
+        migrations.CreateModel(
+            name='PnlCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('exchange_type', models.CharField(max_length=50)),
+                ('asset', models.CharField(max_length=20)),
+                ('method', models.CharField(choices=[('FIFO', 'FIFO'), ('AVERAGE', 'Средневзвешенная')], max_length=10)),
+                ('position_at', models.DateTimeField()),
+                ('position_id', models.BigIntegerField()),
+                ('lots', models.JSONField(default=list)),
+                ('realized_pnl', models.DecimalField(decimal_places=2, default=0, max_digits=28)),
+                ('orders_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pnl_checkpoints', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'exchange_type', 'asset', 'method', '-position_at', '-position_id'], name='pnlcheckpoint_position_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='RealizedTrade',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('method', models.CharField(choices=[('FIFO', 'FIFO'), ('AVERAGE', 'Средневзвешенная')], max_length=10)),
+                ('exchange_type', models.CharField(max_length=50)),
+                ('asset', models.CharField(max_length=20)),
+                ('created_at', models.DateTimeField()),
+                ('amount', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('proceeds', models.DecimalField(decimal_places=2, max_digits=20)),
+                ('cost_basis', models.DecimalField(decimal_places=2, max_digits=20)),
+                ('pnl', models.DecimalField(decimal_places=2, max_digits=20)),
+                ('unmatched_amount', models.DecimalField(decimal_places=8, default=0, max_digits=20)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='realized_trades', to='orders.order')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='realized_trades', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'method', 'created_at'], name='realizedtrade_period_idx'), models.Index(fields=['user', 'exchange_type', 'asset', 'method', 'created_at'], name='realizedtrade_stream_idx')],
+            },
+        ),
+    ]
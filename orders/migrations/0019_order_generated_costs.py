@@ -0,0 +1,28 @@
+# Generated by Django 5.2.9 on 2026-10-18 15:14
+
+import django.db.models.expressions
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0018_pnl'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='commission_rub',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(commission_type='PERCENT', then=django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.F('cost'), '*', models.F('commission')), '/', models.Value(100))), default=models.F('commission')), output_field=models.DecimalField(decimal_places=2, max_digits=20)),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='net_cost',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(commission_type='PERCENT', then=models.Case(models.When(operation_type='SELL', then=django.db.models.expressions.CombinedExpression(models.F('cost'), '-', django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.F('cost'), '*', models.F('commission')), '/', models.Value(100)))), default=django.db.models.expressions.CombinedExpression(models.F('cost'), '+', django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.F('cost'), '*', models.F('commission')), '/', models.Value(100))))), models.When(operation_type='SELL', then=django.db.models.expressions.CombinedExpression(models.F('cost'), '-', models.F('commission'))), default=django.db.models.expressions.CombinedExpression(models.F('cost'), '+', models.F('commission'))), output_field=models.DecimalField(decimal_places=2, max_digits=20)),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'created_at', 'id'], include=('exchange_type', 'asset', 'operation_type', 'bank_detail', 'amount', 'cost', 'commission_rub', 'net_cost'), name='order_user_period_cover_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-18 15:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0021_order_write_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='synccursor',
+            name='stream_until',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Поток в реальном времени до'),
+        ),
+    ]
@@ -1,5 +1,8 @@
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
+from django.db.models.functions import Lower
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.indexes import GinIndex, OpClass
 
 class User(AbstractUser):
     inn = models.CharField(max_length=12, blank=True, null=True, verbose_name="ИНН")
@@ -13,15 +16,47 @@ class User(AbstractUser):
     htx_private_key = models.CharField(max_length=255, blank=True, null=True, verbose_name="HTX Private Key")
     bybit_api_key = models.CharField(max_length=255, blank=True, null=True, verbose_name="Bybit API Key")
     bybit_api_secret = models.CharField(max_length=255, blank=True, null=True, verbose_name="Bybit API Secret")
+    mexc_api_key = models.CharField(max_length=255, blank=True, null=True, verbose_name="MEXC API Key")
+    mexc_api_secret = models.CharField(max_length=255, blank=True, null=True, verbose_name="MEXC API Secret")
+
+    # Версии данных для ETag в API расширения: растут при любом изменении ордеров / реквизитов
+    orders_version = models.BigIntegerField(default=0, editable=False)
+    details_version = models.BigIntegerField(default=0, editable=False)
+
+    VERSION_FIELDS = ('orders_version', 'details_version')
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Поиск в админке (orders/search.py): префикс логина без учёта регистра
+            models.Index(OpClass(Lower('username'), name='varchar_pattern_ops'), name='user_username_prefix_idx'),
+            # ...и нечёткий поиск pg_trgm
+            GinIndex(OpClass(Lower('username'), name='gin_trgm_ops'), name='user_username_trgm_idx'),
+        ]
 
     def __str__(self):
         return self.username
 
+    def save(self, *args, **kwargs):
+        # Версии меняются только F()-инкрементом (orders/versions.py) — не затираем их тем,
+        # что было загружено в начале запроса
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.VERSION_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
 class BankDetail(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='bank_details')
     name = models.CharField(max_length=255, verbose_name="Название счета")
     is_deleted = models.BooleanField(default=False, verbose_name="Удалено")
 
+    class Meta:
+        constraints = [
+            # Один реквизит на название: на нём держится upsert в orders/bank_details.py
+            models.UniqueConstraint(fields=['user', 'name'], name='bankdetail_unique_name'),
+        ]
+
     def __str__(self):
         return f"{self.name} ({self.user.username})"
 
@@ -36,22 +71,129 @@ class Order(models.Model):
     cost = models.DecimalField(max_digits=20, decimal_places=2, verbose_name="Стоимость", default=0)
     operation_type = models.CharField(max_length=4, choices=OPERATION_CHOICES, default='BUY')
     exchange_type = models.CharField(max_length=50, default="Bybit")
+    asset = models.CharField(max_length=20, default="USDT", verbose_name="Актив")
     
     # Исправленное поле: добавили null=True, blank=True
     bank_detail = models.ForeignKey(BankDetail, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Реквизиты/Банк")
     
     commission = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     commission_type = models.CharField(max_length=10, choices=COMMISSION_CHOICES, default='PERCENT')
-    screenshot = models.ImageField(upload_to='orders/screenshots/', null=True, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    screenshot = models.ImageField(upload_to='orders/screenshots/', max_length=255, null=True, blank=True)
+    screenshot_thumbnail = models.ImageField(max_length=255, blank=True, default="")
+    # default, а не auto_now_add: при импорте и вводе вручную дата берётся из данных
+    created_at = models.DateTimeField(default=timezone.now)
+    version = models.PositiveIntegerField(default=1, editable=False)
+
+    # Фискальный чек (Эвотор): ставится в очередь при сохранении (ReceiptJob), пробивает воркер
+    RECEIPT_STATUS_CHOICES = [
+        ('', 'Не нужен'),
+        ('PENDING', 'В очереди'),
+        ('DONE', 'Пробит'),
+        ('FAILED', 'Ошибка'),
+    ]
+    receipt_status = models.CharField(max_length=10, choices=RECEIPT_STATUS_CHOICES, blank=True, default="", editable=False)
+    receipt_data = models.JSONField(null=True, blank=True, editable=False)  # фискальные реквизиты чека
+
+    # Комиссия в ₽ и сумма с учётом комиссии считаются самой БД (STORED generated columns),
+    # поэтому оборот и P&L агрегируются чистым SUM() без разбора commission_type в Python.
+    # net_cost: у BUY — сколько заплачено вместе с комиссией, у SELL — сколько получено за её вычетом
+    commission_rub = models.GeneratedField(
+        expression=models.Case(
+            models.When(commission_type='PERCENT', then=models.F('cost') * models.F('commission') / 100),
+            default=models.F('commission'),
+        ),
+        output_field=models.DecimalField(max_digits=20, decimal_places=2),
+        db_persist=True,
+    )
+    net_cost = models.GeneratedField(
+        expression=models.Case(
+            models.When(
+                commission_type='PERCENT',
+                then=models.Case(
+                    models.When(operation_type='SELL', then=models.F('cost') - models.F('cost') * models.F('commission') / 100),
+                    default=models.F('cost') + models.F('cost') * models.F('commission') / 100,
+                ),
+            ),
+            models.When(operation_type='SELL', then=models.F('cost') - models.F('commission')),
+            default=models.F('cost') + models.F('commission'),
+        ),
+        output_field=models.DecimalField(max_digits=20, decimal_places=2),
+        db_persist=True,
+    )
+
+    class Meta:
+        constraints = [
+            # Один и тот же ордер биржи не может быть сохранён дважды (ручные ордера без номера не в счёт)
+            models.UniqueConstraint(
+                fields=['user', 'exchange_type', 'external_id'],
+                condition=~models.Q(external_id=''),
+                name='order_unique_external_id',
+            ),
+        ]
+        indexes = [
+            # Лента "Мои ордеры": WHERE user_id = ? ORDER BY created_at DESC, id DESC
+            models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_idx'),
+            # Оборот и P&L за период (rebuild_turnover, orders/pnl.py): index-only scan без чтения таблицы
+            models.Index(
+                fields=['user', 'created_at', 'id'],
+                include=['exchange_type', 'asset', 'operation_type', 'bank_detail', 'amount', 'cost', 'commission_rub', 'net_cost'],
+                name='order_user_period_cover_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.operation_type} - {self.external_id}"
 
+    @property
+    def screenshot_link(self):
+        # Ссылка на скриншот через проверку доступа (orders/media.py), а не прямой /media/
+        from .media import screenshot_url
+        return screenshot_url(self)
+
+    @property
+    def thumbnail_link(self):
+        from .media import screenshot_url
+        return screenshot_url(self, thumbnail=True)
+
+    def save(self, *args, **kwargs):
+        # Ордер, оборот (сигналы) и задача на чек пишутся одной транзакцией
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+    def commission_in_rub(self):
+        # commission — это либо процент от стоимости, либо фиксированная сумма в ₽.
+        # Для ещё не сохранённых значений (после save() commission_rub устаревает до refresh_from_db);
+        # в запросах — колонка commission_rub
+        if self.commission_type == 'PERCENT':
+            return self.cost * self.commission / 100
+        return self.commission
+
 class OrderScreenshot(models.Model):
+    # Загруженный файл обрабатывает manage.py process_screenshots (orders/screenshots.py):
+    # пережатие в WebP/AVIF, миниатюра и хранение по хэшу содержимого
+    STATUS_CHOICES = [
+        ('PENDING', 'Ожидает обработки'),
+        ('READY', 'Готов'),
+        ('FAILED', 'Ошибка'),
+    ]
+
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='screenshots')
-    image = models.ImageField(upload_to='screenshots/%Y/%m/%d/', verbose_name="Скриншот")
+    image = models.ImageField(upload_to='screenshots/%Y/%m/%d/', max_length=255, verbose_name="Скриншот")
+    thumbnail = models.ImageField(max_length=255, blank=True, default="", verbose_name="Миниатюра")
+    content_hash = models.CharField(max_length=64, blank=True, default="", db_index=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    size_bytes = models.PositiveIntegerField(null=True, blank=True, verbose_name="Размер после обработки")
+    original_bytes = models.PositiveIntegerField(null=True, blank=True, verbose_name="Исходный размер")
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Очередь обработки: WHERE status = 'PENDING' ORDER BY id
+            models.Index(fields=['status', 'id'], name='screenshot_status_idx'),
+        ]
 
 class UnprocessedOrder(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -62,7 +204,200 @@ class UnprocessedOrder(models.Model):
     created_at = models.DateTimeField(verbose_name="Дата создания на бирже")
     exchange_type = models.CharField(max_length=20, default='BYBIT')
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'exchange_type', 'order_id'],
+                name='unprocessed_unique_order_id',
+            ),
+        ]
+
     def __str__(self):
         return f"Unprocessed {self.order_id}"
-    
-    
\ No newline at end of file
+
+class SyncState(models.Model):
+    STATUS_CHOICES = [
+        ('NEVER', 'Ещё не синхронизировано'),
+        ('RUNNING', 'Синхронизация'),
+        ('SUCCESS', 'Успешно'),
+        ('WARNING', 'Предупреждение'),
+        ('ERROR', 'Ошибка'),
+    ]
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='sync_state')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='NEVER')
+    message = models.CharField(max_length=255, blank=True, default="")
+    last_sync_at = models.DateTimeField(null=True, blank=True, verbose_name="Последняя синхронизация")
+    last_success_at = models.DateTimeField(null=True, blank=True, verbose_name="Последняя успешная синхронизация")
+    next_sync_at = models.DateTimeField(null=True, blank=True, verbose_name="Следующая синхронизация")
+
+    # Аренда: воркер, который сейчас синхронизирует пользователя, и до какого момента
+    lease_owner = models.CharField(max_length=100, blank=True, default="")
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['next_sync_at'], name='syncstate_next_sync_idx'),
+        ]
+
+    def __str__(self):
+        return f"Sync {self.user.username}: {self.status}"
+
+class SyncCursor(models.Model):
+    # Водяные знаки истории биржи (миллисекунды, как createTime у биржи):
+    # всё между low_water_ms и high_water_ms уже выгружено в UnprocessedOrder
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sync_cursors')
+    exchange_type = models.CharField(max_length=20, default='BYBIT')
+    high_water_ms = models.BigIntegerField(null=True, blank=True)
+    low_water_ms = models.BigIntegerField(null=True, blank=True)
+    backfill_done = models.BooleanField(default=False, verbose_name="История загружена")
+    # Пока поток WebSocket (manage.py bybit_stream) продлевает срок, опрос по расписанию биржу пропускает
+    stream_until = models.DateTimeField(null=True, blank=True, verbose_name="Поток в реальном времени до")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'exchange_type'], name='synccursor_unique_exchange'),
+        ]
+
+    def __str__(self):
+        return f"Cursor {self.user.username} {self.exchange_type}"
+
+class DailyTurnover(models.Model):
+    # Предагрегированный оборот за день: поддерживается сигналами на Order
+    # (orders/signals.py), пересобирается командой rebuild_turnover
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_turnover')
+    day = models.DateField()
+    exchange_type = models.CharField(max_length=50)
+    operation_type = models.CharField(max_length=4)
+    bank_detail = models.ForeignKey(BankDetail, on_delete=models.CASCADE, null=True, blank=True)
+
+    amount_sum = models.DecimalField(max_digits=28, decimal_places=8, default=0)
+    cost_sum = models.DecimalField(max_digits=28, decimal_places=2, default=0)
+    commission_sum = models.DecimalField(max_digits=28, decimal_places=2, default=0)
+    orders_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'day', 'exchange_type', 'operation_type', 'bank_detail'],
+                nulls_distinct=False,
+                name='dailyturnover_unique_key',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='dailyturnover_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.user.username} {self.operation_type}"
+
+class PnlCheckpoint(models.Model):
+    # Снимок складского остатка после ордера (position_at, position_id) в потоке
+    # пользователь + биржа + актив + метод. Пересчёт P&L (orders/pnl.py) продолжается
+    # с последнего снимка, а не со всей истории
+    METHOD_CHOICES = [('FIFO', 'FIFO'), ('AVERAGE', 'Средневзвешенная')]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='pnl_checkpoints')
+    exchange_type = models.CharField(max_length=50)
+    asset = models.CharField(max_length=20)
+    method = models.CharField(max_length=10, choices=METHOD_CHOICES)
+    position_at = models.DateTimeField()
+    position_id = models.BigIntegerField()
+    # Открытые лоты [[кол-во, себестоимость единицы в ₽], ...]; у AVERAGE — один лот
+    lots = models.JSONField(default=list)
+    realized_pnl = models.DecimalField(max_digits=28, decimal_places=2, default=0)
+    orders_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', 'exchange_type', 'asset', 'method', '-position_at', '-position_id'],
+                name='pnlcheckpoint_position_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} {self.exchange_type} {self.asset} {self.method} @ {self.position_at}"
+
+class RealizedTrade(models.Model):
+    # Результат продажи: выручка за вычетом комиссии против себестоимости проданных лотов
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='realized_trades')
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='realized_trades')
+    method = models.CharField(max_length=10, choices=PnlCheckpoint.METHOD_CHOICES)
+    exchange_type = models.CharField(max_length=50)
+    asset = models.CharField(max_length=20)
+    created_at = models.DateTimeField()
+    amount = models.DecimalField(max_digits=20, decimal_places=8)
+    proceeds = models.DecimalField(max_digits=20, decimal_places=2)
+    cost_basis = models.DecimalField(max_digits=20, decimal_places=2)
+    pnl = models.DecimalField(max_digits=20, decimal_places=2)
+    # Продано больше, чем было куплено в истории (остаток до начала учёта) — без себестоимости
+    unmatched_amount = models.DecimalField(max_digits=20, decimal_places=8, default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'method', 'created_at'], name='realizedtrade_period_idx'),
+            models.Index(fields=['user', 'exchange_type', 'asset', 'method', 'created_at'], name='realizedtrade_stream_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.order_id} {self.method}: {self.pnl}"
+
+class ReceiptJob(models.Model):
+    # Transactional outbox для чеков: строка создаётся в одной транзакции с ордером,
+    # отправляет её воркер (manage.py send_receipts, orders/receipts.py)
+    STATUS_CHOICES = [
+        ('PENDING', 'Ожидает отправки'),
+        ('SENT', 'Принят, ждём результат'),
+        ('DONE', 'Пробит'),
+        ('FAILED', 'Ошибка'),
+    ]
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='receipt_jobs')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='receipt_jobs')
+    group_code = models.CharField(max_length=255)  # группа ККТ на момент постановки в очередь
+    operation = models.CharField(max_length=20, default='sell')
+    # external_id для API Эвотора: повторная отправка того же чека не пробьёт его второй раз
+    idempotency_key = models.CharField(max_length=100, unique=True)
+    payload = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    uuid = models.CharField(max_length=100, blank=True, default="")  # ID документа в Эвоторе
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default="")
+    result = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='receiptjob_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"Receipt {self.idempotency_key}: {self.status}"
+
+
+class OrderWriteKey(models.Model):
+    # Ключ идемпотентности пакетной записи ордеров из расширения (orders/order_writes.py):
+    # повтор запроса с тем же ключом получает сохранённый результат, а не пишет ордер заново
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='order_write_keys')
+    key = models.CharField(max_length=100)
+    fingerprint = models.CharField(max_length=64)  # sha256 данных ордера: тот же ключ с другими данными — ошибка
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='write_keys')
+    result = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='order_write_key_unique'),
+        ]
+        indexes = [
+            # Удаление старых ключей пользователя
+            models.Index(fields=['user', 'created_at'], name='order_write_key_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Write key {self.key}"
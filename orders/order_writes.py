@@ -0,0 +1,365 @@
+# orders/order_writes.py
+# Пакетная запись ордеров из расширения: страница сделок — один запрос, повтор безопасен.
+# Ордер биржи однозначно задан (user, exchange_type, external_id), поэтому на PostgreSQL
+# пачка пишется одним INSERT ... ON CONFLICT DO UPDATE по этому уникальному индексу.
+# Ключ идемпотентности клиента (OrderWriteKey) запоминает результат по каждому ордеру:
+# повтор с тем же ключом получает сохранённый ответ, тот же ключ с другими данными — ошибку.
+import hashlib
+import json
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .bank_details import resolve_bank_detail
+from .importers import parse_datetime, parse_decimal
+from .models import BankDetail, Order, OrderWriteKey, UnprocessedOrder, User
+from .receipts import enqueue_receipts
+from .rollups import order_day
+from .screenshots import attach_screenshot
+from .services import ORDER_EXCHANGE_NAMES
+from .signals import orders_bulk_changed
+from .sync import request_sync
+
+ORDER_BATCH_LIMIT = 200
+
+# commissionType расширения -> Order.commission_type
+COMMISSION_TYPES = {'PERCENT': 'PERCENT', 'MONEY': 'FIX', 'FIX': 'FIX'}
+# Поля, которые пишет пакет; не пришедшие в запросе у существующего ордера не меняются
+WRITE_FIELDS = (
+    'price', 'amount', 'cost', 'operation_type', 'asset', 'bank_detail_id',
+    'commission', 'commission_type', 'created_at',
+)
+# Колонки INSERT: у полей модели нет значений по умолчанию в самой БД
+INSERT_COLUMNS = ('user_id', 'exchange_type', 'external_id', *WRITE_FIELDS, 'screenshot_thumbnail', 'receipt_status', 'version')
+DECIMAL_PLACES = {
+    name: Order._meta.get_field(name).decimal_places for name in ('price', 'amount', 'cost', 'commission')
+}
+# Order.exchange_type -> код биржи в UnprocessedOrder
+EXCHANGE_CODES = {name: code for code, name in ORDER_EXCHANGE_NAMES.items()}
+
+
+def write_setting(name, default):
+    return getattr(settings, name, default)
+
+
+def as_text(value):
+    return '' if value is None else str(value).strip()
+
+
+# --- Разбор ---
+
+def item_fingerprint(exchange, raw):
+    data = json.dumps([exchange, raw], sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def parse_item(raw, exchange):
+    # Ордер в формате расширения -> поля Order. Цена и количество могут не прийти
+    # (не разобралась страница ордера Bybit) — тогда берём их из UnprocessedOrder,
+    # из сохранённого ордера или выводим из суммы
+    if not isinstance(raw, dict):
+        raise ValueError("Ордер должен быть объектом")
+    if exchange is None:
+        raise ValueError("Неизвестный тип биржи")
+    external_id = as_text(raw.get('orderId') or raw.get('stringOrderId'))[:100]
+    key = as_text(raw.get('idempotencyKey'))[:100]
+    if not external_id and not key:
+        raise ValueError("Нужен номер ордера или idempotencyKey")
+
+    fields = {}
+    operation_type = as_text(raw.get('type')).upper()
+    if operation_type:
+        if operation_type not in ('BUY', 'SELL'):
+            raise ValueError(f"type: ожидается BUY/SELL ({raw.get('type')!r})")
+        fields['operation_type'] = operation_type
+
+    # MEXC присылает amount — сумму в ₽, quantity — количество
+    if 'quantity' in raw:
+        quantity, cost = raw.get('quantity'), raw.get('cost', raw.get('amount'))
+    else:
+        quantity, cost = raw.get('amount'), raw.get('cost')
+    for field, value in (('price', raw.get('price')), ('amount', quantity), ('cost', cost), ('commission', raw.get('commission'))):
+        if as_text(value):
+            fields[field] = parse_decimal(as_text(value), field).quantize(Decimal(1).scaleb(-DECIMAL_PLACES[field]))
+
+    if as_text(raw.get('commissionType')):
+        commission_type = COMMISSION_TYPES.get(as_text(raw.get('commissionType')).upper())
+        if commission_type is None:
+            raise ValueError(f"commissionType: ожидается PERCENT/MONEY ({raw.get('commissionType')!r})")
+        fields['commission_type'] = commission_type
+    if as_text(raw.get('asset')):
+        fields['asset'] = as_text(raw.get('asset')).upper()[:20]
+
+    created_at = raw.get('createdAt')
+    if isinstance(created_at, float):
+        created_at = int(created_at)
+    if as_text(created_at):
+        fields['created_at'] = parse_datetime(as_text(created_at), timezone.get_current_timezone())
+
+    bank = ''
+    details = raw.get('details')
+    if isinstance(details, dict) and as_text(details.get('id')):
+        try:
+            fields['bank_detail_id'] = int(details['id'])
+        except (TypeError, ValueError):
+            raise ValueError(f"details.id: не число ({details['id']!r})")
+    elif isinstance(details, dict):
+        bank = as_text(details.get('name'))[:255]
+
+    return {
+        'key': key,
+        'exchange_type': exchange,
+        'external_id': external_id,
+        'fields': fields,
+        'bank': bank,
+        'screenshot': as_text(raw.get('screenshot')),
+        'fingerprint': item_fingerprint(exchange, raw),
+    }
+
+
+# --- Запись ---
+
+def write_orders(user, items, files=None):
+    # items — [(Order.exchange_type или None, ордер из запроса)].
+    # Результат — список того же размера: что стало с каждым ордером
+    results = [None] * len(items)
+    parsed = []
+    for index, (exchange, raw) in enumerate(items):
+        try:
+            item = parse_item(raw, exchange)
+        except ValueError as e:
+            results[index] = {'status': 'error', 'message': str(e)}
+            continue
+        item['index'] = index
+        parsed.append(item)
+
+    # Один ордер (или ключ) дважды в пачке: пишем первый
+    seen = set()
+    unique = []
+    for item in parsed:
+        names = set()
+        if item['key']:
+            names.add(('key', item['key']))
+        if item['external_id']:
+            names.add(('order', item['exchange_type'], item['external_id']))
+        if names & seen:
+            results[item['index']] = {'status': 'error', 'orderId': item['external_id'], 'message': "Повтор в пачке"}
+            continue
+        seen |= names
+        unique.append(item)
+
+    with transaction.atomic():
+        # Пачки одного пользователя пишутся по очереди: ручные ордера (без номера) защищены только ключом
+        list(User.objects.select_for_update().filter(pk=user.pk).values_list('pk'))
+        fresh = replay_keys(user, unique, results)
+        write_items(user, fresh, results)
+        save_keys(user, fresh, results)
+
+    attach_files(user, unique, files or {}, results)
+    return results
+
+
+def replay_keys(user, items, results):
+    # Уже обработанные ключи: отдаём сохранённый результат. Возвращает ещё не записанные ордера
+    by_key = {item['key']: item for item in items if item['key']}
+    if not by_key:
+        return items
+    OrderWriteKey.objects.filter(
+        user=user, created_at__lt=timezone.now() - timedelta(days=write_setting('ORDER_WRITE_KEY_TTL_DAYS', 7)),
+    ).delete()
+
+    done = set()
+    for key, fingerprint, stored in OrderWriteKey.objects.filter(user=user, key__in=by_key).values_list('key', 'fingerprint', 'result'):
+        item = by_key[key]
+        if fingerprint == item['fingerprint']:
+            results[item['index']] = {**stored, 'replayed': True}
+        else:
+            results[item['index']] = {
+                'status': 'error', 'key': key, 'orderId': item['external_id'],
+                'message': "idempotencyKey уже использован для других данных",
+            }
+        done.add(key)
+    return [item for item in items if item['key'] not in done]
+
+
+def save_keys(user, items, results):
+    OrderWriteKey.objects.bulk_create([
+        OrderWriteKey(
+            user=user, key=item['key'], fingerprint=item['fingerprint'],
+            order_id=results[item['index']].get('id'), result=results[item['index']],
+        )
+        for item in items if item['key'] and results[item['index']]['status'] != 'error'
+    ], ignore_conflicts=True)
+
+
+def load_existing(user, items):
+    # Сохранённые ордера пачки и синхронизированные с биржи: по IN-запросу на биржу
+    by_exchange = {}
+    for item in items:
+        if item['external_id']:
+            by_exchange.setdefault(item['exchange_type'], []).append(item['external_id'])
+
+    existing = {}
+    unprocessed = {}
+    for exchange, ids in by_exchange.items():
+        for row in Order.objects.filter(user=user, exchange_type=exchange, external_id__in=ids).values('id', 'external_id', 'version', *WRITE_FIELDS):
+            existing[exchange, row.pop('external_id')] = row
+        code = EXCHANGE_CODES.get(exchange)
+        rows = UnprocessedOrder.objects.filter(user=user, exchange_type=code, order_id__in=ids).values(
+            'order_id', 'operation_type', 'price', 'amount', 'created_at',
+        )
+        for row in rows:
+            unprocessed[exchange, row.pop('order_id')] = row
+    return existing, unprocessed
+
+
+def resolve_banks(user, items, results):
+    # details.id — только реквизиты пользователя; details.name — найти или создать
+    ids = {item['fields']['bank_detail_id'] for item in items if 'bank_detail_id' in item['fields']}
+    own = set(BankDetail.objects.filter(user=user, pk__in=ids).values_list('pk', flat=True)) if ids else set()
+    valid = []
+    for item in items:
+        if item['bank']:
+            item['fields']['bank_detail_id'] = resolve_bank_detail(user, item['bank']).pk
+        elif 'bank_detail_id' in item['fields'] and item['fields']['bank_detail_id'] not in own:
+            results[item['index']] = {'status': 'error', 'orderId': item['external_id'], 'message': "Реквизит не найден"}
+            continue
+        valid.append(item)
+    return valid
+
+
+class MissingOrderData(ValueError):
+    pass
+
+
+def order_values(item, current, synced):
+    # Итоговые поля ордера: сохранённые (или синхронизированные с биржи) + пришедшие в запросе
+    if current is not None:
+        values = {field: current[field] for field in WRITE_FIELDS}
+    else:
+        values = {
+            'asset': 'USDT', 'bank_detail_id': None, 'commission': Decimal(0),
+            'commission_type': 'PERCENT', 'created_at': timezone.now(),
+        }
+        if synced is not None:
+            values.update(synced)
+    values.update(item['fields'])
+    # Страница ордера может показать только два из трёх: цена, количество, сумма
+    cost = values.get('cost')
+    if cost is not None and values.get('amount') is None and values.get('price'):
+        values['amount'] = (cost / values['price']).quantize(Decimal(1).scaleb(-DECIMAL_PLACES['amount']))
+    if cost is not None and values.get('price') is None and values.get('amount'):
+        values['price'] = (cost / values['amount']).quantize(Decimal(1).scaleb(-DECIMAL_PLACES['price']))
+    for field in ('operation_type', 'price', 'amount'):
+        if values.get(field) is None:
+            raise MissingOrderData(f"{field}: не указано, и ордера ещё нет среди синхронизированных — повторите после синхронизации")
+    if values.get('cost') is None:
+        values['cost'] = (values['price'] * values['amount']).quantize(Decimal('0.01'))
+    return values
+
+
+def write_items(user, items, results):
+    items = resolve_banks(user, items, results)
+    existing, unprocessed = load_existing(user, items)
+
+    upserts = []
+    saves = []
+    missing = False
+    for item in items:
+        key = (item['exchange_type'], item['external_id'])
+        current = existing.get(key) if item['external_id'] else None
+        try:
+            item['values'] = order_values(item, current, unprocessed.get(key))
+        except ValueError as e:
+            results[item['index']] = {'status': 'error', 'orderId': item['external_id'], 'message': str(e)}
+            missing = missing or (isinstance(e, MissingOrderData) and bool(item['external_id']))
+            continue
+        item['current'] = current
+        if current is not None and all(item['values'][field] == current[field] for field in WRITE_FIELDS):
+            results[item['index']] = result(item, 'unchanged', current['id'], current['version'])
+        elif connection.vendor == 'postgresql' and item['external_id']:
+            upserts.append(item)
+        else:
+            # Ручные ордера (без номера) и не-PostgreSQL — через save() с обычными сигналами
+            saves.append(item)
+
+    if missing:
+        # Ордера нет в синхронизированных: синхронизируем пользователя вне очереди, чтобы повтор прошёл
+        request_sync(user)
+    if upserts:
+        upsert_items(user, upserts, results)
+    for item in saves:
+        save_item(user, item, results)
+
+
+def result(item, status, pk, version):
+    return {'status': status, 'key': item['key'] or None, 'orderId': item['external_id'], 'id': pk, 'version': version}
+
+
+def upsert_items(user, items, results):
+    # Один INSERT ... ON CONFLICT на пачку. Условие WHERE повторяет частичный уникальный
+    # индекс order_unique_external_id — без него PostgreSQL не найдёт индекс для ON CONFLICT.
+    # bulk_create(update_conflicts=True) так не умеет, поэтому SQL руками.
+    # Сигналы не срабатывают: оборот, P&L, версии и чеки — ниже, одним вызовом на пачку
+    table = Order._meta.db_table
+    placeholders = '(' + ', '.join(['%s'] * len(INSERT_COLUMNS)) + ')'
+    updates = ', '.join(f'{field} = EXCLUDED.{field}' for field in WRITE_FIELDS)
+    sql = (
+        f"INSERT INTO {table} ({', '.join(INSERT_COLUMNS)}) VALUES {', '.join([placeholders] * len(items))} "
+        f"ON CONFLICT (user_id, exchange_type, external_id) WHERE NOT (external_id = '') "
+        f"DO UPDATE SET {updates}, version = {table}.version + 1 "
+        # xmax = 0 только у только что вставленной строки
+        f"RETURNING id, exchange_type, external_id, version, (xmax = 0)"
+    )
+    params = []
+    for item in items:
+        values = item['values']
+        params.extend([user.pk, item['exchange_type'], item['external_id'], *(values[field] for field in WRITE_FIELDS), '', '', 1])
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        written = {(exchange, external_id): (pk, version, created) for pk, exchange, external_id, version, created in cursor.fetchall()}
+
+    days = []
+    new_orders = []
+    for item in items:
+        pk, version, created = written[item['exchange_type'], item['external_id']]
+        results[item['index']] = result(item, 'created' if created else 'updated', pk, version)
+        days.append(order_day(item['values']['created_at']))
+        if item['current'] is not None:
+            days.append(order_day(item['current']['created_at']))
+        if created:
+            new_orders.append(Order(
+                pk=pk, user=user, exchange_type=item['exchange_type'], external_id=item['external_id'], **item['values'],
+            ))
+    # Чеки — как в post_save для новых ордеров, в той же транзакции
+    enqueue_receipts(user, new_orders)
+    orders_bulk_changed(user.pk, min(days), max(days))
+
+
+def save_item(user, item, results):
+    if item['current'] is not None:
+        order = Order.objects.get(pk=item['current']['id'])
+        for field, value in item['values'].items():
+            setattr(order, field, value)
+        order.save()
+        status = 'updated'
+    else:
+        order = Order.objects.create(
+            user=user, exchange_type=item['exchange_type'], external_id=item['external_id'], **item['values'],
+        )
+        status = 'created'
+    results[item['index']] = result(item, status, order.pk, order.version)
+
+
+def attach_files(user, items, files, results):
+    # Скриншот из той же multipart-формы: поле ордера "screenshot" — имя части с файлом
+    for item in items:
+        outcome = results[item['index']]
+        upload = files.get(item['screenshot']) if item['screenshot'] else None
+        if upload is None or outcome['status'] == 'error':
+            continue
+        shot = attach_screenshot(Order(pk=outcome['id'], user=user), upload)
+        outcome['screenshot'] = shot.status
@@ -0,0 +1,263 @@
+# orders/pnl.py
+# Реализованная прибыль (P&L) в ₽: продажи сопоставляются с покупками по FIFO или по
+# средневзвешенной себестоимости отдельно для каждого потока пользователь + биржа + актив.
+# Себестоимость покупки и выручка продажи учитывают комиссию.
+#
+# Остаток лотов периодически сохраняется (PnlCheckpoint), поэтому новый ордер
+# пересчитывается от последнего снимка. Изменение ордера "в прошлом" удаляет снимки
+# после него (invalidate), следующий refresh продолжит с более раннего снимка.
+# Досчитывает леджер запись ордеров (schedule_refresh после коммита) и manage.py rebuild_pnl;
+# отчёт (realized_pnl) только читает готовые сделки.
+from collections import deque
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Q, Sum
+
+from .models import Order, PnlCheckpoint, RealizedTrade
+
+PNL_METHODS = ('FIFO', 'AVERAGE')
+DEFAULT_METHOD = 'FIFO'
+CHECKPOINT_EVERY = 1000  # ордеров между снимками при длинном пересчёте
+CHECKPOINT_MIN_ORDERS = 100  # хвост короче не сохраняем: дешевле досчитать его в следующий раз
+CHECKPOINTS_KEPT = 5  # снимков на поток: запас, чтобы после invalidate не считать с начала
+PNL_LOCK_NAMESPACE = 17017  # первый ключ pg_advisory_xact_lock(int, int) пересчёта P&L
+PNL_BATCH_SIZE = 2000
+
+ZERO = Decimal(0)
+CENT = Decimal('0.01')
+
+# Поля ордера для пересчёта — кортежами, без моделей. net_cost уже учитывает комиссию
+# (generated column): у BUY это себестоимость, у SELL — выручка
+ORDER_FIELDS = ('id', 'created_at', 'operation_type', 'amount', 'net_cost')
+
+
+def money(value):
+    return value.quantize(CENT)
+
+
+# --- Сопоставление лотов ---
+
+class Inventory:
+    # Открытые лоты потока: deque [кол-во, себестоимость единицы в ₽].
+    # FIFO продаёт из самых старых лотов, AVERAGE держит один лот со средней ценой
+    def __init__(self, method, lots=()):
+        self.method = method
+        self.lots = deque([Decimal(amount), Decimal(unit_cost)] for amount, unit_cost in lots)
+
+    def serialize(self):
+        return [[str(amount), str(unit_cost)] for amount, unit_cost in self.lots]
+
+    def buy(self, amount, total_cost):
+        if amount <= 0:
+            return
+        if self.method == 'AVERAGE' and self.lots:
+            lot = self.lots[0]
+            quantity = lot[0] + amount
+            lot[1] = (lot[0] * lot[1] + total_cost) / quantity
+            lot[0] = quantity
+        else:
+            self.lots.append([amount, total_cost / amount])
+
+    def sell(self, amount):
+        # -> (продано из остатка, себестоимость проданного)
+        remaining = amount
+        basis = ZERO
+        while remaining > 0 and self.lots:
+            lot = self.lots[0]
+            taken = min(lot[0], remaining)
+            basis += taken * lot[1]
+            lot[0] -= taken
+            remaining -= taken
+            if lot[0] <= 0:
+                self.lots.popleft()
+        return amount - remaining, basis
+
+
+def match_order(inventory, row):
+    # row — кортеж ORDER_FIELDS. Покупка пополняет остаток, продажа даёт сделку
+    order_id, created_at, operation_type, amount, net_cost = row
+    if operation_type == 'BUY':
+        inventory.buy(amount, net_cost)
+        return None
+    if amount <= 0:
+        return None
+    matched, basis = inventory.sell(amount)
+    # Выручку делим пропорционально: непокрытая остатком часть в прибыль не идёт
+    proceeds = net_cost * matched / amount
+    return {
+        'order_id': order_id,
+        'created_at': created_at,
+        'amount': matched,
+        'proceeds': money(proceeds),
+        'cost_basis': money(basis),
+        'pnl': money(proceeds) - money(basis),
+        'unmatched_amount': amount - matched,
+    }
+
+
+def match_orders(inventory, rows):
+    # rows — по порядку (created_at, id). Отдаёт сделки по продажам
+    for row in rows:
+        trade = match_order(inventory, row)
+        if trade is not None:
+            yield trade
+
+
+# --- Потоки и снимки ---
+
+def streams(user_id):
+    return (
+        Order.objects.filter(user_id=user_id)
+        .values_list('exchange_type', 'asset')
+        .distinct()
+        .order_by()
+    )
+
+
+def latest_checkpoint(user_id, exchange_type, asset, method):
+    return (
+        PnlCheckpoint.objects.filter(user_id=user_id, exchange_type=exchange_type, asset=asset, method=method)
+        .order_by('-position_at', '-position_id')
+        .first()
+    )
+
+
+def after_position(at, pk, field='created_at', id_field='id'):
+    return Q(**{f'{field}__gt': at}) | Q(**{field: at, f'{id_field}__gt': pk})
+
+
+def lock_user(user_id, wait=False):
+    # Один пересчёт на пользователя за раз, иначе параллельные запросы задвоят сделки.
+    # Рекомендательная блокировка до конца транзакции вместо строки User: чтение отчёта не
+    # блокирует запись ордеров, а без wait занятая блокировка сразу даёт False
+    if connection.vendor != 'postgresql':
+        return True
+    function = 'pg_advisory_xact_lock' if wait else 'pg_try_advisory_xact_lock'
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT {function}(%s, %s)", [PNL_LOCK_NAMESPACE, user_id % 2 ** 31])
+        return wait or cursor.fetchone()[0]
+
+
+def prune_checkpoints(user_id, exchange_type, asset, method):
+    # Оставляем последние CHECKPOINTS_KEPT снимков потока
+    stale = (
+        PnlCheckpoint.objects.filter(user_id=user_id, exchange_type=exchange_type, asset=asset, method=method)
+        .order_by('-position_at', '-position_id')
+        .values_list('pk', flat=True)[CHECKPOINTS_KEPT:]
+    )
+    PnlCheckpoint.objects.filter(pk__in=list(stale)).delete()
+
+
+def refresh_stream(user_id, exchange_type, asset, method, wait=False):
+    # Досчитывает поток от последнего снимка. Возвращает число обработанных ордеров.
+    # Если пересчёт пользователя уже идёт (и wait не задан), ничего не делает: читатель
+    # получит последние посчитанные цифры, их допишет тот, кто держит блокировку
+    with transaction.atomic():
+        if not lock_user(user_id, wait):
+            return 0
+        checkpoint = latest_checkpoint(user_id, exchange_type, asset, method)
+        orders = Order.objects.filter(user_id=user_id, exchange_type=exchange_type, asset=asset)
+        trades = RealizedTrade.objects.filter(user_id=user_id, exchange_type=exchange_type, asset=asset, method=method)
+        if checkpoint is None:
+            inventory = Inventory(method)
+            realized = ZERO
+            processed = 0
+        else:
+            inventory = Inventory(method, checkpoint.lots)
+            realized = checkpoint.realized_pnl
+            processed = checkpoint.orders_count
+            orders = orders.filter(after_position(checkpoint.position_at, checkpoint.position_id))
+            trades = trades.filter(after_position(checkpoint.position_at, checkpoint.position_id, id_field='order_id'))
+        # Сделки после снимка могли устареть — пересчитываем их заново
+        trades.delete()
+
+        rows = orders.order_by('created_at', 'id').values_list(*ORDER_FIELDS).iterator(chunk_size=PNL_BATCH_SIZE)
+        batch = []
+        since_checkpoint = 0
+        last = None
+
+        def save_checkpoint():
+            PnlCheckpoint.objects.create(
+                user_id=user_id, exchange_type=exchange_type, asset=asset, method=method,
+                position_at=last[1], position_id=last[0], lots=inventory.serialize(),
+                realized_pnl=realized, orders_count=processed,
+            )
+
+        for row in rows:
+            last = row
+            processed += 1
+            since_checkpoint += 1
+            trade = match_order(inventory, row)
+            if trade is not None:
+                realized += trade['pnl']
+                batch.append(RealizedTrade(
+                    user_id=user_id, method=method, exchange_type=exchange_type, asset=asset, **trade,
+                ))
+                if len(batch) >= PNL_BATCH_SIZE:
+                    RealizedTrade.objects.bulk_create(batch)
+                    batch = []
+            if since_checkpoint >= CHECKPOINT_EVERY:
+                # Снимок каждые CHECKPOINT_EVERY ордеров любой стороны: остаток лотов — после ордера last
+                save_checkpoint()
+                since_checkpoint = 0
+        RealizedTrade.objects.bulk_create(batch)
+
+        if since_checkpoint >= CHECKPOINT_MIN_ORDERS:
+            save_checkpoint()
+        prune_checkpoints(user_id, exchange_type, asset, method)
+        return processed - (checkpoint.orders_count if checkpoint else 0)
+
+
+def refresh(user_id, method=DEFAULT_METHOD, wait=False):
+    return sum(
+        refresh_stream(user_id, exchange_type, asset, method, wait=wait)
+        for exchange_type, asset in streams(user_id)
+    )
+
+
+def refresh_user(user_id):
+    # Все методы пользователя по очереди; параллельный пересчёт дождётся своей очереди
+    for method in PNL_METHODS:
+        refresh(user_id, method, wait=True)
+
+
+def schedule_refresh(user_id):
+    # Досчитать леджер после коммита записи ордеров: отчёт потом только читает.
+    # Ошибка пересчёта не должна ломать уже сохранённую запись — robust
+    transaction.on_commit(lambda: refresh_user(user_id), robust=True)
+
+
+def invalidate(user_id, since=None, exchange_type=None, asset=None):
+    # Ордер изменён/удалён/добавлен задним числом: снимки начиная с since больше не верны.
+    # Сделки удалит refresh, когда продолжит с оставшегося снимка
+    checkpoints = PnlCheckpoint.objects.filter(user_id=user_id)
+    if exchange_type is not None:
+        checkpoints = checkpoints.filter(exchange_type=exchange_type, asset=asset)
+    if since is not None:
+        checkpoints = checkpoints.filter(position_at__gte=since)
+    checkpoints.delete()
+
+
+def rebuild(user_id=None, method=None):
+    # Полный пересчёт (manage.py rebuild_pnl)
+    users = [user_id] if user_id else Order.objects.values_list('user_id', flat=True).distinct().order_by()
+    methods = [method] if method else PNL_METHODS
+    processed = 0
+    for uid in list(users):
+        invalidate(uid)
+        for name in methods:
+            processed += refresh(uid, name, wait=True)
+    return processed
+
+
+def realized_pnl(user_id, start, end, method=DEFAULT_METHOD):
+    # P&L за период [start, end) по дате продажи: один агрегат по готовым сделкам, без записи
+    return RealizedTrade.objects.filter(
+        user_id=user_id, method=method, created_at__gte=start, created_at__lt=end,
+    ).aggregate(
+        pnl=Sum('pnl', default=ZERO),
+        proceeds=Sum('proceeds', default=ZERO),
+        cost_basis=Sum('cost_basis', default=ZERO),
+        unmatched=Sum('unmatched_amount', default=ZERO),
+    )
@@ -0,0 +1,321 @@
+# orders/receipts.py
+# Фискальные чеки через облачную кассу Эвотора (transactional outbox).
+# Сохранение ордера только ставит ReceiptJob в очередь (в той же транзакции) —
+# чек пробивает воркер manage.py send_receipts: пачками по группам ККТ, в пределах
+# лимита запросов API, с повторами и ключом идемпотентности (external_id).
+import random
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .events import publish
+from .exchange_client import ExchangeClient, ExchangeError
+from .models import Order, ReceiptJob
+from .versions import bump_orders_version
+
+# Тип ордера -> операция чека в API (клиент платит нам при SELL — это приход, sell)
+RECEIPT_OPERATIONS = {
+    'SELL': 'sell',
+    'BUY': 'buy',
+}
+
+# Ошибки API, после которых повтор бесполезен (ошибки данных чека)
+RETRYABLE_ERROR_TYPES = {'system', 'unknown'}
+DUPLICATE_ERROR_CODE = 10
+TOKEN_TTL = 23 * 60 * 60  # токен живёт сутки, обновляем заранее
+
+
+def receipt_setting(name, default):
+    return getattr(settings, name, default)
+
+
+class ReceiptError(Exception):
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+# --- Постановка в очередь ---
+
+def receipts_enabled(user):
+    return bool(user.evotor_login and user.evotor_password and user.kkt_id)
+
+
+def build_payload(order, user, contact=None):
+    # Тело чека в формате API: снимок ордера на момент постановки в очередь
+    contact = contact or user.email or ''
+    client = {'email': contact} if '@' in contact else {'phone': contact}
+    total = float(order.cost)
+    return {
+        'timestamp': timezone.localtime(order.created_at).strftime('%d.%m.%Y %H:%M:%S'),
+        'receipt': {
+            'client': client,
+            'company': {
+                'email': user.email or '',
+                'inn': user.inn or '',
+                'sno': user.tax_type or '',
+                'payment_address': user.payment_address or '',
+            },
+            'items': [{
+                'name': f"{order.asset} (ордер {order.external_id or order.pk})",
+                'price': float(order.price),
+                'quantity': float(order.amount),
+                'sum': total,
+                'measure': 0,
+                'payment_method': 'full_payment',
+                'payment_object': 10,
+                'vat': {'type': 'none'},
+            }],
+            'payments': [{'type': 1, 'sum': total}],
+            'total': total,
+        },
+    }
+
+
+def enqueue_receipt(order, contact=None):
+    # Вызывается из post_save ордера, то есть внутри транзакции Order.save()
+    operations = receipt_setting('EVOTOR_RECEIPT_OPERATIONS', ['SELL'])
+    user = order.user
+    if order.operation_type not in operations or not receipts_enabled(user):
+        return None
+
+    job, created = ReceiptJob.objects.get_or_create(
+        idempotency_key=f'p2p-order-{order.pk}',
+        defaults={
+            'order': order,
+            'user': user,
+            'group_code': user.kkt_id,
+            'operation': RECEIPT_OPERATIONS[order.operation_type],
+            'payload': build_payload(order, user, contact),
+        },
+    )
+    if created:
+        Order.objects.filter(pk=order.pk).update(receipt_status='PENDING')
+        order.receipt_status = 'PENDING'
+    return job
+
+
+
+def enqueue_receipts(user, orders):
+    # То же для пачки ордеров, записанных bulk_create / ON CONFLICT (сигналы не сработали):
+    # один INSERT задач и один UPDATE статуса вместо запросов на каждый ордер
+    operations = receipt_setting('EVOTOR_RECEIPT_OPERATIONS', ['SELL'])
+    orders = [order for order in orders if order.operation_type in operations]
+    if not orders or not receipts_enabled(user):
+        return 0
+
+    jobs = ReceiptJob.objects.bulk_create([
+        ReceiptJob(
+            idempotency_key=f'p2p-order-{order.pk}',
+            order=order,
+            user=user,
+            group_code=user.kkt_id,
+            operation=RECEIPT_OPERATIONS[order.operation_type],
+            payload=build_payload(order, user),
+        )
+        for order in orders
+    ], ignore_conflicts=True)
+    Order.objects.filter(pk__in=[order.pk for order in orders], receipt_status='').update(receipt_status='PENDING')
+    return len(jobs)
+
+# --- Клиент API ---
+
+_clients = {}
+_tokens = {}
+_lock = threading.Lock()
+
+
+def evotor_client():
+    # Тот же HTTP-клиент, что и для бирж: пул соединений, лимит запросов
+    # (общий и на группу ККТ через api_key), повторы на 429/5xx
+    url = receipt_setting('EVOTOR_API_URL', 'https://fiscalization.evotor.ru/possystem/v4')
+    with _lock:
+        client = _clients.get(url)
+        if client is None:
+            config = {
+                'rate': receipt_setting('EVOTOR_RATE', 10), 'burst': receipt_setting('EVOTOR_BURST', 10),
+                'key_rate': receipt_setting('EVOTOR_GROUP_RATE', 5), 'key_burst': receipt_setting('EVOTOR_GROUP_BURST', 5),
+            }
+            config.update(receipt_setting('EVOTOR_CLIENT', {}))
+            client = _clients[url] = ExchangeClient('Evotor', url, **config)
+        return client
+
+
+def get_token(client, login, password, refresh=False):
+    key = (client.base_url, login)
+    with _lock:
+        cached = _tokens.get(key)
+    if cached and not refresh and cached[1] > time.monotonic():
+        return cached[0]
+
+    response = client.request('POST', '/getToken', lambda: {'json': {'login': login, 'pass': password}})
+    if response.status_code >= 400:
+        raise ReceiptError(f"Эвотор вернул код {response.status_code}", retryable=response.status_code >= 500 or response.status_code == 429)
+    data = response_json(response)
+    if not data.get('token'):
+        error = data.get('error') or {}
+        raise ReceiptError(f"Эвотор: нет токена ({error.get('text') or response.status_code})", retryable=False)
+    with _lock:
+        _tokens[key] = (data['token'], time.monotonic() + TOKEN_TTL)
+    return data['token']
+
+
+def response_json(response):
+    try:
+        return response.json()
+    except ValueError:
+        raise ReceiptError(f"Эвотор вернул код {response.status_code}")
+
+
+class EvotorSession:
+    # Запросы одной группы ККТ под токеном её владельца; на 401 токен обновляется один раз
+    def __init__(self, user, group_code):
+        self.client = evotor_client()
+        self.user = user
+        self.group_code = group_code
+        self.token = None
+
+    def request(self, method, path, body=None):
+        for attempt in range(2):
+            if self.token is None or attempt:
+                self.token = get_token(self.client, self.user.evotor_login, self.user.evotor_password, refresh=bool(attempt))
+
+            def prepare():
+                kwargs = {'headers': {'Token': self.token}}
+                if body is not None:
+                    kwargs['json'] = body
+                return kwargs
+
+            response = self.client.request(method, f'/{self.group_code}/{path}', prepare, api_key=self.group_code)
+            if response.status_code != 401:
+                break
+        data = response_json(response)
+        error = data.get('error')
+        # Ошибка внутри отчёта о непробитом документе (status=fail) разбирает вызывающий
+        if error and data.get('status') != 'fail' and not (error.get('code') == DUPLICATE_ERROR_CODE and data.get('uuid')):
+            retryable = response.status_code >= 500 or response.status_code == 429 or (
+                response.status_code < 400 and error.get('type') in RETRYABLE_ERROR_TYPES
+            )
+            raise ReceiptError(f"Эвотор: {error.get('text') or error.get('code')}", retryable=retryable)
+        if response.status_code >= 400:
+            raise ReceiptError(f"Эвотор вернул код {response.status_code}", retryable=response.status_code >= 500 or response.status_code == 429)
+        return data
+
+    def register(self, job):
+        # external_id = ключ идемпотентности: повтор после обрыва вернёт тот же документ
+        return self.request('POST', job.operation, {'external_id': job.idempotency_key, **job.payload})
+
+    def report(self, job):
+        return self.request('GET', f'report/{job.uuid}')
+
+
+# --- Воркер ---
+
+def retry_delay(attempts):
+    base = receipt_setting('RECEIPT_RETRY_BASE', 5)
+    delay = min(receipt_setting('RECEIPT_RETRY_MAX', 3600), base * 2 ** attempts)
+    return delay * random.uniform(0.5, 1)
+
+
+def claim_jobs(limit):
+    # Аренда как у синхронизации: следующая попытка отодвигается, пока задачу держит этот воркер
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(
+            ReceiptJob.objects.select_for_update(skip_locked=True, of=('self',))
+            .select_related('user')
+            .filter(status__in=['PENDING', 'SENT'], next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:limit]
+        )
+        ReceiptJob.objects.filter(pk__in=[job.pk for job in jobs]).update(
+            next_attempt_at=now + timedelta(seconds=receipt_setting('RECEIPT_LEASE', 120)),
+        )
+    return jobs
+
+
+def set_order_receipt(job, status, data=None):
+    # update() вместо save(): оборот и P&L от чека не зависят, версию для ETag поднимаем сами
+    Order.objects.filter(pk=job.order_id).update(receipt_status=status, receipt_data=data)
+    bump_orders_version(job.user_id)
+    publish(job.user_id, 'receipt', id=job.order_id, status=status)
+
+
+def save_job(job, **fields):
+    for name, value in fields.items():
+        setattr(job, name, value)
+    job.save(update_fields=[*fields, 'updated_at'])
+
+
+def process_job(session, job):
+    now = timezone.now()
+    try:
+        if job.status == 'PENDING':
+            data = session.register(job)
+            uuid = data.get('uuid') if isinstance(data, dict) else None
+            if not uuid:
+                # Документ мог и зарегистрироваться: повтор с тем же external_id вернёт его uuid
+                raise ReceiptError("Эвотор: в ответе нет uuid документа")
+            save_job(
+                job, status='SENT', uuid=uuid, last_error='',
+                next_attempt_at=now + timedelta(seconds=receipt_setting('EVOTOR_POLL_DELAY', 2)),
+            )
+            return
+
+        data = session.report(job)
+        if data.get('status') == 'done':
+            save_job(job, status='DONE', result=data.get('payload'), last_error='')
+            set_order_receipt(job, 'DONE', data.get('payload'))
+        elif data.get('status') == 'fail':
+            error = data.get('error') or {}
+            raise ReceiptError(f"Эвотор: документ не пробит ({error.get('text', 'без описания')})", retryable=False)
+        else:
+            save_job(job, next_attempt_at=now + timedelta(seconds=receipt_setting('EVOTOR_POLL_DELAY', 2)))
+    except (ReceiptError, ExchangeError) as e:
+        job_failed(job, e, getattr(e, 'retryable', True))
+
+
+def job_failed(job, error, retryable):
+    attempts = job.attempts + 1
+    retryable = retryable and attempts < receipt_setting('RECEIPT_MAX_ATTEMPTS', 8)
+    print(f"⚠️ Чек {job.idempotency_key}: {error}" + (" (повторим позже)" if retryable else ""))
+    if retryable:
+        next_attempt_at = timezone.now() + timedelta(seconds=retry_delay(attempts))
+        save_job(job, attempts=attempts, last_error=str(error), next_attempt_at=next_attempt_at)
+    else:
+        save_job(job, attempts=attempts, last_error=str(error), status='FAILED')
+        set_order_receipt(job, 'FAILED')
+
+
+def process_pending(limit=50):
+    jobs = claim_jobs(limit)
+    # Одна сессия (токен) на пользователя и группу ККТ; лимит запросов — на группу
+    groups = {}
+    for job in jobs:
+        groups.setdefault((job.user_id, job.group_code), []).append(job)
+    for group in groups.values():
+        session = EvotorSession(group[0].user, group[0].group_code)
+        for job in group:
+            try:
+                process_job(session, job)
+            except Exception as e:
+                # Неожиданная ошибка одной задачи не должна останавливать пачку: повтор по общему правилу
+                try:
+                    job_failed(job, f"Ошибка обработки: {e!r}", True)
+                except Exception as save_error:
+                    print(f"❌ Чек {job.idempotency_key}: {save_error}")
+    return len(jobs)
+
+
+def retry_failed():
+    # Вернуть упавшие чеки в очередь (после исправления данных в профиле)
+    jobs = ReceiptJob.objects.filter(status='FAILED')
+    rows = list(jobs.values_list('order_id', 'user_id'))
+    count = jobs.update(status='PENDING', attempts=0, next_attempt_at=timezone.now(), last_error='')
+    Order.objects.filter(pk__in=[order_id for order_id, _ in rows]).update(receipt_status='PENDING')
+    for user_id in {user_id for _, user_id in rows}:
+        bump_orders_version(user_id)
+    return count
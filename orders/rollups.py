@@ -0,0 +1,107 @@
+# orders/rollups.py
+# Дневной оборот (DailyTurnover): инкрементальное обновление при изменении ордера
+# и полная пересборка для бэкфилла (manage.py rebuild_turnover).
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailyTurnover, Order
+
+REBUILD_BATCH_SIZE = 1000
+
+
+def order_day(value):
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return timezone.localtime(value).date()
+
+
+def rollup_row(order):
+    # Ключ и значения строки оборота для ордера. Поля могут прийти строками из формы,
+    # поэтому приводим их так же, как это сделала бы сама модель при сохранении.
+    def clean(name):
+        return Order._meta.get_field(name).to_python(getattr(order, name))
+
+    amount = clean('amount') or Decimal(0)
+    cost = clean('cost') or Decimal(0)
+    commission = clean('commission') or Decimal(0)
+    if order.commission_type == 'PERCENT':
+        commission = cost * commission / 100
+
+    key = {
+        'user_id': order.user_id,
+        'day': order_day(clean('created_at')),
+        'exchange_type': order.exchange_type,
+        'operation_type': order.operation_type,
+        'bank_detail_id': order.bank_detail_id,
+    }
+    return key, {'amount_sum': amount, 'cost_sum': cost, 'commission_sum': commission, 'orders_count': 1}
+
+
+def apply_delta(key, values, sign):
+    deltas = {name: F(name) + value * sign for name, value in values.items()}
+    with transaction.atomic():
+        if DailyTurnover.objects.filter(**key).update(**deltas):
+            return
+        try:
+            with transaction.atomic():
+                DailyTurnover.objects.create(**key, **{name: value * sign for name, value in values.items()})
+        except IntegrityError:
+            # Строку успел создать параллельный запрос — просто прибавляем
+            DailyTurnover.objects.filter(**key).update(**deltas)
+
+
+def add_order(order):
+    apply_delta(*rollup_row(order), sign=1)
+
+
+def remove_order(order):
+    key, values = rollup_row(order)
+    apply_delta(key, values, sign=-1)
+    # Не копим пустые строки за дни, где ордеров больше нет
+    DailyTurnover.objects.filter(**key, orders_count__lte=0).delete()
+
+
+def rebuild_turnover(user_id=None, start=None, end=None):
+    # Пересобирает оборот за дни [start, end] (или за всё время) одним GROUP BY по Order
+    orders = Order.objects.all()
+    rollups = DailyTurnover.objects.all()
+    if user_id:
+        orders = orders.filter(user_id=user_id)
+        rollups = rollups.filter(user_id=user_id)
+
+    orders = orders.annotate(day=TruncDate('created_at'))
+    if start:
+        orders = orders.filter(day__gte=start)
+        rollups = rollups.filter(day__gte=start)
+    if end:
+        orders = orders.filter(day__lte=end)
+        rollups = rollups.filter(day__lte=end)
+
+    grouped = (
+        orders.values('user_id', 'day', 'exchange_type', 'operation_type', 'bank_detail_id')
+        .annotate(
+            amount_sum=Sum('amount'),
+            cost_sum=Sum('cost'),
+            commission_sum=Sum('commission_rub'),  # generated column, без CASE на каждой строке
+            orders_count=Count('id'),
+        )
+        .order_by()
+    )
+
+    created = 0
+    with transaction.atomic():
+        rollups.delete()
+        batch = []
+        for row in grouped.iterator(chunk_size=REBUILD_BATCH_SIZE):
+            batch.append(DailyTurnover(**row))
+            if len(batch) >= REBUILD_BATCH_SIZE:
+                DailyTurnover.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        DailyTurnover.objects.bulk_create(batch)
+        created += len(batch)
+    return created
@@ -0,0 +1,221 @@
+# orders/screenshots.py
+# Скриншоты ордеров: приём загрузки (хэш + дедупликация) и фоновая обработка
+# (manage.py process_screenshots): пережатие в WebP/AVIF с ограничением размера,
+# миниатюра для списков и хранение по хэшу содержимого.
+import hashlib
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+
+from .events import publish
+from .models import Order, OrderScreenshot
+from .versions import bump_orders_version
+
+# Формат -> расширение файла
+FORMAT_EXTENSIONS = {
+    'WEBP': 'webp',
+    'AVIF': 'avif',
+}
+
+
+def screenshot_setting(name, default):
+    return getattr(settings, name, default)
+
+
+def output_format():
+    # AVIF есть не в каждой сборке Pillow — тогда остаёмся на WebP
+    name = screenshot_setting('SCREENSHOT_FORMAT', 'WEBP').upper()
+    if name == 'AVIF' and not features.check('avif'):
+        return 'WEBP'
+    return name if name in FORMAT_EXTENSIONS else 'WEBP'
+
+
+def file_hash(file):
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in iter(lambda: file.read(64 * 1024), b''):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def content_path(content_hash, suffix, extension):
+    # screenshots/ab/cd/abcd...<suffix>.webp — одинаковые картинки ложатся в один файл
+    return f'screenshots/{content_hash[:2]}/{content_hash[2:4]}/{content_hash}{suffix}.{extension}'
+
+
+# --- Приём загрузки ---
+
+# Какую из уже загруженных копий брать за образец: обработанную, иначе ждущую обработки
+STATUS_PREFERENCE = ('READY', 'PENDING', 'FAILED')
+
+
+def attach_screenshot(order, upload):
+    # Сохраняет скриншот к ордеру. Повторная загрузка той же картинки файлов не плодит:
+    # берём файлы уже загруженной копии по хэшу (в любом статусе), а сырой файл не пишем вовсе.
+    # Ждущая копия ссылается на тот же исходник — обработка пережмёт его один раз для всех
+    content_hash = file_hash(upload)
+
+    shot = order.screenshots.filter(content_hash=content_hash).first()
+    if shot is None:
+        copies = {
+            copy.status: copy
+            for copy in OrderScreenshot.objects.filter(content_hash=content_hash).order_by('-id')
+        }
+        done = next((copies[status] for status in STATUS_PREFERENCE if status in copies), None)
+        if done is not None:
+            shot = OrderScreenshot.objects.create(
+                order=order,
+                image=done.image.name,
+                thumbnail=done.thumbnail.name,
+                content_hash=content_hash,
+                status=done.status,
+                width=done.width,
+                height=done.height,
+                size_bytes=done.size_bytes,
+                original_bytes=upload.size,
+                processed_at=None if done.status == 'PENDING' else timezone.now(),
+            )
+        else:
+            # Обработку сделает воркер, до тех пор ордер ссылается на исходный файл
+            shot = OrderScreenshot.objects.create(
+                order=order, image=upload, content_hash=content_hash, original_bytes=upload.size,
+            )
+
+    show_screenshot(order.pk, order.user_id, shot)
+    return shot
+
+
+def show_screenshot(order_id, user_id, shot):
+    # Ордер показывает последний загруженный скриншот. update() вместо save():
+    # оборот от скриншота не зависит, а версию для ETag поднимаем сами
+    Order.objects.filter(pk=order_id).update(
+        screenshot=shot.image.name,
+        screenshot_thumbnail=shot.thumbnail.name if shot.thumbnail else "",
+    )
+    bump_orders_version(user_id)
+    publish(user_id, 'screenshot', id=order_id, status=shot.status)
+
+
+def enqueue_legacy_screenshots():
+    # Скриншоты, загруженные до появления обработки, лежат только в Order.screenshot
+    orders = Order.objects.exclude(screenshot='').exclude(screenshot__isnull=True).filter(screenshots__isnull=True)
+    created = OrderScreenshot.objects.bulk_create([
+        OrderScreenshot(order_id=pk, image=name)
+        for pk, name in orders.values_list('id', 'screenshot').iterator()
+    ], batch_size=1000)
+    return len(created)
+
+
+# --- Обработка ---
+
+def render_image(image, max_side, image_format, quality):
+    image = image.copy()
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+    options = {'quality': quality}
+    if image_format == 'WEBP':
+        options['method'] = 6  # медленнее, но заметно меньше файл
+    buffer = BytesIO()
+    image.save(buffer, format=image_format, **options)
+    return image.size, buffer.getvalue()
+
+
+def save_content(path, data):
+    # Файл с тем же хэшем уже есть — значит он идентичен, второй раз не пишем
+    if not default_storage.exists(path):
+        default_storage.save(path, ContentFile(data))
+    return path
+
+
+def process_screenshot(shot):
+    image_format = output_format()
+    extension = FORMAT_EXTENSIONS[image_format]
+
+    with shot.image.open('rb') as source:
+        content_hash = shot.content_hash or file_hash(source)
+        original_bytes = shot.original_bytes or shot.image.size
+        image = Image.open(source)
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+        (width, height), data = render_image(
+            image,
+            screenshot_setting('SCREENSHOT_MAX_SIDE', 1920),
+            image_format,
+            screenshot_setting('SCREENSHOT_QUALITY', 80),
+        )
+        _, thumb = render_image(
+            image,
+            screenshot_setting('SCREENSHOT_THUMB_SIDE', 320),
+            image_format,
+            screenshot_setting('SCREENSHOT_THUMB_QUALITY', 70),
+        )
+
+    raw_name = shot.image.name
+    image_path = save_content(content_path(content_hash, '', extension), data)
+    thumb_path = save_content(content_path(content_hash, '_thumb', extension), thumb)
+
+    shot.image.name = image_path
+    shot.thumbnail.name = thumb_path
+    shot.content_hash = content_hash
+    shot.width, shot.height = width, height
+    shot.size_bytes = len(data)
+    shot.original_bytes = original_bytes
+    shot.status = 'READY'
+    shot.processed_at = timezone.now()
+    shot.save()
+
+    # Копии той же картинки, загруженные к другим ордерам до конца обработки, делят исходник
+    siblings = list(OrderScreenshot.objects.filter(content_hash=content_hash, status='PENDING').exclude(pk=shot.pk))
+    OrderScreenshot.objects.filter(pk__in=[sibling.pk for sibling in siblings]).update(
+        image=image_path, thumbnail=thumb_path, status='READY', width=width, height=height,
+        size_bytes=shot.size_bytes, processed_at=shot.processed_at,
+    )
+
+    # Ордер, у которого этот скриншот последний, переключаем на пережатый файл и миниатюру
+    raw_names = {raw_name, *(sibling.image.name for sibling in siblings)} - {image_path}
+    for order_id in {shot.order_id, *(sibling.order_id for sibling in siblings)}:
+        order = Order.objects.filter(pk=order_id).values('user_id', 'screenshot').first()
+        if order and order['screenshot'] in raw_names | {image_path}:
+            show_screenshot(order_id, order['user_id'], shot)
+
+    # Исходник больше не нужен, если на него никто не ссылается. Удаляем после коммита:
+    # при откате строки снова указывают на исходник, и он должен остаться на месте
+    for name in raw_names:
+        if not (OrderScreenshot.objects.filter(image=name).exists() or Order.objects.filter(screenshot=name).exists()):
+            transaction.on_commit(lambda name=name: default_storage.delete(name))
+    return shot
+
+
+def process_next():
+    # Берём один скриншот под блокировкой строки: параллельные воркеры его пропустят
+    with transaction.atomic():
+        shot = (
+            OrderScreenshot.objects.select_for_update(skip_locked=True)
+            .filter(status='PENDING')
+            .order_by('id')
+            .first()
+        )
+        if shot is None:
+            return None
+        try:
+            with transaction.atomic():
+                process_screenshot(shot)
+        except Exception as e:
+            # Не картинка (PDF) или битый файл — оставляем исходник как есть
+            print(f"⚠️ Скриншот {shot.pk} не обработан: {e}")
+            OrderScreenshot.objects.filter(pk=shot.pk).update(status='FAILED', processed_at=timezone.now())
+        return shot
+
+
+def process_pending(limit=20):
+    processed = 0
+    while processed < limit and process_next() is not None:
+        processed += 1
+    return processed
@@ -0,0 +1,71 @@
+# orders/search.py
+# Живой поиск пользователей для админки: точный ID -> префикс логина -> нечёткое совпадение (pg_trgm).
+# Префикс идёт по индексу lower(username) varchar_pattern_ops, нечёткий поиск — по GIN gin_trgm_ops.
+from django.core.cache import cache
+from django.db import connection
+from django.db.models.functions import Length, Lower
+
+from .models import User
+
+SEARCH_LIMIT = 10
+SEARCH_CACHE_TTL = 30  # секунд: хватает, чтобы пережить набор/стирание символов в поле поиска
+TRIGRAM_MIN_LENGTH = 3  # у более коротких строк почти нет триграмм — только префикс
+
+
+def search_cache_key(query, limit=SEARCH_LIMIT):
+    return f'user_search:{limit}:{query.strip().lower()}'
+
+
+def search_users(query, limit=SEARCH_LIMIT):
+    query = query.strip()
+    if not query:
+        return []
+
+    key = search_cache_key(query, limit)
+    results = cache.get(key)
+    if results is None:
+        results = find_users(query, limit)
+        cache.set(key, results, SEARCH_CACHE_TTL)
+    return results
+
+
+def find_users(query, limit):
+    lowered = query.lower()
+    found = []
+    seen = set()
+
+    def add(rows):
+        for pk, username in rows:
+            if pk not in seen and len(found) < limit:
+                seen.add(pk)
+                found.append({'id': pk, 'username': username})
+
+    users = User.objects.annotate(username_lower=Lower('username'))
+
+    # 1. Точный ID — одним поиском по первичному ключу
+    if query.isdigit():
+        add(users.filter(pk=int(query)).values_list('id', 'username'))
+
+    # 2. Префикс логина: короткие (более точные) совпадения выше
+    add(
+        users.filter(username_lower__startswith=lowered)
+        .order_by(Length('username'), 'username_lower')
+        .values_list('id', 'username')[:limit]
+    )
+
+    # 3. Нечёткое совпадение по триграммам, по убыванию похожести
+    if len(found) < limit and len(query) >= TRIGRAM_MIN_LENGTH:
+        if connection.vendor == 'postgresql':
+            from django.contrib.postgres.search import TrigramSimilarity
+
+            fuzzy = (
+                users.filter(username_lower__trigram_similar=lowered)
+                .annotate(similarity=TrigramSimilarity('username_lower', lowered))
+                .order_by('-similarity', 'username_lower')
+            )
+        else:
+            # Локальная разработка без PostgreSQL
+            fuzzy = users.filter(username_lower__contains=lowered).order_by('username_lower')
+        add(fuzzy.exclude(pk__in=seen).values_list('id', 'username')[:limit])
+
+    return found
@@ -1,9 +1,26 @@
 import time
 import hmac
+import base64
 import hashlib
-import requests
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone as dt_timezone
-from .models import Order, UnprocessedOrder
+from urllib.parse import urlencode
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone as dj_timezone
+from .events import publish
+from .models import Order, UnprocessedOrder, SyncCursor
+from .exchange_client import ExchangeError, get_client
+
+DAY_MS = 24 * 60 * 60 * 1000
+MIN_WINDOW_MS = 60 * 1000  # уже окно при сужении не делаем
+
+# Как биржа записана в Order.exchange_type (форма) для кода биржи из UnprocessedOrder
+ORDER_EXCHANGE_NAMES = {
+    'BYBIT': 'Bybit',
+    'HTX': 'HTX',
+    'MEXC': 'MEXC',
+}
 
 def generate_signature(api_secret, payload):
     return hmac.new(
@@ -12,95 +29,424 @@ def generate_signature(api_secret, payload):
         hashlib.sha256
     ).hexdigest()
 
-def sync_bybit_orders(user):
-    if not user.bybit_api_key or not user.bybit_api_secret:
-        return {"status": "warning", "message": "Ключи не настроены"}
+def timestamp_to_datetime(ts_ms):
+    return datetime.fromtimestamp(int(ts_ms) / 1000, tz=dt_timezone.utc)
 
-    api_key = user.bybit_api_key
-    api_secret = user.bybit_api_secret
-    
-    # Используем основной домен
-    base_url = "https://api.bybit.com"
-    endpoint = "/v5/fiat/order-record"
-    
-    timestamp = str(int(time.time() * 1000))
-    recv_window = "10000"
-    params = "limit=50"
-
-    # Подпись для GET: timestamp + api_key + recv_window + queryString
-    signature_payload = timestamp + api_key + recv_window + params
-    signature = generate_signature(api_secret, signature_payload)
-
-    headers = {
-        'X-BAPI-API-KEY': api_key,
-        'X-BAPI-SIGN': signature,
-        'X-BAPI-TIMESTAMP': timestamp,
-        'X-BAPI-RECV-WINDOW': recv_window,
-        # Добавляем User-Agent, чтобы Bybit не блокировал запрос как бота
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-    }
+def ingest_unprocessed_orders(user, exchange_type, rows):
+    # Одна страница биржи = один запрос на поиск уже известных ID + один bulk INSERT
+    rows = {row['order_id']: row for row in rows}
+    if not rows:
+        return 0
 
-    try:
-        url = f"{base_url}{endpoint}?{params}"
-        print(f"\n🚀 Запрос к: {url}")
-        
-        response = requests.get(url, headers=headers, timeout=15)
-        
+    ids = list(rows)
+    known = set(
+        Order.objects.filter(
+            user=user, exchange_type=ORDER_EXCHANGE_NAMES[exchange_type], external_id__in=ids
+        ).values_list('external_id', flat=True)
+    )
+    known.update(
+        UnprocessedOrder.objects.filter(
+            user=user, exchange_type=exchange_type, order_id__in=ids
+        ).values_list('order_id', flat=True)
+    )
+
+    new_orders = [
+        UnprocessedOrder(user=user, exchange_type=exchange_type, **row)
+        for order_id, row in rows.items() if order_id not in known
+    ]
+    # ignore_conflicts страхует от гонки двух синхронизаций (уникальный индекс в БД)
+    UnprocessedOrder.objects.bulk_create(new_orders, ignore_conflicts=True)
+    if new_orders:
+        publish(user.pk, 'unprocessed', exchange=exchange_type, count=len(new_orders))
+    return len(new_orders)
+
+
+#КОННЕКТОРЫ БИРЖ____________________________________________________________________________________________________________________
+
+class ExchangeConnector:
+    # Коннектор умеет одно: отдать страницу истории P2P-ордеров за окно времени
+    # в виде словарей для UnprocessedOrder. Всё остальное (окна, водяные знаки,
+    # дедупликация) общее и живёт в sync_exchange_orders.
+    exchange_type = None
+    title = None
+    key_fields = ()  # поля User с ключом и секретом API
+
+    def is_configured(self, user):
+        return all(getattr(user, field) for field in self.key_fields)
+
+    def fetch_page(self, user, start_ms, end_ms, cursor):
+        # Возвращает (строки, курсор следующей страницы или None)
+        raise NotImplementedError
+
+    def response_json(self, response):
         # Если статус не 200, выводим причину
         if response.status_code != 200:
             print(f"❌ Ошибка сервера: Код {response.status_code}")
             print(f"📝 Текст ошибки: {response.text[:500]}")
-            return {"status": "error", "message": f"Bybit вернул код {response.status_code}"}
+            raise ExchangeError(f"{self.title} вернул код {response.status_code}")
 
         # Проверка на пустой ответ
         if not response.text:
             print("❌ Ошибка: Сервер вернул пустой ответ (Empty body)")
-            return {"status": "error", "message": "Пустой ответ от сервера"}
+            raise ExchangeError("Пустой ответ от сервера")
 
         try:
-            res = response.json()
+            return response.json()
         except Exception as e:
             print(f"❌ Ошибка декодирования JSON: {e}")
             print(f"📝 Текст ответа (первые 300 симв): {response.text[:300]}")
-            return {"status": "error", "message": "Ошибка формата данных"}
-
-        if res.get('retCode') == 0:
-            order_list = res.get('result', {}).get('list', [])
-            print(f"✅ Успешно! Найдено записей: {len(order_list)}")
-            
-            count_new = 0
-            for item in order_list:
-                order_id = str(item.get('orderId'))
-                
-                # Фильтруем только P2P (длинные числовые ID)
-                if not order_id.isdigit() or len(order_id) < 10:
-                    continue
+            raise ExchangeError("Ошибка формата данных")
+
+
+class BybitConnector(ExchangeConnector):
+    exchange_type = 'BYBIT'
+    title = 'Bybit'
+    endpoint = "/v5/fiat/order-record"
+    recv_window = "10000"
+
+    # Bybit: неверный timestamp/recv_window — часы разъехались, пересинхронизируем
+    TIMESTAMP_ERROR = 10002
+    key_fields = ('bybit_api_key', 'bybit_api_secret')
+
+    def get(self, user, endpoint, params):
+        api_key = user.bybit_api_key
+        api_secret = user.bybit_api_secret
+        client = get_client(self.exchange_type)
+        query = urlencode(params)
 
-                if Order.objects.filter(external_id=order_id).exists(): continue
-                if UnprocessedOrder.objects.filter(order_id=order_id).exists(): continue
-
-                # Маппинг данных
-                side = item.get('side', 'BUY').upper()
-                amount = float(item.get('amount', 0))
-                price = float(item.get('price', 0))
-                ts = int(item.get('createTime', time.time()*1000)) / 1000
-                
-                UnprocessedOrder.objects.create(
-                    user=user,
-                    order_id=order_id,
-                    operation_type=side,
-                    amount=amount,
-                    price=price,
-                    created_at=datetime.fromtimestamp(ts, tz=dt_timezone.utc),
-                    exchange_type='BYBIT'
-                )
-                count_new += 1
-            
-            return {"status": "success", "message": f"Обновлено. Добавлено: {count_new}"}
-        else:
+        def prepare():
+            # Время берём по часам биржи, чтобы подпись не отклонялась из-за расхождения часов
+            timestamp = str(client.now_ms())
+
+            # Подпись для GET: timestamp + api_key + recv_window + queryString
+            signature_payload = timestamp + api_key + self.recv_window + query
+            signature = generate_signature(api_secret, signature_payload)
+
+            return {
+                'params': query,
+                'headers': {
+                    'X-BAPI-API-KEY': api_key,
+                    'X-BAPI-SIGN': signature,
+                    'X-BAPI-TIMESTAMP': timestamp,
+                    'X-BAPI-RECV-WINDOW': self.recv_window,
+                },
+            }
+
+        print(f"\n🚀 Запрос к: {client.base_url}{endpoint}?{query}")
+
+        for attempt in range(2):
+            res = self.response_json(client.request('GET', endpoint, prepare=prepare, api_key=api_key))
+            if res.get('retCode') == self.TIMESTAMP_ERROR and attempt == 0:
+                client.invalidate_clock()
+                continue
+            break
+
+        if res.get('retCode') != 0:
             print(f"⚠️ Bybit Error: {res.get('retMsg')} ({res.get('retCode')})")
-            return {"status": "error", "message": res.get('retMsg')}
+            raise ExchangeError(res.get('retMsg'))
+
+        return res.get('result') or {}
+
+    def parse_item(self, item):
+        order_id = str(item.get('orderId'))
+
+        # Фильтруем только P2P (длинные числовые ID)
+        if not order_id.isdigit() or len(order_id) < 10:
+            return None
+
+        # Маппинг данных
+        return {
+            'order_id': order_id,
+            'operation_type': item.get('side', 'BUY').upper(),
+            'amount': float(item.get('amount', 0)),
+            'price': float(item.get('price', 0)),
+            'created_at': timestamp_to_datetime(item.get('createTime', time.time()*1000)),
+        }
+
+    def fetch_page(self, user, start_ms, end_ms, cursor):
+        params = [('startTime', start_ms), ('endTime', end_ms), ('limit', sync_setting('ORDERS_SYNC_PAGE_SIZE', 50))]
+        if cursor:
+            params.append(('cursor', cursor))
+
+        result = self.get(user, self.endpoint, params)
+        rows = [row for row in (self.parse_item(item) for item in result.get('list') or []) if row]
+        return rows, result.get('nextPageCursor') or None
+
+
+class HtxConnector(ExchangeConnector):
+    # Подпись HTX (Huobi) v2: base64(HMAC-SHA256("GET\nhost\npath\nотсортированные параметры"))
+    exchange_type = 'HTX'
+    title = 'HTX'
+    endpoint = "/v1/otc/order/list"
+    key_fields = ('htx_access_key', 'htx_private_key')
+
+    def fetch_page(self, user, start_ms, end_ms, cursor):
+        client = get_client(self.exchange_type)
+        page = int(cursor or 1)
+        page_size = sync_setting('ORDERS_SYNC_PAGE_SIZE', 50)
+        host = client.base_url.split('://', 1)[-1]
+
+        def prepare():
+            params = {
+                'AccessKeyId': user.htx_access_key,
+                'SignatureMethod': 'HmacSHA256',
+                'SignatureVersion': '2',
+                'Timestamp': datetime.fromtimestamp(client.now_ms() / 1000, tz=dt_timezone.utc).strftime('%Y-%m-%dT%H:%M:%S'),
+                'startTime': start_ms,
+                'endTime': end_ms,
+                'page': page,
+                'size': page_size,
+            }
+            query = urlencode(sorted(params.items()))
+            payload = f"GET\n{host}\n{self.endpoint}\n{query}"
+            digest = hmac.new(user.htx_private_key.encode('utf-8'), payload.encode('utf-8'), hashlib.sha256).digest()
+            return {'params': query + '&' + urlencode({'Signature': base64.b64encode(digest).decode()})}
+
+        print(f"\n🚀 Запрос к: {client.base_url}{self.endpoint} (страница {page})")
+        res = self.response_json(client.request('GET', self.endpoint, prepare=prepare, api_key=user.htx_access_key))
+
+        if res.get('status') == 'error' or res.get('code') not in (None, 200):
+            message = res.get('err-msg') or res.get('message') or 'Ошибка HTX'
+            print(f"⚠️ HTX Error: {message}")
+            raise ExchangeError(message)
+
+        items = res.get('data') or []
+        if isinstance(items, dict):
+            items = items.get('list') or []
+
+        rows = []
+        for item in items:
+            order_id = str(item.get('orderNo') or item.get('orderId') or item.get('id') or '')
+            if not order_id:
+                continue
+            rows.append({
+                'order_id': order_id,
+                'operation_type': str(item.get('side') or item.get('tradeType') or 'BUY').upper(),
+                'amount': float(item.get('quantity') or item.get('amount') or 0),
+                'price': float(item.get('price') or 0),
+                'created_at': timestamp_to_datetime(item.get('gmtCreate') or item.get('createTime') or time.time()*1000),
+            })
+
+        return rows, (str(page + 1) if len(items) >= page_size else None)
+
+
+class MexcConnector(ExchangeConnector):
+    # Подпись MEXC: hex(HMAC-SHA256(queryString)), ключ в заголовке X-MEXC-APIKEY
+    exchange_type = 'MEXC'
+    title = 'MEXC'
+    endpoint = "/api/v3/c2c/order/list"
+    key_fields = ('mexc_api_key', 'mexc_api_secret')
 
+    def fetch_page(self, user, start_ms, end_ms, cursor):
+        client = get_client(self.exchange_type)
+        page = int(cursor or 1)
+        page_size = sync_setting('ORDERS_SYNC_PAGE_SIZE', 50)
+
+        def prepare():
+            query = urlencode([
+                ('startTime', start_ms),
+                ('endTime', end_ms),
+                ('page', page),
+                ('limit', page_size),
+                ('recvWindow', 10000),
+                ('timestamp', client.now_ms()),
+            ])
+            signature = generate_signature(user.mexc_api_secret, query)
+            return {
+                'params': f"{query}&signature={signature}",
+                'headers': {'X-MEXC-APIKEY': user.mexc_api_key},
+            }
+
+        print(f"\n🚀 Запрос к: {client.base_url}{self.endpoint} (страница {page})")
+        res = self.response_json(client.request('GET', self.endpoint, prepare=prepare, api_key=user.mexc_api_key))
+
+        if isinstance(res, dict) and res.get('code') not in (None, 0, 200):
+            print(f"⚠️ MEXC Error: {res.get('msg')} ({res.get('code')})")
+            raise ExchangeError(res.get('msg') or 'Ошибка MEXC')
+
+        items = res.get('data') if isinstance(res, dict) else res
+        if isinstance(items, dict):
+            items = items.get('list') or items.get('resultList') or []
+        items = items or []
+
+        rows = []
+        for item in items:
+            order_id = str(item.get('orderId') or item.get('id') or '')
+            if not order_id:
+                continue
+            rows.append({
+                'order_id': order_id,
+                'operation_type': str(item.get('side') or item.get('tradeType') or 'BUY').upper(),
+                'amount': float(item.get('quantity') or item.get('amount') or 0),
+                'price': float(item.get('price') or 0),
+                'created_at': timestamp_to_datetime(item.get('createTime') or time.time()*1000),
+            })
+
+        return rows, (str(page + 1) if len(items) >= page_size else None)
+
+
+CONNECTORS = {
+    connector.exchange_type: connector
+    for connector in (BybitConnector(), HtxConnector(), MexcConnector())
+}
+
+def enabled_connectors():
+    # Эндпоинты и поля HTX/MEXC не сверены с живыми ответами бирж, поэтому по умолчанию
+    # синхронизируется только Bybit; остальные включаются в ORDERS_SYNC_EXCHANGES после проверки
+    names = sync_setting('ORDERS_SYNC_EXCHANGES', ['BYBIT'])
+    return [connector for exchange_type, connector in CONNECTORS.items() if exchange_type in names]
+
+def configured_connectors(user):
+    return [connector for connector in enabled_connectors() if connector.is_configured(user)]
+
+
+#СИНХРОНИЗАЦИЯ____________________________________________________________________________________________________________________
+
+def sync_setting(name, default):
+    return getattr(settings, name, default)
+
+def fetch_window(user, connector, start_ms, end_ms):
+    # Все страницы одного окна [start_ms, end_ms] по курсору; возвращает (новых, страниц, прочитано ли окно целиком).
+    # Если упёрлись в ORDERS_SYNC_MAX_WINDOW_PAGES, а курсор ещё есть — окно прочитано не полностью
+    count_new = 0
+    pages = 0
+    cursor = None
+
+    while pages < sync_setting('ORDERS_SYNC_MAX_WINDOW_PAGES', 200):
+        rows, cursor = connector.fetch_page(user, start_ms, end_ms, cursor)
+        pages += 1
+        print(f"✅ {connector.title}: получено записей: {len(rows)}")
+
+        count_new += ingest_unprocessed_orders(user, connector.exchange_type, rows)
+        if not cursor:
+            break
+
+    return count_new, pages, not cursor
+
+def narrow_window(window_ms, connector, minimum_ms=MIN_WINDOW_MS):
+    # Окно не поместилось в лимит страниц: водяной знак не двигаем, читаем его заново вдвое уже.
+    # Уже прочитанные страницы не задвоятся — ingest_unprocessed_orders пропускает известные ордера.
+    # Минимальное окно с сотнями страниц — это уже зацикленный курсор, а не данные: принимаем как есть
+    if window_ms <= minimum_ms:
+        print(f"⚠️ {connector.title}: окно не дочитано и в минимальном размере, курсор биржи, похоже, зациклен")
+        return None
+    return max(window_ms // 2, minimum_ms)
+
+def sync_exchange_orders(user, connector):
+    if not connector.is_configured(user):
+        return {"status": "warning", "message": "Ключи не настроены"}
+
+    sync_cursor, _ = SyncCursor.objects.get_or_create(user=user, exchange_type=connector.exchange_type)
+
+    window_ms = sync_setting('ORDERS_SYNC_WINDOW_DAYS', 7) * DAY_MS
+    overlap_ms = sync_setting('ORDERS_SYNC_OVERLAP_SECONDS', 300) * 1000
+    history_start_ms = int(time.time() * 1000) - sync_setting('ORDERS_SYNC_HISTORY_DAYS', 180) * DAY_MS
+    budget = sync_setting('ORDERS_SYNC_MAX_PAGES', 20)
+    count_new = 0
+
+    try:
+        # Первая синхронизация: история выгружена "от текущего момента", дальше идём назад
+        if sync_cursor.high_water_ms is None:
+            now_ms = int(time.time() * 1000)
+            sync_cursor.high_water_ms = now_ms
+            sync_cursor.low_water_ms = now_ms
+            sync_cursor.save()
+
+        # 1. Новые ордера: окнами вперёд от водяного знака до текущего момента
+        forward_ms = window_ms
+        while budget > 0:
+            now_ms = int(time.time() * 1000)
+            start_ms = sync_cursor.high_water_ms - overlap_ms
+            end_ms = min(start_ms + forward_ms, now_ms)
+
+            added, pages, complete = fetch_window(user, connector, start_ms, end_ms)
+            count_new += added
+            budget -= pages
+            if not complete:
+                # Окно начинается с перекрытия: короче него не сужаем, иначе водяной знак поедет назад
+                forward_ms = narrow_window(end_ms - start_ms, connector, overlap_ms + MIN_WINDOW_MS)
+                if forward_ms:
+                    continue
+
+            sync_cursor.high_water_ms = end_ms
+            sync_cursor.save(update_fields=['high_water_ms', 'updated_at'])
+            forward_ms = window_ms
+            if end_ms == now_ms:
+                break
+
+        # 2. Догрузка истории: окнами назад, пока не упрёмся в глубину истории
+        backward_ms = window_ms
+        while budget > 0 and not sync_cursor.backfill_done:
+            end_ms = sync_cursor.low_water_ms
+            start_ms = max(end_ms - backward_ms, history_start_ms)
+
+            added, pages, complete = fetch_window(user, connector, start_ms, end_ms)
+            count_new += added
+            budget -= pages
+            if not complete:
+                backward_ms = narrow_window(end_ms - start_ms, connector)
+                if backward_ms:
+                    continue
+
+            sync_cursor.low_water_ms = start_ms
+            sync_cursor.backfill_done = start_ms <= history_start_ms
+            sync_cursor.save(update_fields=['low_water_ms', 'backfill_done', 'updated_at'])
+            backward_ms = window_ms
+
+    except ExchangeError as e:
+        return {"status": "error", "message": str(e)}
+
+    message = f"Обновлено. Добавлено: {count_new}"
+    if not sync_cursor.backfill_done:
+        message += " (загрузка истории продолжается)"
+    return {"status": "success", "message": message}
+
+def sync_bybit_orders(user):
+    return sync_exchange_orders(user, CONNECTORS['BYBIT'])
+
+def _sync_in_thread(user, connector):
+    try:
+        return sync_exchange_orders(user, connector)
     except Exception as e:
-        print(f"❌ Ошибка соединения: {str(e)}")
-        return {"status": "error", "message": "Не удалось связаться с Bybit"}
\ No newline at end of file
+        print(f"❌ {connector.title}: {e}")
+        return {"status": "error", "message": f"Ошибка синхронизации: {e}"}
+    finally:
+        # У каждого потока своё соединение с БД — закрываем, чтобы не копились
+        connection.close()
+
+def streamed_exchanges(user):
+    # Биржи, ордера которых сейчас приходят через поток WebSocket (orders/streams.py)
+    return set(
+        SyncCursor.objects.filter(user=user, stream_until__gt=dj_timezone.now()).values_list('exchange_type', flat=True)
+    )
+
+def sync_user_orders(user):
+    # Все настроенные биржи пользователя опрашиваются параллельно:
+    # общее время синхронизации = время самой медленной биржи, а не сумма
+    connectors = configured_connectors(user)
+    if not connectors:
+        return {"status": "warning", "message": "Ключи не настроены", "exchanges": {}}
+
+    streamed = streamed_exchanges(user)
+    results = {
+        connector.exchange_type: {"status": "success", "message": "Обновляется в реальном времени"}
+        for connector in connectors if connector.exchange_type in streamed
+    }
+    connectors = [connector for connector in connectors if connector.exchange_type not in streamed]
+    if connectors:
+        with ThreadPoolExecutor(max_workers=len(connectors)) as pool:
+            futures = {connector: pool.submit(_sync_in_thread, user, connector) for connector in connectors}
+            results.update({connector.exchange_type: future.result() for connector, future in futures.items()})
+
+    statuses = {result['status'] for result in results.values()}
+    if statuses == {'success'}:
+        status = 'success'
+    elif 'success' in statuses:
+        status = 'warning'
+    else:
+        status = 'error'
+
+    message = "; ".join(
+        f"{CONNECTORS[exchange].title}: {result['message']}" for exchange, result in results.items()
+    )
+    return {"status": status, "message": message, "exchanges": results}
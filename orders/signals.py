@@ -0,0 +1,90 @@
+# orders/signals.py
+import datetime
+
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import events, pnl, receipts, rollups
+from .models import BankDetail, Order, OrderScreenshot, RealizedTrade
+from .versions import bump_details_version, bump_orders_version
+
+
+@receiver(pre_save, sender=Order)
+def remember_previous_order(sender, instance, raw=False, **kwargs):
+    # Запоминаем старую версию ордера, чтобы вычесть её из дневного оборота
+    instance._previous = None
+    if instance.pk and not raw:
+        instance._previous = Order.objects.filter(pk=instance.pk).first()
+    if instance._previous is not None:
+        instance.version = instance._previous.version + 1
+
+
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous', None)
+    if previous is not None:
+        rollups.remove_order(previous)
+        pnl_order_removed(previous)
+    rollups.add_order(instance)
+    if created:
+        # Задача на чек — в той же транзакции, что и ордер (Order.save); пробьёт воркер
+        receipts.enqueue_receipt(instance)
+    pnl.invalidate(instance.user_id, instance.created_at, instance.exchange_type, instance.asset)
+    pnl.schedule_refresh(instance.user_id)
+    bump_orders_version(instance.user_id)
+    events.publish(
+        instance.user_id, 'order', id=instance.pk, orderId=instance.external_id, version=instance.version, created=created,
+    )
+
+
+@receiver(post_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+    rollups.remove_order(instance)
+    pnl_order_removed(instance)
+    pnl.schedule_refresh(instance.user_id)
+    bump_orders_version(instance.user_id)
+    events.publish(instance.user_id, 'order', id=instance.pk, orderId=instance.external_id, deleted=True)
+
+
+def pnl_order_removed(order):
+    # Старая версия ордера уходит из своего потока P&L (биржа/актив могли смениться)
+    RealizedTrade.objects.filter(order_id=order.pk).delete()
+    pnl.invalidate(order.user_id, order.created_at, order.exchange_type, order.asset)
+
+
+@receiver(post_save, sender=OrderScreenshot)
+@receiver(post_delete, sender=OrderScreenshot)
+def order_screenshot_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_orders_version(instance.order.user_id)
+
+
+@receiver(post_save, sender=BankDetail)
+def bank_detail_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_details_version(instance.user_id)
+
+
+@receiver(post_delete, sender=BankDetail)
+def bank_detail_deleted(sender, instance, **kwargs):
+    # Строки оборота этого банка удалены каскадом, а ордера остались без банка — пересобираем
+    rollups.rebuild_turnover(user_id=instance.user_id)
+    bump_details_version(instance.user_id)
+
+
+def orders_bulk_changed(user_id, start=None, end=None):
+    # bulk_create/COPY/update() сигналов не шлют: пересобираем оборот за затронутые дни
+    # и поднимаем версию ордеров для ETag вручную
+    rollups.rebuild_turnover(user_id=user_id, start=start, end=end)
+    pnl.invalidate(user_id, since=day_start(start) if start else None)
+    pnl.schedule_refresh(user_id)
+    bump_orders_version(user_id)
+    # Клиентам — одно событие на пачку: перечитать список
+    events.publish(user_id, 'orders')
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time()))
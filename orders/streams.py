@@ -0,0 +1,292 @@
+# orders/streams.py
+# Ордера Bybit в реальном времени (manage.py bybit_stream): один процесс держит открытыми
+# приватные WebSocket-соединения многих пользователей и обслуживает их в одном потоке через select().
+#
+# В приватном потоке v5 нет темы для P2P-ордеров: темы BYBIT_STREAM_TOPICS (спот, деривативы,
+# единый счёт) P2P-сделок не несут — они проходят по Funding-счёту. Событие пользователя — лишь
+# повод догрузить новые ордера по REST раньше (sync_exchange_orders от водяного знака SyncCursor:
+# обычно одна страница). Та же догрузка закрывает пропуск после переподключения, а главное —
+# идёт не реже раза в ORDERS_SYNC_INTERVAL (BYBIT_STREAM_SAFETY_INTERVAL больше него не бывает).
+# Пока поток жив, он продлевает SyncCursor.stream_until, и опрос по расписанию Bybit пропускает:
+# поток берёт опрос на себя, поэтому новые ордера приходят не позже, чем при опросе.
+import hashlib
+import hmac
+import json
+import random
+import selectors
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+from .exchange_client import get_client
+from .models import SyncCursor, User
+from .services import CONNECTORS, sync_exchange_orders
+from .sync import has_keys, sync_interval
+
+EXCHANGE_TYPE = 'BYBIT'
+AUTH_EXPIRES_MS = 10000
+CONNECTS_PER_TICK = 20  # новые соединения за один проход цикла: остальные потоки не ждут рукопожатий
+
+
+def stream_setting(name, default):
+    return getattr(settings, name, default)
+
+
+def auth_message(api_key, api_secret, expires_ms):
+    # Подпись авторизации приватного потока: HMAC-SHA256("GET/realtime" + expires)
+    signature = hmac.new(api_secret.encode(), f"GET/realtime{expires_ms}".encode(), hashlib.sha256).hexdigest()
+    return {'op': 'auth', 'args': [api_key, expires_ms, signature]}
+
+
+def open_socket(url, timeout):
+    # websocket-client из requirements.txt; импорт здесь, чтобы остальной код (и тесты) без него работали
+    import websocket
+    return websocket.create_connection(url, timeout=timeout, enable_multithread=True)
+
+
+def fetch_new_orders(user_id):
+    # Выполняется в пуле потоков: у каждого потока своё соединение с БД
+    try:
+        user = User.objects.get(pk=user_id)
+        result = sync_exchange_orders(user, CONNECTORS[EXCHANGE_TYPE])
+        if result['status'] != 'success':
+            print(f"⚠️ Поток Bybit, пользователь {user_id}: {result['message']}")
+        return result
+    except Exception as e:
+        print(f"❌ Поток Bybit, пользователь {user_id}: {e}")
+        return {"status": "error", "message": str(e)}
+    finally:
+        connection.close()
+
+
+class UserStream:
+    # Состояние одного соединения: ключи, сокет, переподключение и дозагрузка по REST
+    def __init__(self, user_id, api_key, api_secret):
+        self.user_id = user_id
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.ws = None
+        self.live = False             # авторизовались и подписались
+        self.attempts = 0
+        self.connect_at = 0.0         # time.monotonic(), не раньше которого переподключаться
+        self.last_message = 0.0
+        self.last_ping = 0.0
+        self.last_fetch = None
+        self.fetch = None             # Future текущей дозагрузки
+        self.fetch_again = False      # пришли события, пока дозагрузка уже шла
+
+    def backoff(self, delay=None):
+        self.attempts += 1
+        if delay is None:
+            base = stream_setting('BYBIT_STREAM_RETRY_BASE', 1)
+            delay = min(base * 2 ** (self.attempts - 1), stream_setting('BYBIT_STREAM_RETRY_MAX', 300))
+            delay *= random.uniform(0.5, 1)  # джиттер: после сбоя сети не переподключаемся все разом
+        self.connect_at = time.monotonic() + delay
+
+
+class BybitStreamDaemon:
+    def __init__(self, shard=0, shards=1, fetch_workers=4, connect=open_socket):
+        self.shard = shard
+        self.shards = shards
+        self.connect_socket = connect
+        self.selector = selectors.DefaultSelector()
+        self.pool = ThreadPoolExecutor(max_workers=fetch_workers)
+        self.streams = {}  # user_id -> UserStream
+        self.last_refresh = None
+        self.last_heartbeat = None
+
+    # --- Пользователи ---
+
+    def wanted_users(self):
+        rows = (
+            User.objects.filter(is_active=True).filter(has_keys('bybit_api_key', 'bybit_api_secret'))
+            .values_list('id', 'bybit_api_key', 'bybit_api_secret')
+        )
+        return {user_id: (key, secret) for user_id, key, secret in rows if user_id % self.shards == self.shard}
+
+    def refresh_users(self):
+        # Новые пользователи, удалённые и сменённые ключи
+        wanted = self.wanted_users()
+        for user_id in list(self.streams):
+            stream = self.streams[user_id]
+            if wanted.get(user_id) != (stream.api_key, stream.api_secret):
+                self.close(stream, "ключи изменились" if user_id in wanted else "ключи удалены")
+                del self.streams[user_id]
+        for user_id, (key, secret) in wanted.items():
+            if user_id not in self.streams:
+                self.streams[user_id] = UserStream(user_id, key, secret)
+        self.last_refresh = time.monotonic()
+
+    # --- Соединения ---
+
+    def connect(self, stream):
+        timeout = stream_setting('BYBIT_STREAM_PING', 20)
+        try:
+            stream.ws = self.connect_socket(stream_setting('BYBIT_STREAM_URL', "wss://stream.bybit.com/v5/private"), timeout)
+            # Время подписи — по часам биржи, как у REST-запросов
+            expires = get_client(EXCHANGE_TYPE).now_ms() + AUTH_EXPIRES_MS
+            stream.ws.send(json.dumps(auth_message(stream.api_key, stream.api_secret, expires)))
+        except Exception as e:
+            print(f"⚠️ Поток Bybit, пользователь {stream.user_id}: не удалось подключиться ({e})")
+            self.close(stream)
+            stream.backoff()
+            return
+        stream.last_message = stream.last_ping = time.monotonic()
+        self.selector.register(stream.ws.sock, selectors.EVENT_READ, stream)
+
+    def close(self, stream, reason=None):
+        if stream.ws is not None:
+            if reason:
+                print(f"🔌 Поток Bybit, пользователь {stream.user_id}: {reason}")
+            try:
+                self.selector.unregister(stream.ws.sock)
+            except (KeyError, ValueError):
+                pass
+            try:
+                stream.ws.close()
+            except Exception:
+                pass
+        stream.ws = None
+        stream.live = False
+
+    def drop(self, stream, reason):
+        # Обрыв: переподключаемся с растущей задержкой, пропуск закроет дозагрузка после авторизации
+        self.close(stream, reason)
+        stream.backoff()
+
+    # --- Сообщения ---
+
+    def receive(self, stream):
+        try:
+            raw = stream.ws.recv()
+            # Расшифрованные TLS-данные могут уже лежать в буфере — select() о них не сообщит
+            while True:
+                self.handle_message(stream, raw)
+                if stream.ws is None or not getattr(stream.ws.sock, 'pending', lambda: 0)():
+                    break
+                raw = stream.ws.recv()
+        except Exception as e:
+            self.drop(stream, f"соединение прервано ({e})")
+
+    def handle_message(self, stream, raw):
+        stream.last_message = time.monotonic()
+        if not raw:
+            # Пустой кадр — соединение закрыто сервером
+            self.drop(stream, "соединение закрыто биржей")
+            return
+        try:
+            message = json.loads(raw)
+        except ValueError:
+            return
+
+        op = message.get('op')
+        if op == 'auth':
+            if message.get('success'):
+                stream.ws.send(json.dumps({'op': 'subscribe', 'args': list(stream_setting('BYBIT_STREAM_TOPICS', ['order']))}))
+                stream.live = True
+                stream.attempts = 0
+                print(f"✅ Поток Bybit, пользователь {stream.user_id}: подключён")
+                # Закрываем пропуск, пока соединения не было
+                self.schedule_fetch(stream)
+            else:
+                # Неверный ключ от повторов не исправится — ждём смены ключей или долгой паузы
+                self.close(stream, f"авторизация отклонена ({message.get('ret_msg')})")
+                stream.backoff(stream_setting('BYBIT_STREAM_AUTH_RETRY', 1800))
+        elif op == 'subscribe' and not message.get('success'):
+            print(f"⚠️ Поток Bybit, пользователь {stream.user_id}: подписка отклонена ({message.get('ret_msg')})")
+        elif message.get('topic'):
+            self.schedule_fetch(stream)
+
+    # --- Дозагрузка по REST ---
+
+    def schedule_fetch(self, stream):
+        # Одна дозагрузка на пользователя за раз; события во время неё — ещё одна после
+        if stream.fetch is not None and not stream.fetch.done():
+            stream.fetch_again = True
+            return
+        stream.fetch_again = False
+        stream.last_fetch = time.monotonic()
+        stream.fetch = self.pool.submit(fetch_new_orders, stream.user_id)
+
+    def maintain(self, now):
+        connects = 0
+        # Поток заменяет опрос по расписанию, поэтому дозагружаем не реже него
+        safety = min(stream_setting('BYBIT_STREAM_SAFETY_INTERVAL', 60), sync_interval())
+        ping = stream_setting('BYBIT_STREAM_PING', 20)
+        stale = stream_setting('BYBIT_STREAM_STALE', 60)
+        for stream in self.streams.values():
+            if stream.ws is None:
+                if now >= stream.connect_at and connects < CONNECTS_PER_TICK:
+                    connects += 1
+                    self.connect(stream)
+                continue
+
+            if now - stream.last_message > stale:
+                self.drop(stream, "нет сообщений от биржи")
+                continue
+            if now - stream.last_ping >= ping:
+                stream.last_ping = now
+                try:
+                    stream.ws.send(json.dumps({'op': 'ping'}))
+                except Exception as e:
+                    self.drop(stream, f"ping не отправлен ({e})")
+                    continue
+
+            if stream.live and stream.fetch_again and stream.fetch.done():
+                self.schedule_fetch(stream)
+            elif stream.live and stream.last_fetch is not None and now - stream.last_fetch >= safety:
+                self.schedule_fetch(stream)
+
+    def heartbeat(self):
+        # Продлеваем stream_until живым потокам: опрос по расписанию их не трогает
+        live = [user_id for user_id, stream in self.streams.items() if stream.live]
+        if live:
+            SyncCursor.objects.bulk_create(
+                [SyncCursor(user_id=user_id, exchange_type=EXCHANGE_TYPE) for user_id in live],
+                ignore_conflicts=True,
+            )
+            until = timezone.now() + timedelta(seconds=2 * stream_setting('BYBIT_STREAM_HEARTBEAT', 30))
+            SyncCursor.objects.filter(user_id__in=live, exchange_type=EXCHANGE_TYPE).update(stream_until=until)
+        # Оборвавшиеся — сразу обратно под опрос
+        down = [user_id for user_id, stream in self.streams.items() if not stream.live]
+        if down:
+            SyncCursor.objects.filter(
+                user_id__in=down, exchange_type=EXCHANGE_TYPE, stream_until__isnull=False,
+            ).update(stream_until=None)
+        self.last_heartbeat = time.monotonic()
+
+    # --- Цикл ---
+
+    def tick(self, timeout=1.0):
+        now = time.monotonic()
+        if self.last_refresh is None or now - self.last_refresh >= stream_setting('BYBIT_STREAM_REFRESH', 60):
+            close_old_connections()
+            self.refresh_users()
+        self.maintain(now)
+
+        if self.selector.get_map():
+            for key, _ in self.selector.select(timeout):
+                if key.data.ws is not None:
+                    self.receive(key.data)
+        else:
+            time.sleep(timeout)
+
+        if self.last_heartbeat is None or time.monotonic() - self.last_heartbeat >= stream_setting('BYBIT_STREAM_HEARTBEAT', 30):
+            self.heartbeat()
+
+    def run_forever(self):
+        try:
+            while True:
+                self.tick()
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        for stream in self.streams.values():
+            self.close(stream)
+        self.heartbeat()  # все потоки закрыты — отдаём пользователей опросу по расписанию
+        self.pool.shutdown(wait=True)
@@ -0,0 +1,142 @@
+# orders/sync.py
+# Фоновая синхронизация ордеров с бирж: расписание, джиттер и аренда (lease),
+# чтобы два воркера никогда не синхронизировали одного пользователя одновременно.
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import SyncState, User
+from .services import enabled_connectors, sync_user_orders
+
+# Результат сервиса -> статус в SyncState
+RESULT_STATUSES = {
+    'success': 'SUCCESS',
+    'warning': 'WARNING',
+    'error': 'ERROR',
+}
+
+
+def sync_interval():
+    return getattr(settings, 'ORDERS_SYNC_INTERVAL', 60)
+
+
+def sync_jitter():
+    return getattr(settings, 'ORDERS_SYNC_JITTER', 15)
+
+
+def lease_duration():
+    return getattr(settings, 'ORDERS_SYNC_LEASE', 120)
+
+
+def next_run_at(now=None):
+    # Джиттер размазывает пользователей по времени, чтобы не бить в биржу пачкой
+    now = now or timezone.now()
+    seconds = sync_interval() + random.uniform(-sync_jitter(), sync_jitter())
+    return now + timedelta(seconds=max(seconds, 1))
+
+
+def has_keys(key_field, secret_field):
+    return (
+        Q(**{f'{key_field}__isnull': False}) & ~Q(**{key_field: ''}) &
+        Q(**{f'{secret_field}__isnull': False}) & ~Q(**{secret_field: ''})
+    )
+
+
+def syncable_users():
+    # Пользователи, у которых настроена хотя бы одна включённая биржа
+    keys = Q(pk__in=[])
+    for connector in enabled_connectors():
+        keys |= has_keys(*connector.key_fields)
+    return User.objects.filter(is_active=True).filter(keys)
+
+
+def ensure_sync_states():
+    # Новым пользователям ставим первый запуск в случайный момент внутри интервала
+    now = timezone.now()
+    missing = syncable_users().filter(sync_state__isnull=True).values_list('id', flat=True)
+    SyncState.objects.bulk_create(
+        [
+            SyncState(user_id=user_id, next_sync_at=now + timedelta(seconds=random.uniform(0, sync_interval())))
+            for user_id in missing
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def request_sync(user):
+    # Просьба синхронизировать как можно скорее (кнопка "Обновить", смена ключей)
+    state, created = SyncState.objects.get_or_create(user=user, defaults={'next_sync_at': timezone.now()})
+    if not created:
+        SyncState.objects.filter(pk=state.pk).update(next_sync_at=timezone.now())
+
+
+def claim_due_states(worker_id, limit=10):
+    now = timezone.now()
+    with transaction.atomic():
+        states = list(
+            SyncState.objects.select_for_update(skip_locked=True)
+            .filter(next_sync_at__lte=now)
+            .filter(Q(lease_expires_at__isnull=True) | Q(lease_expires_at__lt=now))
+            .order_by('next_sync_at')[:limit]
+        )
+        ids = [state.pk for state in states]
+        SyncState.objects.filter(pk__in=ids).update(
+            lease_owner=worker_id,
+            lease_expires_at=now + timedelta(seconds=lease_duration()),
+            status='RUNNING',
+        )
+    return ids
+
+
+def renew_lease(state_id, worker_id):
+    # Аренда выдаётся на всю пачку сразу, а пользователи идут по очереди: перед каждым
+    # продлеваем её, только если она всё ещё наша и не истекла. Иначе пользователя,
+    # возможно, уже забрал другой воркер — пропускаем
+    now = timezone.now()
+    return SyncState.objects.filter(
+        pk=state_id, lease_owner=worker_id, lease_expires_at__gt=now,
+    ).update(lease_expires_at=now + timedelta(seconds=lease_duration())) == 1
+
+
+def run_claimed_state(state_id, worker_id):
+    state = SyncState.objects.select_related('user').get(pk=state_id)
+
+    try:
+        result = sync_user_orders(state.user)
+    except Exception as e:
+        result = {"status": "error", "message": f"Ошибка синхронизации: {e}"}
+
+    now = timezone.now()
+    status = RESULT_STATUSES.get(result.get('status'), 'ERROR')
+    fields = {
+        'status': status,
+        'message': (result.get('message') or '')[:255],
+        'last_sync_at': now,
+        'next_sync_at': next_run_at(now),
+        'lease_owner': '',
+        'lease_expires_at': None,
+    }
+    if status == 'SUCCESS':
+        fields['last_success_at'] = now
+
+    # Снимаем аренду, только если она всё ещё наша (не истекла и не перехвачена)
+    SyncState.objects.filter(pk=state_id, lease_owner=worker_id).update(**fields)
+    return result
+
+
+def run_due_syncs(worker_id, limit=10):
+    ensure_sync_states()
+    ids = claim_due_states(worker_id, limit=limit)
+    done = 0
+    for state_id in ids:
+        if not renew_lease(state_id, worker_id):
+            # Аренда истекла и пользователь, возможно, уже у другого воркера: пропускаем молча,
+            # в итог (done) он не попадёт, а следующий claim вернёт его по расписанию
+            continue
+        run_claimed_state(state_id, worker_id)
+        done += 1
+    return done
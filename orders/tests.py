@@ -1,3 +1,1675 @@
-from django.test import TestCase
+import asyncio
+import csv
+import hashlib
+import hmac
+import importlib
+import io
+import json
+import socket
+import tempfile
+import zipfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from . import bank_details, events, exchange_client, exports, importers, pnl, receipts, rollups, screenshots, search, services, streams, sync, views
+from .fake_servers import FakeEvotorServer, FakeExchangeServer
+from .models import (
+    BankDetail, DailyTurnover, Order, OrderScreenshot, OrderWriteKey, PnlCheckpoint, RealizedTrade, ReceiptJob, SyncState,
+    UnprocessedOrder, User,
+)
+from .signals import orders_bulk_changed
+
+
+class ReceiptOutboxTests(TestCase):
+    # Очередь чеков против локальной заглушки API Эвотора (orders/fake_servers.py)
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = FakeEvotorServer(login='kassa', password='secret').start()
+        cls.settings_override = override_settings(
+            EVOTOR_API_URL=cls.server.url,
+            EVOTOR_CLIENT={'max_retries': 0, 'timeout': 5},
+            EVOTOR_POLL_DELAY=0,
+            RECEIPT_RETRY_BASE=0,
+            RECEIPT_MAX_ATTEMPTS=3,
+        )
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        cls.server.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        receipts._tokens.clear()
+        self.server.reset()
+        self.user = User.objects.create_user(
+            'seller', 'seller@example.com', 'x',
+            evotor_login='kassa', evotor_password='secret', kkt_id='group-1', inn='770000000000',
+        )
+
+    def create_order(self, user=None, operation_type='SELL', external_id='1001'):
+        return Order.objects.create(
+            user=user or self.user, external_id=external_id, operation_type=operation_type,
+            price=Decimal('95.50'), amount=Decimal('10'), cost=Decimal('955.00'),
+        )
+
+    def drain(self, rounds=5):
+        for _ in range(rounds):
+            receipts.process_pending()
+
+    def test_sell_order_enqueues_receipt(self):
+        order = self.create_order()
+        job = ReceiptJob.objects.get(order=order)
+        self.assertEqual(job.status, 'PENDING')
+        self.assertEqual(job.group_code, 'group-1')
+        self.assertEqual(job.payload['receipt']['total'], 955.0)
+        self.assertEqual(Order.objects.get(pk=order.pk).receipt_status, 'PENDING')
+
+    def test_no_receipt_without_evotor_or_for_buy(self):
+        plain = User.objects.create_user('plain', 'plain@example.com', 'x')
+        self.create_order(user=plain)
+        self.create_order(operation_type='BUY', external_id='1002')
+        self.assertFalse(ReceiptJob.objects.exists())
+
+    def test_editing_order_does_not_enqueue_again(self):
+        order = self.create_order()
+        order.commission = Decimal('1')
+        order.save()
+        self.assertEqual(ReceiptJob.objects.filter(order=order).count(), 1)
+
+    def test_worker_issues_receipt(self):
+        order = self.create_order()
+        self.drain()
+        job = ReceiptJob.objects.get(order=order)
+        self.assertEqual(job.status, 'DONE')
+        order.refresh_from_db()
+        self.assertEqual(order.receipt_status, 'DONE')
+        self.assertEqual(order.receipt_data['fn_number'], '9999078900000001')
+        self.assertEqual(len(self.server.requests_to(r'/group-1/sell')), 1)
+
+    def test_one_token_per_group_batch(self):
+        for index in range(5):
+            self.create_order(external_id=str(2000 + index))
+        self.drain()
+        self.assertEqual(ReceiptJob.objects.filter(status='DONE').count(), 5)
+        self.assertEqual(len(self.server.requests_to(r'/getToken')), 1)
+
+    def test_server_error_is_retried(self):
+        order = self.create_order()
+        self.server.fail_next(503)
+        receipts.process_pending()
+        job = ReceiptJob.objects.get(order=order)
+        self.assertEqual(job.status, 'PENDING')
+        self.assertEqual(job.attempts, 1)
+        self.drain()
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'DONE')
+
+    def test_resubmit_is_idempotent(self):
+        order = self.create_order()
+        receipts.process_pending()
+        # Ответ с uuid "потерялся": задача снова в PENDING и уходит повторно
+        ReceiptJob.objects.filter(order=order).update(status='PENDING', uuid='')
+        self.drain()
+        self.assertEqual(len(self.server.documents), 1)
+        self.assertEqual(ReceiptJob.objects.get(order=order).status, 'DONE')
+
+    def test_expired_token_is_refreshed(self):
+        self.create_order()
+        receipts.process_pending()
+        self.server.expire_tokens()
+        self.drain()
+        self.assertEqual(ReceiptJob.objects.get().status, 'DONE')
+        self.assertEqual(len(self.server.requests_to(r'/getToken')), 2)
+
+    def test_rejected_receipt_fails_without_retries(self):
+        order = self.create_order()
+        self.server.reject[f'p2p-order-{order.pk}'] = 'Неверный ИНН'
+        self.drain()
+        job = ReceiptJob.objects.get(order=order)
+        self.assertEqual(job.status, 'FAILED')
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(Order.objects.get(pk=order.pk).receipt_status, 'FAILED')
+
+        del self.server.reject[f'p2p-order-{order.pk}']
+        self.assertEqual(receipts.retry_failed(), 1)
+        self.drain()
+        self.assertEqual(Order.objects.get(pk=order.pk).receipt_status, 'DONE')
+
+    def test_response_without_uuid_is_retried(self):
+        order = self.create_order()
+        with mock.patch.object(receipts.EvotorSession, 'register', return_value={'status': 'wait'}):
+            receipts.process_pending()
+        job = ReceiptJob.objects.get(order=order)
+        self.assertEqual((job.status, job.attempts), ('PENDING', 1))
+        self.assertIn('uuid', job.last_error)
+        self.drain()
+        self.assertEqual(ReceiptJob.objects.get(order=order).status, 'DONE')
+
+    def test_unexpected_error_does_not_stop_batch(self):
+        first = self.create_order(external_id='3001')
+        second = self.create_order(external_id='3002')
+        register = receipts.EvotorSession.register
+
+        def flaky(session, job):
+            if job.order_id == first.pk:
+                raise TypeError('broken payload')
+            return register(session, job)
+
+        with mock.patch.object(receipts.EvotorSession, 'register', flaky):
+            self.assertEqual(receipts.process_pending(), 2)
+        self.assertEqual(ReceiptJob.objects.get(order=first).attempts, 1)
+        self.assertEqual(ReceiptJob.objects.get(order=second).status, 'SENT')
+
+    def test_wrong_credentials_fail(self):
+        self.user.evotor_password = 'wrong'
+        self.user.save()
+        self.create_order()
+        self.drain()
+        self.assertEqual(ReceiptJob.objects.get().status, 'FAILED')
+
+
+class OrderBatchWriteTests(TestCase):
+    # Пакетная запись ордеров из расширения (orders/order_writes.py)
+
+    def setUp(self):
+        self.user = User.objects.create_user('trader', 'trader@example.com', 'x')
+        self.bank = BankDetail.objects.create(user=self.user, name='Сбербанк')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def order(self, number, **extra):
+        return {
+            'orderId': number, 'type': 'SELL', 'price': '95.5', 'amount': '10',
+            'commission': 0.5, 'commissionType': 'PERCENT', 'details': {'id': self.bank.pk},
+            'createdAt': '2026-01-10T12:00:00+03:00', **extra,
+        }
+
+    def send(self, orders, exchange_type=1):
+        response = self.client.post(
+            reverse('api_orders_batch'), {'exchangeType': exchange_type, 'orders': orders}, format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_batch_creates_orders(self):
+        results = self.send([self.order('1001'), self.order('1002', type='BUY')])
+        self.assertEqual([item['status'] for item in results], ['created', 'created'])
+        order = Order.objects.get(external_id='1002')
+        self.assertEqual(order.operation_type, 'BUY')
+        self.assertEqual(order.cost, Decimal('955.00'))
+        self.assertEqual(order.bank_detail, self.bank)
+
+    def test_retry_with_keys_is_replayed(self):
+        orders = [self.order('1001', idempotencyKey='k1'), self.order('1002', idempotencyKey='k2')]
+        first = self.send(orders)
+        second = self.send(orders)
+        self.assertTrue(all(item['replayed'] for item in second))
+        self.assertEqual([item['id'] for item in first], [item['id'] for item in second])
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(OrderWriteKey.objects.count(), 2)
+
+    def test_key_reused_for_other_data_is_rejected(self):
+        self.send([self.order('1001', idempotencyKey='k1')])
+        result, = self.send([self.order('1001', idempotencyKey='k1', price='99')])
+        self.assertEqual(result['status'], 'error')
+        self.assertEqual(Order.objects.get().price, Decimal('95.50'))
+
+    def test_resubmit_without_key_updates_in_place(self):
+        self.send([self.order('1001')])
+        unchanged, = self.send([self.order('1001')])
+        self.assertEqual(unchanged['status'], 'unchanged')
+        updated, = self.send([self.order('1001', price='96')])
+        self.assertEqual(updated['status'], 'updated')
+        self.assertEqual(updated['version'], 2)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_missing_fields_come_from_synced_order(self):
+        UnprocessedOrder.objects.create(
+            user=self.user, order_id='1001', exchange_type='BYBIT', operation_type='BUY',
+            price=Decimal('94.10'), amount=Decimal('25'), created_at=timezone.now(),
+        )
+        result, = self.send([{'orderId': '1001', 'details': {'id': self.bank.pk}}])
+        self.assertEqual(result['status'], 'created')
+        order = Order.objects.get()
+        self.assertEqual((order.operation_type, order.price, order.amount), ('BUY', Decimal('94.10'), Decimal('25')))
+
+        failed, = self.send([{'orderId': '1002'}])
+        self.assertEqual(failed['status'], 'error')
+
+    def test_bybit_page_values_save_unsynced_order(self):
+        # Страница ордера Bybit: цена и сумма есть, количество выводится из них
+        payload = {
+            'orderId': '1003', 'type': 'SELL', 'price': 95.5, 'amount': None, 'cost': 955,
+            'details': {'id': self.bank.pk}, 'exchangeType': 1,
+        }
+        response = self.client.post(reverse('api_order'), payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Order.objects.get(external_id='1003').amount, Decimal('10'))
+
+    def test_unknown_order_without_values_requests_sync(self):
+        response = self.client.post(reverse('api_order'), {'orderId': '1004', 'type': 'SELL', 'exchangeType': 1}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('синхронизации', response.json()['message'])
+        self.assertTrue(SyncState.objects.filter(user=self.user, next_sync_at__lte=timezone.now()).exists())
+
+    def test_foreign_bank_detail_and_duplicates_are_errors(self):
+        other = User.objects.create_user('other', 'other@example.com', 'x')
+        foreign = BankDetail.objects.create(user=other, name='ВТБ')
+        results = self.send([self.order('1001', details={'id': foreign.pk}), self.order('1002'), self.order('1002')])
+        self.assertEqual([item['status'] for item in results], ['error', 'created', 'error'])
+
+    def test_multipart_with_screenshot(self):
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            response = self.client.post(reverse('api_orders_batch'), {
+                'exchangeType': 1,
+                'orders': '[{"orderId": "1001", "type": "SELL", "price": 95, "amount": 10, "screenshot": "shot"}]',
+                'shot': SimpleUploadedFile('1001.png', b'png-bytes', content_type='image/png'),
+            }, format='multipart')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['results'][0]['screenshot'], 'PENDING')
+            self.assertEqual(OrderScreenshot.objects.get().order.external_id, '1001')
+
+    def test_single_order_post(self):
+        response = self.client.post(reverse('api_order'), {**self.order('1001'), 'exchangeType': 1}, format='json')
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get()
+        self.assertEqual(response.json(), {'status': 'created', 'key': None, 'orderId': '1001', 'id': order.pk, 'version': 1})
+        response = self.client.post(reverse('api_order'), {**self.order('1001'), 'exchangeType': 1}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+
+class UnprocessedAcceptTests(TestCase):
+    # Принятие синхронизированных ордеров пачкой (orders/unprocessed.py)
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'trader', 'trader@example.com', 'x', evotor_login='login', evotor_password='secret', kkt_id='kkt-1',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        day = timezone.make_aware(timezone.datetime(2026, 2, 10, 12, 0))
+        self.rows = [
+            UnprocessedOrder.objects.create(
+                user=self.user, order_id=str(2000 + index), exchange_type='BYBIT',
+                operation_type='SELL' if index % 2 else 'BUY', price=Decimal('95.50'), amount=Decimal('10'),
+                created_at=day + timezone.timedelta(days=index),
+            )
+            for index in range(4)
+        ]
+
+    def accept(self, payload):
+        response = self.client.post(reverse('api_unprocessed_accept'), payload, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_selected_rows_become_orders(self):
+        outcome = self.accept({
+            'ids': [self.rows[0].pk, self.rows[1].pk], 'bank': 'Тинькофф', 'commission': '0.1', 'commission_type': 'PERCENT',
+        })
+        self.assertEqual(outcome, {'accepted': 2, 'skipped': 0, 'remaining': 0})
+        self.assertEqual(UnprocessedOrder.objects.count(), 2)
+        order = Order.objects.get(external_id='2001')
+        self.assertEqual((order.exchange_type, order.operation_type, order.cost), ('Bybit', 'SELL', Decimal('955.00')))
+        self.assertEqual(order.bank_detail.name, 'Тинькофф')
+        self.assertEqual(order.commission, Decimal('0.10'))
+        # Чек — только для продажи, как при сохранении одного ордера
+        self.assertEqual(list(ReceiptJob.objects.values_list('order__external_id', flat=True)), ['2001'])
+        self.assertEqual(order.receipt_status, 'PENDING')
+
+    def test_filter_by_date_and_side(self):
+        outcome = self.accept({'date_from': '2026-02-11', 'date_to': '2026-02-12', 'operation': 'SELL'})
+        self.assertEqual(outcome['accepted'], 1)
+        self.assertEqual(list(Order.objects.values_list('external_id', flat=True)), ['2001'])
+
+    def test_already_saved_rows_are_skipped_and_removed(self):
+        Order.objects.create(user=self.user, external_id='2000', exchange_type='Bybit', price=1, amount=1, cost=1)
+        # Число запросов не зависит от числа строк
+        with self.assertNumQueries(16):
+            outcome = self.accept({'all': True})
+        self.assertEqual(outcome, {'accepted': 3, 'skipped': 1, 'remaining': 0})
+        self.assertFalse(UnprocessedOrder.objects.exists())
+        self.assertEqual(Order.objects.count(), 4)
+
+    def test_empty_selection_and_bad_commission_are_rejected(self):
+        response = self.client.post(reverse('api_unprocessed_accept'), {}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(reverse('api_unprocessed_accept'), {'all': True, 'commission_type': 'X'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(UnprocessedOrder.objects.count(), 4)
+
+    def test_page_form_accepts_selection(self):
+        self.client.force_login(self.user)
+        page = self.client.get(reverse('unprocessed_orders'))
+        self.assertContains(page, f'name="ids" value="{self.rows[2].pk}"')
+        response = self.client.post(reverse('unprocessed_orders'), {'accept': '', 'ids': [self.rows[2].pk]})
+        self.assertRedirects(response, reverse('unprocessed_orders'), fetch_redirect_response=False)
+        self.assertEqual(list(Order.objects.values_list('external_id', flat=True)), ['2002'])
+
+
+class FakeStreamSocket:
+    # Вместо websocket-client: сообщения биржи пишутся в другой конец socketpair, по строке на сообщение
+    def __init__(self):
+        self.sock, self.server = socket.socketpair()
+        self.reader = self.sock.makefile('r')
+        self.sent = []
+
+    def push(self, message):
+        self.server.sendall((json.dumps(message) + '\n').encode())
+
+    def send(self, data):
+        self.sent.append(json.loads(data))
+
+    def recv(self):
+        return self.reader.readline().strip()
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+        self.server.close()
+
+
+@override_settings(EXCHANGE_CLIENTS={'BYBIT': {'time_path': None}}, BYBIT_STREAM_TOPICS=['order'])
+class BybitStreamTests(TestCase):
+    # Поток ордеров Bybit (orders/streams.py)
+
+    def setUp(self):
+        exchange_client.reset_clients()
+        self.addCleanup(exchange_client.reset_clients)
+        self.user = User.objects.create_user('trader', 'trader@example.com', 'x', bybit_api_key='key', bybit_api_secret='secret')
+        self.sockets = []
+        self.fetched = []
+        patcher = mock.patch.object(streams, 'fetch_new_orders', self.fetched.append)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.daemon = streams.BybitStreamDaemon(connect=self.connect)
+        self.addCleanup(self.daemon.shutdown)
+
+    def connect(self, url, timeout):
+        fake = FakeStreamSocket()
+        self.sockets.append(fake)
+        return fake
+
+    def wait_fetches(self, count):
+        self.daemon.pool.submit(lambda: None).result()
+        self.assertEqual(self.fetched, [self.user.pk] * count)
+
+    def test_auth_signature(self):
+        message = streams.auth_message('key', 'secret', 1700000000000)
+        expected = hmac.new(b'secret', b'GET/realtime1700000000000', hashlib.sha256).hexdigest()
+        self.assertEqual(message, {'op': 'auth', 'args': ['key', 1700000000000, expected]})
+
+    def test_connect_subscribe_and_fetch_on_events(self):
+        self.daemon.tick(timeout=0)
+        fake, = self.sockets
+        self.assertEqual(fake.sent[0]['op'], 'auth')
+
+        fake.push({'op': 'auth', 'success': True})
+        self.daemon.tick(timeout=1)
+        self.assertEqual(fake.sent[1], {'op': 'subscribe', 'args': ['order']})
+        # Пропуск до подключения закрывает дозагрузка сразу после авторизации
+        self.wait_fetches(1)
+
+        fake.push({'topic': 'order', 'data': [{'orderId': '1'}]})
+        self.daemon.tick(timeout=1)
+        self.wait_fetches(2)
+
+        # Пока поток жив, опрос по расписанию Bybit не трогает
+        self.daemon.heartbeat()
+        self.assertEqual(services.streamed_exchanges(self.user), {'BYBIT'})
+
+    def test_drop_backs_off_and_returns_user_to_polling(self):
+        self.daemon.tick(timeout=0)
+        fake, = self.sockets
+        fake.push({'op': 'auth', 'success': True})
+        self.daemon.tick(timeout=1)
+        self.daemon.heartbeat()
+
+        fake.server.close()
+        self.daemon.tick(timeout=1)
+        stream = self.daemon.streams[self.user.pk]
+        self.assertIsNone(stream.ws)
+        self.assertGreater(stream.connect_at, time.monotonic())
+        self.daemon.heartbeat()
+        self.assertEqual(services.streamed_exchanges(self.user), set())
+
+    @override_settings(BYBIT_STREAM_SAFETY_INTERVAL=600, ORDERS_SYNC_INTERVAL=60)
+    def test_fetch_runs_at_least_as_often_as_polling(self):
+        # Событий о P2P в потоке нет: опрос он заменяет только с той же частотой дозагрузки
+        self.daemon.tick(timeout=0)
+        self.sockets[0].push({'op': 'auth', 'success': True})
+        self.daemon.tick(timeout=1)
+        self.wait_fetches(1)
+
+        stream = self.daemon.streams[self.user.pk]
+        start = stream.last_fetch
+        stream.last_message = stream.last_ping = start + 59  # соединение живо, пинги идут
+        self.daemon.maintain(start + 59)
+        self.wait_fetches(1)
+        self.daemon.maintain(start + 60)
+        self.wait_fetches(2)
+
+    def test_rejected_key_waits_for_long_retry(self):
+        self.daemon.tick(timeout=0)
+        self.sockets[0].push({'op': 'auth', 'success': False, 'ret_msg': 'invalid api key'})
+        self.daemon.tick(timeout=1)
+        stream = self.daemon.streams[self.user.pk]
+        self.assertIsNone(stream.ws)
+        self.assertGreater(stream.connect_at, time.monotonic() + 600)
+        self.assertEqual(self.fetched, [])
+
+
+@override_settings(EVENTS_ENABLED=True)
+class OrderEventsTests(TestCase):
+    # События в реальном времени (orders/events.py, /api/events)
+
+    def setUp(self):
+        self.user = User.objects.create_user('trader', 'trader@example.com', 'x')
+        self.token = Token.objects.create(user=self.user)
+
+    def test_saved_order_is_published_after_commit(self):
+        with mock.patch.object(events.broker, 'dispatch') as dispatch:
+            with self.captureOnCommitCallbacks(execute=True):
+                order = Order.objects.create(user=self.user, external_id='3001', price=95, amount=1, cost=95)
+                dispatch.assert_not_called()
+        message = json.loads(dispatch.call_args.args[0])
+        self.assertEqual(message['user'], self.user.pk)
+        self.assertEqual(message['event'], 'order')
+        self.assertEqual(message['data'], {'id': order.pk, 'orderId': '3001', 'version': 1, 'created': True})
+
+    async def test_stream_delivers_events_of_its_user_only(self):
+        stream = events.event_stream(self.user.pk)
+        self.assertIn('event: hello', await anext(stream))
+
+        # Публикация приходит из другого потока (слушатель LISTEN, синхронный view)
+        other = json.dumps({'user': self.user.pk + 1, 'event': 'order', 'data': {}})
+        mine = json.dumps({'user': self.user.pk, 'event': 'receipt', 'data': {'id': 7, 'status': 'DONE'}})
+        thread = threading.Thread(target=lambda: [events.broker.dispatch(other), events.broker.dispatch(mine)])
+        thread.start()
+        chunk = await asyncio.wait_for(anext(stream), timeout=5)
+        thread.join()
+        self.assertIn('event: receipt', chunk)
+        self.assertIn('"status": "DONE"', chunk)
+
+        await stream.aclose()
+        self.assertNotIn(self.user.pk, events.broker.subscribers)
+
+    async def test_endpoint_requires_session_or_token(self):
+        response = await self.async_client.get(reverse('order_events'))
+        self.assertEqual(response.status_code, 401)
+        # Постоянный токен API в адресе не принимается — только подписанный короткий
+        response = await self.async_client.get(reverse('order_events'), {'token': self.token.key})
+        self.assertEqual(response.status_code, 401)
+
+        response = await self.async_client.get(reverse('order_events'), {'token': events.issue_stream_token(self.user.pk)})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertIn(b'event: hello', await anext(stream))
+        await stream.aclose()
+
+    def test_stream_token_is_issued_to_api_clients_and_expires(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        response = client.post(reverse('order_events_token'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(events.stream_token_user_id(response.json()['token']), self.user.pk)
+        self.assertIsNone(events.stream_token_user_id(response.json()['token'] + 'x'))
+        with override_settings(EVENTS_TOKEN_MAX_AGE=-1):
+            self.assertIsNone(events.stream_token_user_id(response.json()['token']))
+        self.assertEqual(APIClient().post(reverse('order_events_token')).status_code, 401)
+
+    def test_wsgi_request_is_not_held_open(self):
+        # Под WSGI бесконечный ответ занял бы поток навсегда — 204, и EventSource не переподключается
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('order_events'))
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(response.streaming)
+        self.assertContains(self.client.get(reverse('my_orders')), "new EventSource(")
+
+    @override_settings(EVENTS_ENABLED=False)
+    def test_disabled_events_fall_back_to_polling(self):
+        self.client.force_login(self.user)
+        self.assertNotContains(self.client.get(reverse('my_orders')), "new EventSource(")
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(client.post(reverse('order_events_token')).status_code, 501)
+
+    @override_settings(EVENTS_ENABLED=False)
+    async def test_disabled_events_are_not_streamed_under_asgi(self):
+        response = await self.async_client.get(reverse('order_events'), {'token': events.issue_stream_token(self.user.pk)})
+        self.assertEqual(response.status_code, 204)
+
+
+class OrderDedupTests(TestCase):
+    # Один ордер биржи — одна строка (order_unique_external_id, ingest_unprocessed_orders)
+
+    def setUp(self):
+        self.user = User.objects.create_user('trader', 'trader@example.com', 'x')
+        self.client.force_login(self.user)
+
+    def form(self, **extra):
+        return {
+            'create_order': '', 'external_id': '4001', 'exchange': 'Bybit', 'operation_type': 'SELL',
+            'price': '95', 'amount': '10', 'cost': '950', 'commission_value': '0', 'commission_type': 'PERCENT',
+            'created_at': '2026-03-01T12:00', 'details': 'Сбербанк', **extra,
+        }
+
+    def test_duplicate_order_in_form_is_a_form_error(self):
+        self.client.post(reverse('my_orders'), self.form())
+        response = self.client.post(reverse('my_orders'), self.form(), follow=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'уже сохранён')
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_edit_to_existing_number_is_a_form_error(self):
+        self.client.post(reverse('my_orders'), self.form())
+        self.client.post(reverse('my_orders'), self.form(external_id='4002'))
+        second = Order.objects.get(external_id='4002')
+        response = self.client.post(reverse('edit_order', args=[second.pk]), self.form(external_id='4001'), follow=True)
+        self.assertContains(response, 'уже сохранён')
+        second.refresh_from_db()
+        self.assertEqual(second.external_id, '4002')
+
+    def test_ingest_skips_known_and_repeated_orders(self):
+        Order.objects.create(user=self.user, external_id='5001', exchange_type='Bybit', price=1, amount=1, cost=1)
+        row = {'operation_type': 'BUY', 'price': 95, 'amount': 1, 'created_at': timezone.now()}
+        rows = [{'order_id': order_id, **row} for order_id in ('5001', '5002', '5002', '5003')]
+        self.assertEqual(services.ingest_unprocessed_orders(self.user, 'BYBIT', rows), 2)
+        self.assertEqual(services.ingest_unprocessed_orders(self.user, 'BYBIT', rows), 0)
+        self.assertEqual(sorted(UnprocessedOrder.objects.values_list('order_id', flat=True)), ['5002', '5003'])
+
+
+class SyncLeaseTests(TestCase):
+    # Аренда SyncState: один пользователь — один воркер (orders/sync.py)
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(f'sync{n}', f'sync{n}@example.com', 'x', bybit_api_key='key', bybit_api_secret='secret')
+            for n in range(3)
+        ]
+        sync.ensure_sync_states()
+        SyncState.objects.update(next_sync_at=timezone.now() - timedelta(seconds=1))
+
+    def test_claimed_states_are_not_claimed_again(self):
+        first = sync.claim_due_states('worker-a', limit=2)
+        second = sync.claim_due_states('worker-b', limit=10)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 1)
+        self.assertFalse(set(first) & set(second))
+        self.assertEqual(sync.claim_due_states('worker-c'), [])
+
+    def test_expired_lease_is_claimed_by_another_worker(self):
+        ids = sync.claim_due_states('worker-a')
+        SyncState.objects.filter(pk=ids[0]).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(sync.claim_due_states('worker-b'), [ids[0]])
+        self.assertFalse(sync.renew_lease(ids[0], 'worker-a'))
+        self.assertTrue(sync.renew_lease(ids[0], 'worker-b'))
+
+    def test_batch_skips_users_whose_lease_expired(self):
+        synced = []
+        ids = []
+        claim_due_states = sync.claim_due_states
+
+        def claim(worker_id, limit):
+            ids.extend(claim_due_states(worker_id, limit=limit))
+            # Пока шла пачка, аренда второго пользователя истекла и его забрал другой воркер
+            SyncState.objects.filter(pk=ids[1]).update(lease_owner='worker-b')
+            return ids
+
+        with mock.patch.object(sync, 'claim_due_states', claim), \
+                mock.patch.object(sync, 'sync_user_orders', side_effect=lambda user: synced.append(user.pk) or {'status': 'success'}):
+            self.assertEqual(sync.run_due_syncs('worker-a'), 2)
+        self.assertEqual(len(synced), 2)
+        self.assertNotIn(SyncState.objects.get(pk=ids[1]).user_id, synced)
+        self.assertEqual(SyncState.objects.get(pk=ids[1]).lease_owner, 'worker-b')
+        self.assertEqual(SyncState.objects.filter(status='SUCCESS').count(), 2)
+
+
+class PagedConnector(services.ExchangeConnector):
+    # По 3 ордера на страницу; у окна шире wide_ms — pages страниц, у остальных одна
+    exchange_type = 'BYBIT'
+    title = 'Test'
+
+    def __init__(self, wide_ms, pages):
+        self.wide_ms = wide_ms
+        self.pages = pages
+        self.calls = []
+
+    def is_configured(self, user):
+        return True
+
+    def fetch_page(self, user, start_ms, end_ms, cursor):
+        self.calls.append((start_ms, end_ms, cursor))
+        page = cursor or 0
+        last = self.pages - 1 if end_ms - start_ms > self.wide_ms else 0
+        rows = [
+            {'order_id': f'{start_ms}-{end_ms}-{page}-{n}', 'operation_type': 'BUY', 'price': 95, 'amount': 1,
+             'created_at': timezone.now()}
+            for n in range(3)
+        ]
+        return rows, (page + 1 if page < last else None)
+
+
+@override_settings(ORDERS_SYNC_WINDOW_DAYS=1, ORDERS_SYNC_OVERLAP_SECONDS=0, ORDERS_SYNC_MAX_PAGES=20)
+class SyncWindowTests(TestCase):
+    # Окна и водяные знаки sync_exchange_orders (orders/services.py)
+
+    def setUp(self):
+        self.user = User.objects.create_user('windows', 'windows@example.com', 'x')
+
+    @override_settings(ORDERS_SYNC_MAX_WINDOW_PAGES=2)
+    def test_window_cut_by_page_cap_is_not_complete(self):
+        connector = PagedConnector(wide_ms=0, pages=5)
+        added, pages, complete = services.fetch_window(self.user, connector, 0, 1000)
+        self.assertEqual((added, pages, complete), (6, 2, False))
+        connector = PagedConnector(wide_ms=0, pages=2)
+        self.assertEqual(services.fetch_window(self.user, connector, 0, 2000), (6, 2, True))
+
+    @override_settings(ORDERS_SYNC_MAX_WINDOW_PAGES=2)
+    def test_watermark_stays_until_window_is_read(self):
+        # Окна шире 6 часов не помещаются в две страницы: знак ждёт, пока окно сузится
+        now_ms = int(time.time() * 1000)
+        services.SyncCursor.objects.create(
+            user=self.user, exchange_type='BYBIT', high_water_ms=now_ms - services.DAY_MS,
+            low_water_ms=now_ms - services.DAY_MS, backfill_done=True,
+        )
+        connector = PagedConnector(wide_ms=6 * 3600 * 1000, pages=5)
+        services.sync_exchange_orders(self.user, connector)
+
+        cursor = services.SyncCursor.objects.get(user=self.user)
+        read = [(start, end) for start, end, page in connector.calls if page is None]
+        # Каждое окно, после которого знак сдвинулся, дочитано до конца (одна страница)
+        advanced = [(start, end) for start, end in read if end - start <= 6 * 3600 * 1000]
+        self.assertTrue(advanced)
+        self.assertEqual(cursor.high_water_ms, advanced[-1][1])
+        self.assertEqual(advanced[0][0], now_ms - services.DAY_MS)
+        for (start, end), (next_start, _) in zip(advanced, advanced[1:]):
+            self.assertEqual(end, next_start)
+
+    @override_settings(ORDERS_SYNC_MAX_WINDOW_PAGES=2)
+    def test_looping_cursor_does_not_stall_sync(self):
+        # Курсор, который не кончается и в минимальном окне, не держит знак вечно
+        now_ms = int(time.time() * 1000)
+        services.SyncCursor.objects.create(
+            user=self.user, exchange_type='BYBIT', high_water_ms=now_ms - 2 * services.MIN_WINDOW_MS,
+            low_water_ms=now_ms, backfill_done=True,
+        )
+        connector = PagedConnector(wide_ms=-1, pages=1000)
+        services.sync_exchange_orders(self.user, connector)
+        self.assertGreater(services.SyncCursor.objects.get(user=self.user).high_water_ms, now_ms - 2 * services.MIN_WINDOW_MS)
+
+
+class ScreenshotMediaTests(TestCase):
+    # Отдача скриншотов из Python: кэширование и Range (orders/media.py)
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        self.override = override_settings(MEDIA_ROOT=self.media.name, SCREENSHOT_SENDFILE=None)
+        self.override.enable()
+        self.addCleanup(self.override.disable)
+        self.user = User.objects.create_user('viewer', 'viewer@example.com', 'x')
+        self.client.force_login(self.user)
+
+    def order_with(self, name, data=b'0123456789'):
+        name = default_storage.save(name, ContentFile(data))
+        return Order.objects.create(user=self.user, price=1, amount=1, cost=1, screenshot=name)
+
+    def get(self, order, **headers):
+        return self.client.get(order.screenshot_link, headers=headers)
+
+    def test_processed_file_is_immutable(self):
+        content_hash = hashlib.sha256(b'image').hexdigest()
+        order = self.order_with(f'screenshots/{content_hash[:2]}/{content_hash[2:4]}/{content_hash}.webp')
+        response = self.get(order)
+        self.assertEqual(response['Cache-Control'], 'private, max-age=31536000, immutable')
+        self.assertEqual(self.get(order, if_none_match=response['ETag']).status_code, 304)
+
+    def test_raw_upload_is_revalidated(self):
+        order = self.order_with('screenshots/2026/03/01/shot.png')
+        response = self.get(order)
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        self.assertIn(str(len(b'0123456789')), response['ETag'])
+        self.assertEqual(self.get(order, if_none_match=response['ETag']).status_code, 304)
+
+    def test_range_requests(self):
+        order = self.order_with('screenshots/2026/03/01/range.png')
+        response = self.get(order, range='bytes=2-4')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, b'234')
+        self.assertEqual(response['Content-Range'], 'bytes 2-4/10')
+        self.assertEqual(self.get(order, range='bytes=-3').content, b'789')
+        self.assertEqual(self.get(order, range='bytes=20-').status_code, 416)
+        self.assertEqual(b''.join(self.get(order).streaming_content), b'0123456789')
+
+    def test_other_users_screenshot_is_hidden(self):
+        order = self.order_with('screenshots/2026/03/01/private.png')
+        other = User.objects.create_user('other', 'other@example.com', 'x')
+        self.client.force_login(other)
+        self.assertEqual(self.get(order).status_code, 404)
+
+    def test_media_root_is_not_published_even_in_debug(self):
+        order = self.order_with('screenshots/2026/03/01/private.png')
+        with override_settings(DEBUG=True):
+            urls = importlib.reload(importlib.import_module('core.urls'))
+        self.addCleanup(importlib.reload, urls)
+        with override_settings(ROOT_URLCONF='core.urls'):
+            self.client.force_login(User.objects.create_user('other', 'other@example.com', 'x'))
+            self.assertEqual(self.client.get(f'/media/{order.screenshot.name}').status_code, 404)
+
+
+class PnlTests(TestCase):
+    # Реализованный P&L по FIFO и средней и его снимки (orders/pnl.py)
+
+    def setUp(self):
+        self.user = User.objects.create_user('pnl', 'pnl@example.com', 'x')
+        self.start = timezone.now() - timedelta(days=30)
+
+    def rows(self, *orders):
+        # (тип, кол-во, стоимость) -> кортежи ORDER_FIELDS
+        return [
+            (index, self.start + timedelta(minutes=index), operation, Decimal(amount), Decimal(cost))
+            for index, (operation, amount, cost) in enumerate(orders, 1)
+        ]
+
+    def test_fifo_sells_oldest_lots_first(self):
+        inventory = pnl.Inventory('FIFO')
+        trades = list(pnl.match_orders(inventory, self.rows(('BUY', 10, 900), ('BUY', 10, 1000), ('SELL', 15, 1500))))
+        self.assertEqual(len(trades), 1)
+        self.assertEqual(trades[0]['cost_basis'], Decimal('1400.00'))
+        self.assertEqual(trades[0]['pnl'], Decimal('100.00'))
+        self.assertEqual(inventory.serialize(), [['5', '100']])
+
+    def test_average_uses_weighted_cost(self):
+        inventory = pnl.Inventory('AVERAGE')
+        trades = list(pnl.match_orders(inventory, self.rows(('BUY', 10, 900), ('BUY', 10, 1000), ('SELL', 15, 1500))))
+        self.assertEqual(trades[0]['cost_basis'], Decimal('1425.00'))
+        self.assertEqual(trades[0]['pnl'], Decimal('75.00'))
+
+    def test_sale_beyond_inventory_is_unmatched(self):
+        trades = list(pnl.match_orders(pnl.Inventory('FIFO'), self.rows(('BUY', 5, 500), ('SELL', 10, 1200))))
+        self.assertEqual(trades[0]['amount'], Decimal('5'))
+        self.assertEqual(trades[0]['unmatched_amount'], Decimal('5'))
+        self.assertEqual(trades[0]['proceeds'], Decimal('600.00'))
+        self.assertEqual(trades[0]['pnl'], Decimal('100.00'))
+
+    def create_orders(self, count, offset=0):
+        # Покупка 1 USDT за 90 ₽ и продажа за 100 ₽ по очереди: +10 ₽ на каждой паре
+        Order.objects.bulk_create([
+            Order(
+                user=self.user, operation_type='BUY' if index % 2 == 0 else 'SELL', amount=1,
+                price=90 if index % 2 == 0 else 100, cost=90 if index % 2 == 0 else 100,
+                created_at=self.start + timedelta(minutes=offset + index),
+            )
+            for index in range(count)
+        ])
+
+    def checkpoints(self):
+        return PnlCheckpoint.objects.filter(user=self.user, method='FIFO')
+
+    def test_refresh_continues_from_checkpoint(self):
+        self.create_orders(20)
+        with mock.patch.object(pnl, 'CHECKPOINT_EVERY', 4), mock.patch.object(pnl, 'CHECKPOINT_MIN_ORDERS', 4):
+            self.assertEqual(pnl.refresh(self.user.pk), 20)
+            self.assertEqual(self.checkpoints().latest('position_at').orders_count, 20)
+            self.create_orders(4, offset=20)
+            self.assertEqual(pnl.refresh(self.user.pk), 4)
+        result = pnl.realized_pnl(self.user.pk, self.start, timezone.now())
+        self.assertEqual(result['pnl'], Decimal('120.00'))
+        self.assertEqual(RealizedTrade.objects.filter(user=self.user, method='FIFO').count(), 12)
+
+    def test_old_checkpoints_are_pruned(self):
+        self.create_orders(40)
+        with mock.patch.object(pnl, 'CHECKPOINT_EVERY', 4), mock.patch.object(pnl, 'CHECKPOINT_MIN_ORDERS', 4):
+            pnl.refresh(self.user.pk)
+        self.assertEqual(self.checkpoints().count(), pnl.CHECKPOINTS_KEPT)
+        self.assertEqual(self.checkpoints().latest('position_at').orders_count, 40)
+
+    def test_short_tail_gets_no_checkpoint(self):
+        self.create_orders(6)
+        self.assertEqual(pnl.refresh(self.user.pk), 6)
+        self.assertFalse(self.checkpoints().exists())
+        # Без снимка хвост досчитывается заново, сделки не задваиваются
+        pnl.refresh(self.user.pk)
+        self.assertEqual(RealizedTrade.objects.filter(user=self.user, method='FIFO').count(), 3)
+
+    def test_busy_refresh_leaves_last_figures(self):
+        self.create_orders(6)
+        pnl.refresh(self.user.pk)
+        self.create_orders(2, offset=6)
+        with mock.patch.object(pnl, 'lock_user', return_value=False):
+            self.assertEqual(pnl.refresh(self.user.pk), 0)
+        self.assertEqual(pnl.realized_pnl(self.user.pk, self.start, timezone.now())['pnl'], Decimal('30.00'))
+        pnl.refresh(self.user.pk)
+        self.assertEqual(pnl.realized_pnl(self.user.pk, self.start, timezone.now())['pnl'], Decimal('40.00'))
+
+    def test_report_only_reads(self):
+        self.create_orders(6)
+        with self.assertNumQueries(1):
+            result = pnl.realized_pnl(self.user.pk, self.start, timezone.now())
+        self.assertEqual(result['pnl'], Decimal('0'))
+        self.assertFalse(RealizedTrade.objects.exists())
+
+    def test_order_writes_advance_ledger_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.create(user=self.user, operation_type='BUY', amount=1, price=90, cost=90, created_at=self.start)
+            Order.objects.create(
+                user=self.user, operation_type='SELL', amount=1, price=100, cost=100, created_at=self.start + timedelta(minutes=1),
+            )
+        for method in pnl.PNL_METHODS:
+            self.assertEqual(pnl.realized_pnl(self.user.pk, self.start, timezone.now(), method)['pnl'], Decimal('10.00'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_orders(2, offset=10)
+            orders_bulk_changed(self.user.pk, self.start.date(), self.start.date())
+        self.assertEqual(pnl.realized_pnl(self.user.pk, self.start, timezone.now())['pnl'], Decimal('20.00'))
+
+    def test_buy_only_stretch_is_checkpointed(self):
+        Order.objects.bulk_create([
+            Order(user=self.user, operation_type='BUY', amount=1, price=90, cost=90, created_at=self.start + timedelta(minutes=index))
+            for index in range(10)
+        ])
+        with mock.patch.object(pnl, 'CHECKPOINT_EVERY', 4), mock.patch.object(pnl, 'CHECKPOINT_MIN_ORDERS', 4):
+            pnl.refresh(self.user.pk)
+        self.assertEqual(sorted(self.checkpoints().values_list('orders_count', flat=True)), [4, 8])
+        self.assertEqual(pnl.refresh(self.user.pk), 2)  # от снимка, а не с начала
+
+
+class OrderImportTests(TestCase):
+    # Импорт ордеров из CSV (orders/importers.py)
+
+    def setUp(self):
+        self.user = User.objects.create_user('importer', 'importer@example.com', 'x')
+
+    def run_import(self, text, fmt='generic', **options):
+        return importers.import_orders(self.user, io.BytesIO(text.encode()), fmt, **options)
+
+    def test_counts_created_duplicates_and_skipped(self):
+        Order.objects.create(user=self.user, external_id='A1', exchange_type='Bybit', price=1, amount=1, cost=1)
+        result = self.run_import(
+            "order_id,type,price,amount,status,date\n"
+            "A1,buy,95,10,completed,2026-03-01 10:00\n"
+            "A2,buy,95,10,completed,2026-03-01 11:00\n"
+            "A2,buy,95,10,completed,2026-03-01 11:00\n"
+            "A3,sell,96,5,cancelled,2026-03-01 12:00\n"
+            ",sell,96,5,completed,2026-03-01 13:00\n"
+            "A4,hold,96,5,completed,2026-03-01 14:00\n",
+            chunk_size=2,
+        )
+        self.assertEqual(result['rows'], 6)
+        self.assertEqual(result['created'], 2)
+        self.assertEqual(result['duplicates'], 2)
+        self.assertEqual(result['skipped'], 1)
+        self.assertEqual([line for line, _ in result['errors']], [7])
+        self.assertEqual(Order.objects.filter(user=self.user).count(), 3)
+
+    def test_created_count_ignores_conflicts(self):
+        # Ордер сохранился параллельно уже после проверки на дубли: bulk_create его пропустит
+        importer = importers.OrderImporter(self.user)
+        rows = [importer.parse_row(['B1', 'buy', '95', '1'], {'external_id': 0, 'operation_type': 1, 'price': 2, 'amount': 3})]
+        with mock.patch.object(importer, 'drop_duplicates', side_effect=lambda orders: orders):
+            Order.objects.create(user=self.user, external_id='B1', exchange_type='Bybit', price=1, amount=1, cost=1)
+            importer.flush(rows)
+        self.assertEqual((importer.result['created'], importer.result['duplicates']), (0, 1))
+
+    def test_semicolon_file_with_russian_numbers(self):
+        result = self.run_import(
+            "Номер ордера;Тип;Курс;Кол-во;Банк;Дата\n"
+            "C1;Продажа;95,50 ₽;1 000;Сбербанк;01.03.2026 10:00\n"
+        )
+        self.assertEqual(result['created'], 1)
+        order = Order.objects.get(external_id='C1')
+        self.assertEqual((order.operation_type, order.price, order.amount), ('SELL', Decimal('95.50'), Decimal('1000')))
+        self.assertEqual(order.cost, Decimal('95500.00'))
+        self.assertEqual(order.bank_detail.name, 'Сбербанк')
+
+    def test_bad_numbers_are_row_errors(self):
+        for value in ['abc 12 xyz', '1-2', '12abc']:
+            with self.assertRaises(ValueError):
+                importers.parse_decimal(value, 'price')
+        self.assertEqual(importers.parse_decimal('100 USDT', 'amount'), Decimal('100'))
+        self.assertEqual(importers.parse_decimal('1 234,5', 'price'), Decimal('1234.5'))
+        result = self.run_import("type,price,amount\nbuy,abc 12 xyz,1\nbuy,95,1-2\nbuy,95,1\n")
+        self.assertEqual(result['created'], 1)
+        self.assertEqual([line for line, _ in result['errors']], [2, 3])
+
+    def test_thousands_grouping(self):
+        for value, expected in [
+            ('1,234,567', '1234567'), ('1.234.567', '1234567'), ('1,234,567.89', '1234567.89'),
+            ('1.234.567,89', '1234567.89'), ('$1,234.5', '1234.5'), ('1234,56', '1234.56'), ('0.5%', '0.5'),
+        ]:
+            with self.subTest(value):
+                self.assertEqual(importers.parse_decimal(value, 'cost'), Decimal(expected))
+        for value in ['12,34,567', '1,2345,678', '1,234.5.6', '1.234,5,6', ',5']:
+            with self.subTest(value), self.assertRaises(ValueError):
+                importers.parse_decimal(value, 'cost')
+
+    def test_non_positive_values_are_row_errors(self):
+        self.assertEqual(importers.parse_decimal('0', 'commission', allow_zero=True), Decimal(0))
+        with self.assertRaises(ValueError):
+            importers.parse_decimal('-1', 'commission', allow_zero=True)
+        result = self.run_import(
+            "type,price,amount,cost\nbuy,95,-1,\nbuy,0,1,\nsell,95,1,-95\nbuy,95,1,\n"
+        )
+        self.assertEqual(result['created'], 1)
+        self.assertEqual([line for line, _ in result['errors']], [2, 3, 4])
+        self.assertIn('больше нуля', result['errors'][0][1])
+
+    def test_missing_columns(self):
+        with self.assertRaises(ValueError):
+            self.run_import("order_id,price\nA1,95\n")
+
+
+class ExchangeClientTests(TestCase):
+    # Общий HTTP-клиент бирж против заглушки (orders/exchange_client.py)
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = FakeExchangeServer().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.reset()
+
+    def exchange(self, **options):
+        return exchange_client.ExchangeClient(
+            'BYBIT', self.server.url, time_path='/v5/market/time', backoff_base=0, **options,
+        )
+
+    def test_retries_temporary_errors(self):
+        client = self.exchange()
+        self.server.fail_next(503, 429)
+        response = client.request('GET', '/v5/fiat/order-record')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.server.requests_to(r'/v5/fiat/order-record')), 3)
+        metrics = client.metrics.snapshot()
+        self.assertEqual((metrics['requests'], metrics['retries'], metrics['errors']), (1, 2, 0))
+
+    def test_gives_up_after_max_retries(self):
+        client = self.exchange(max_retries=1)
+        self.server.fail_next(503, 503, 503)
+        response = client.request('GET', '/v5/fiat/order-record')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(len(self.server.requests_to(r'/v5/fiat/order-record')), 2)
+        self.assertEqual(client.metrics.snapshot()['errors'], 1)
+
+    def test_client_errors_are_not_retried(self):
+        client = self.exchange()
+        self.assertEqual(client.request('GET', '/unknown').status_code, 404)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_prepare_runs_on_every_attempt(self):
+        # Подпись зависит от времени — на повторе её нужно посчитать заново
+        client = self.exchange()
+        self.server.fail_next(503)
+        calls = []
+        client.request('GET', '/v5/fiat/order-record', prepare=lambda: calls.append(1) or {'params': {'n': len(calls)}})
+        self.assertEqual([request['query']['n'] for request in self.server.requests], ['1', '2'])
+
+    def test_clock_is_synced_once(self):
+        client = self.exchange()
+        client.now_ms()
+        client.now_ms()
+        self.assertEqual(len(self.server.requests_to(r'/v5/market/time')), 1)
+        self.assertLess(abs(client.clock_offset_ms), 1000)
+
+    def test_token_bucket_limits_rate(self):
+        bucket = exchange_client.TokenBucket(rate=50, capacity=2)
+        started = time.monotonic()
+        for _ in range(4):
+            bucket.acquire()
+        # Два токена сразу, ещё два — по 20 мс
+        self.assertGreaterEqual(time.monotonic() - started, 0.035)
+
+    def test_clients_are_shared_per_exchange(self):
+        exchange_client.reset_clients()
+        self.addCleanup(exchange_client.reset_clients)
+        with override_settings(EXCHANGE_CLIENTS={'HTX': {'base_url': self.server.url}}):
+            client = exchange_client.get_client('HTX')
+            self.assertIs(exchange_client.get_client('HTX'), client)
+            self.assertEqual(client.base_url, self.server.url)
+
+
+@override_settings(
+    ORDERS_SYNC_HISTORY_DAYS=2, ORDERS_SYNC_WINDOW_DAYS=1, ORDERS_SYNC_PAGE_SIZE=10, ORDERS_SYNC_MAX_PAGES=50,
+    ORDERS_SYNC_EXCHANGES=['BYBIT', 'HTX', 'MEXC'],
+)
+class ExchangeConnectorTests(TestCase):
+    # Коннекторы Bybit/HTX/MEXC против заглушки бирж и параллельный опрос (orders/services.py)
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = FakeExchangeServer(orders_per_day=24).start()
+        config = {'base_url': cls.server.url, 'backoff_base': 0}
+        cls.settings_override = override_settings(EXCHANGE_CLIENTS={name: config for name in ('BYBIT', 'HTX', 'MEXC')})
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        cls.server.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        exchange_client.reset_clients()
+        self.addCleanup(exchange_client.reset_clients)
+        self.server.reset()
+        self.user = User.objects.create_user(
+            'multi', 'multi@example.com', 'x',
+            bybit_api_key='bk', bybit_api_secret='bs', htx_access_key='hk', htx_private_key='hs',
+            mexc_api_key='mk', mexc_api_secret='ms',
+        )
+
+    def test_each_connector_loads_history(self):
+        for exchange_type, connector in services.CONNECTORS.items():
+            with self.subTest(exchange_type):
+                result = services.sync_exchange_orders(self.user, connector)
+                self.assertEqual(result['status'], 'success')
+                cursor = services.SyncCursor.objects.get(user=self.user, exchange_type=exchange_type)
+                self.assertTrue(cursor.backfill_done)
+                # 24 ордера в сутки за двое суток истории, плюс-минус края окон
+                count = UnprocessedOrder.objects.filter(user=self.user, exchange_type=exchange_type).count()
+                self.assertTrue(46 <= count <= 50, count)
+
+    def test_requests_are_signed(self):
+        now_ms = int(time.time() * 1000)
+        services.CONNECTORS['BYBIT'].fetch_page(self.user, now_ms - services.DAY_MS, now_ms, None)
+        services.CONNECTORS['HTX'].fetch_page(self.user, now_ms - services.DAY_MS, now_ms, None)
+        services.CONNECTORS['MEXC'].fetch_page(self.user, now_ms - services.DAY_MS, now_ms, None)
+        bybit, = self.server.requests_to(r'/v5/fiat/order-record')
+        self.assertEqual(bybit['headers']['X-BAPI-API-KEY'], 'bk')
+        self.assertIn('X-BAPI-SIGN', bybit['headers'])
+        htx, = self.server.requests_to(r'/v1/otc/order/list')
+        self.assertEqual(htx['query']['AccessKeyId'], 'hk')
+        self.assertIn('Signature', htx['query'])
+        mexc, = self.server.requests_to(r'/api/v3/c2c/order/list')
+        self.assertEqual(mexc['headers']['X-MEXC-APIKEY'], 'mk')
+        self.assertIn('signature', mexc['query'])
+
+    def test_fan_out_combines_exchange_results(self):
+        outcomes = {
+            'BYBIT': {'status': 'success', 'message': 'ok'},
+            'HTX': {'status': 'error', 'message': 'down'},
+            'MEXC': {'status': 'success', 'message': 'ok'},
+        }
+        with mock.patch.object(services, '_sync_in_thread', lambda user, connector: outcomes[connector.exchange_type]):
+            result = services.sync_user_orders(self.user)
+        self.assertEqual(result['status'], 'warning')
+        self.assertEqual(set(result['exchanges']), {'BYBIT', 'HTX', 'MEXC'})
+        self.assertIn('HTX: down', result['message'])
+
+    def test_only_configured_exchanges_are_polled(self):
+        self.user.htx_access_key = self.user.mexc_api_key = ''
+        self.assertEqual([connector.exchange_type for connector in services.configured_connectors(self.user)], ['BYBIT'])
+
+    @override_settings(ORDERS_SYNC_EXCHANGES=['BYBIT'])
+    def test_unverified_exchanges_are_off_by_default(self):
+        self.assertEqual([connector.exchange_type for connector in services.configured_connectors(self.user)], ['BYBIT'])
+        htx_only = User.objects.create_user('htx', 'htx@example.com', 'x', htx_access_key='hk', htx_private_key='hs')
+        self.assertEqual(list(sync.syncable_users()), [self.user])
+        self.assertEqual(services.sync_user_orders(htx_only)['status'], 'warning')
+        self.assertEqual(self.server.requests_to(r'/v1/otc/order/list'), [])
+
+
+class KeysetPaginationTests(TestCase):
+    # Keyset-пагинация списка ордеров по (created_at, id) (orders/views.py)
+
+    def setUp(self):
+        self.user = User.objects.create_user('pages', 'pages@example.com', 'x')
+        base = timezone.now().replace(microsecond=123456)
+        # Три ордера с одинаковым временем: порядок внутри них решает id
+        times = [base - timedelta(minutes=minutes) for minutes in (0, 1, 1, 1, 2, 3, 4)]
+        self.orders = [Order.objects.create(user=self.user, price=1, amount=1, cost=1, created_at=at) for at in times]
+        self.expected = [order.pk for order in sorted(self.orders, key=lambda order: (order.created_at, order.pk), reverse=True)]
+
+    def page(self, **params):
+        request = RequestFactory().get('/', params)
+        return views.keyset_page(request, Order.objects.filter(user=self.user), page_size=3)
+
+    def test_cursor_round_trip(self):
+        order = self.orders[0]
+        self.assertEqual(views.decode_cursor(views.encode_cursor(order)), (order.created_at, order.pk))
+        for raw in (None, '', 'abc', '1_2_3', 'x_1'):
+            self.assertIsNone(views.decode_cursor(raw))
+
+    def test_pages_forward_and_back(self):
+        seen = []
+        params = {}
+        pages = []
+        while True:
+            page = self.page(**params)
+            pages.append(page)
+            seen += [order.pk for order in page['items']]
+            if not page['next_cursor']:
+                break
+            params = {'after': page['next_cursor']}
+        self.assertEqual(seen, self.expected)
+        self.assertEqual([len(page['items']) for page in pages], [3, 3, 1])
+        self.assertIsNone(pages[0]['prev_cursor'])
+
+        back = self.page(before=pages[2]['prev_cursor'])
+        self.assertEqual([order.pk for order in back['items']], self.expected[3:6])
+        self.assertTrue(back['prev_cursor'])
+        first = self.page(before=back['prev_cursor'])
+        self.assertEqual([order.pk for order in first['items']], self.expected[:3])
+        self.assertIsNone(first['prev_cursor'])
+
+    def test_page_query_count_does_not_grow(self):
+        page = self.page()
+        with self.assertNumQueries(1):
+            self.page(after=page['next_cursor'])
+
+    def test_order_list_queries_do_not_depend_on_rows(self):
+        # Реквизиты подгружаются вместе с ордерами, а не запросом на строку
+        self.client.force_login(self.user)
+        bank = BankDetail.objects.create(user=self.user, name='Тинькофф')
+        Order.objects.filter(user=self.user).update(bank_detail=bank)
+        self.client.get(reverse('my_orders'))  # прогрев кэшей
+        with CaptureQueriesContext(connection) as few:
+            self.assertContains(self.client.get(reverse('my_orders')), 'Тинькофф')
+        Order.objects.bulk_create([Order(user=self.user, price=1, amount=1, cost=1, bank_detail=bank) for _ in range(20)])
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(reverse('my_orders'))
+        self.assertEqual(len(many), len(few))
+
+
+class TurnoverApiTests(TestCase):
+    # Итоги оборота за период одним агрегатом и списки ордеров страницами (api_get_turnover)
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('boss', 'boss@example.com', 'x')
+        self.user = User.objects.create_user('trader', 'trader@example.com', 'x')
+        self.client.force_login(self.admin)
+        self.day = timezone.localtime().replace(hour=12, minute=0, second=0, microsecond=0)
+        with self.captureOnCommitCallbacks(execute=True):  # P&L досчитывается после коммита записи
+            self.create_orders()
+
+    def create_orders(self):
+        for index in range(5):
+            Order.objects.create(
+                user=self.user, operation_type='BUY', price=90, amount=10, cost=900,
+                created_at=self.day - timedelta(minutes=index),
+            )
+        for index in range(3):
+            Order.objects.create(
+                user=self.user, operation_type='SELL', price=100, amount=10, cost=1000,
+                commission=1, commission_type='PERCENT', created_at=self.day + timedelta(minutes=index),
+            )
+        # За пределами периода
+        Order.objects.create(user=self.user, operation_type='BUY', price=90, amount=1, cost=90, created_at=self.day - timedelta(days=3))
+
+    def get(self, **params):
+        day = self.day.strftime('%Y-%m-%d')
+        return self.client.get(reverse('api_get_turnover', args=[self.user.pk]), {'start': day, 'end': day, **params})
+
+    def test_totals_for_period(self):
+        data = self.get().json()
+        self.assertEqual((data['buy_count'], data['sell_count']), (5, 3))
+        self.assertEqual(data['buy_sum'], '50,00')
+        self.assertEqual(data['buy_cost'], '4 500,00')
+        self.assertEqual(data['sell_cost'], '3 000,00')
+        # 30 USDT проданы по 100 ₽ минус 1% против покупки по 90 ₽
+        self.assertEqual(data['profit'], '270,00')
+
+    def test_order_lists_are_paged(self):
+        first = self.get(orders='BUY', limit=2).json()
+        self.assertEqual(len(first['orders']), 2)
+        ids = [order['id'] for order in first['orders']]
+        cursor = first['next_cursor']
+        while cursor:
+            page = self.get(orders='BUY', limit=2, after=cursor).json()
+            ids += [order['id'] for order in page['orders']]
+            cursor = page['next_cursor']
+        self.assertEqual(len(ids), 5)
+        self.assertEqual(len(set(ids)), 5)
+
+    def test_bad_period_and_non_admin(self):
+        self.assertEqual(self.client.get(reverse('api_get_turnover', args=[self.user.pk])).status_code, 400)
+        self.client.force_login(self.user)
+        self.assertEqual(self.get().status_code, 302)
+
+
+class TurnoverRollupTests(TestCase):
+    # Дневной оборот: приращения при изменении ордера совпадают с полной пересборкой (orders/rollups.py)
+
+    def setUp(self):
+        self.user = User.objects.create_user('rollup', 'rollup@example.com', 'x')
+        self.bank = BankDetail.objects.create(user=self.user, name='Сбербанк')
+        self.now = timezone.now()
+
+    def snapshot(self):
+        return sorted(
+            DailyTurnover.objects.filter(user=self.user).values_list(
+                'day', 'exchange_type', 'operation_type', 'bank_detail_id', 'amount_sum', 'cost_sum', 'commission_sum', 'orders_count',
+            )
+        )
+
+    def assert_matches_rebuild(self):
+        incremental = self.snapshot()
+        rollups.rebuild_turnover(user_id=self.user.pk)
+        self.assertEqual(incremental, self.snapshot())
+
+    def test_create_edit_delete_keep_rollup_exact(self):
+        first = Order.objects.create(
+            user=self.user, operation_type='SELL', price=100, amount=10, cost=1000,
+            commission=1, commission_type='PERCENT', bank_detail=self.bank, created_at=self.now,
+        )
+        Order.objects.create(user=self.user, operation_type='SELL', price=100, amount=5, cost=500, bank_detail=self.bank, created_at=self.now)
+        row = DailyTurnover.objects.get(user=self.user)
+        self.assertEqual((row.orders_count, row.amount_sum, row.commission_sum), (2, Decimal('15'), Decimal('10')))
+        self.assert_matches_rebuild()
+
+        # Перенос на другой день и смена стороны: строка уходит из одной группы в другую
+        first.created_at = self.now - timedelta(days=2)
+        first.operation_type = 'BUY'
+        first.save()
+        self.assertEqual(DailyTurnover.objects.filter(user=self.user).count(), 2)
+        self.assert_matches_rebuild()
+
+        first.delete()
+        self.assertEqual(DailyTurnover.objects.filter(user=self.user).count(), 1)
+        self.assert_matches_rebuild()
+
+    def test_bulk_changes_rebuild_days(self):
+        Order.objects.bulk_create([
+            Order(user=self.user, operation_type='BUY', price=90, amount=1, cost=90, created_at=self.now) for _ in range(3)
+        ])
+        self.assertFalse(DailyTurnover.objects.filter(user=self.user).exists())
+        day = rollups.order_day(self.now)
+        orders_bulk_changed(self.user.pk, day, day)
+        self.assertEqual(DailyTurnover.objects.get(user=self.user).orders_count, 3)
+
+
+class OrderStatusBatchTests(TestCase):
+    # Статусы всех ордеров страницы биржи одним запросом (api_orders_status_batch)
+
+    def setUp(self):
+        self.user = User.objects.create_user('statuses', 'statuses@example.com', 'x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # Номера длиннее 2^53 — только строки
+        self.big = '1864531425637572608'
+        Order.objects.create(user=self.user, external_id=self.big, exchange_type='Bybit', price=1, amount=1, cost=1, screenshot='screenshots/a.png')
+        Order.objects.create(user=self.user, external_id='2001', exchange_type='Bybit', price=1, amount=1, cost=1, receipt_status='DONE')
+        Order.objects.create(user=self.user, external_id='2002', exchange_type='HTX', price=1, amount=1, cost=1)
+        other = User.objects.create_user('stranger', 'stranger@example.com', 'x')
+        Order.objects.create(user=other, external_id='2003', exchange_type='Bybit', price=1, amount=1, cost=1)
+
+    def post(self, ids, exchange_type=1):
+        return self.client.post(reverse('api_orders_status_batch'), {'exchangeType': exchange_type, 'ids': ids}, format='json')
+
+    def test_statuses_of_saved_orders_only(self):
+        with self.assertNumQueries(1):
+            response = self.post([self.big, 2001, '2002', '2003', '9999'])
+        orders = response.json()['orders']
+        self.assertEqual(set(orders), {self.big, '2001'})
+        self.assertTrue(orders[self.big]['screenshot'])
+        self.assertFalse(orders[self.big]['receipt'])
+        self.assertEqual(orders['2001']['receiptStatus'], 'DONE')
+        self.assertTrue(orders['2001']['receipt'])
+
+    def test_bad_requests(self):
+        self.assertEqual(self.post('2001').status_code, 400)
+        self.assertEqual(self.post(['2001'], exchange_type=99).status_code, 400)
+        self.assertEqual(self.post([str(n) for n in range(views.ORDER_STATUS_BATCH_LIMIT + 1)]).status_code, 400)
+
+
+class ConditionalGetTests(TestCase):
+    # ETag / If-None-Match на эндпоинтах расширения (orders/versions.py)
+
+    def setUp(self):
+        self.user = User.objects.create_user('etag', 'etag@example.com', 'x')
+        self.client = APIClient()
+        # По токену: пользователь (и его версии) читается заново на каждый запрос
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.user).key}')
+        self.order = Order.objects.create(user=self.user, external_id='7001', exchange_type='Bybit', price=1, amount=1, cost=1)
+
+    def get_order(self, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(reverse('api_order'), {'id': '7001', 'exchangeType': 1}, **headers)
+
+    def test_unchanged_order_is_not_modified(self):
+        response = self.get_order()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        with self.assertNumQueries(1):  # токен вместе с пользователем, по ордерам ничего
+            self.assertEqual(self.get_order(response['ETag']).status_code, 304)
+
+        self.order.price = 2
+        self.order.save()
+        changed = self.get_order(response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+        self.assertEqual(changed.json()['price'], '2.00')
+
+    def test_bank_details_follow_their_version(self):
+        response = self.client.get(reverse('api_details'))
+        etag = response['ETag']
+        self.assertEqual(self.client.get(reverse('api_details'), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.client.post(reverse('api_details'), {'name': 'Альфа'}, format='json')
+        response = self.client.get(reverse('api_details'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Альфа', [detail['name'] for detail in response.json()])
+
+    def test_profile_etag_is_content_hash(self):
+        etag = self.client.get(reverse('api_users_me'))['ETag']
+        self.assertEqual(self.client.get(reverse('api_users_me'), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.user.inn = '770000000000'
+        self.user.save()
+        self.assertEqual(self.client.get(reverse('api_users_me'), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class UserSearchTests(TestCase):
+    # Поиск пользователей в админке: ID, префикс логина, нечёткое совпадение (orders/search.py)
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.users = {
+            name: User.objects.create_user(name, f'{name}@example.com', 'x')
+            for name in ('ivan', 'ivanov', 'ivan_petrov', 'petr_ivanenko', 'anna')
+        }
+
+    def names(self, query, **options):
+        return [row['username'] for row in search.search_users(query, **options)]
+
+    def test_prefix_matches_rank_shorter_first(self):
+        self.assertEqual(self.names('IVAN')[:3], ['ivan', 'ivanov', 'ivan_petrov'])
+
+    def test_fuzzy_matches_follow_prefix_matches(self):
+        names = self.names('ivan')
+        self.assertEqual(names[-1], 'petr_ivanenko')
+        self.assertEqual(len(names), len(set(names)))
+        # Двухбуквенный запрос — только префикс
+        self.assertEqual(self.names('an'), ['anna'])
+
+    def test_exact_id_comes_first(self):
+        anna = self.users['anna']
+        self.assertEqual(search.search_users(str(anna.pk))[0], {'id': anna.pk, 'username': 'anna'})
+
+    def test_limit_empty_query_and_cache(self):
+        self.assertEqual(len(self.names('ivan', limit=2)), 2)
+        self.assertEqual(self.names('   '), [])
+        self.names('petr')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.names(' PETR '), ['petr_ivanenko', 'ivan_petrov'])
+
+    def test_endpoint_is_admin_only(self):
+        self.client.force_login(self.users['anna'])
+        self.assertEqual(self.client.get(reverse('api_search_users'), {'q': 'ivan'}).status_code, 302)
+        self.client.force_login(User.objects.create_superuser('root', 'root@example.com', 'x'))
+        response = self.client.get(reverse('api_search_users'), {'q': 'ivan'})
+        self.assertEqual(response.json()[0]['username'], 'ivan')
+
+
+class BankDetailCacheTests(TestCase):
+    # Реквизиты: кэш по details_version и upsert по (user, name) (orders/bank_details.py)
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user('details', 'details@example.com', 'x')
+        self.bank = BankDetail.objects.create(user=self.user, name='Сбербанк')
+
+    def fresh_user(self):
+        return User.objects.get(pk=self.user.pk)
+
+    def test_known_name_resolves_from_cache(self):
+        bank_details.get_bank_details(self.user)
+        with self.assertNumQueries(0):
+            detail = bank_details.resolve_bank_detail(self.user, ' Сбербанк ')
+        self.assertEqual(detail.pk, self.bank.pk)
+        self.assertIsNone(bank_details.resolve_bank_detail(self.user, '  '))
+
+    def test_new_name_is_created_once_and_bumps_version(self):
+        version = self.fresh_user().details_version
+        detail = bank_details.resolve_bank_detail(self.user, 'Тинькофф')
+        user = self.fresh_user()
+        self.assertEqual(user.details_version, version + 1)
+        self.assertEqual(
+            [row['name'] for row in bank_details.get_bank_details(user)], ['Сбербанк', 'Тинькофф'],
+        )
+        self.assertEqual(bank_details.resolve_bank_detail(user, 'Тинькофф').pk, detail.pk)
+        self.assertEqual(BankDetail.objects.filter(user=self.user, name='Тинькофф').count(), 1)
+
+    def test_deleted_detail_leaves_list_and_is_restored_by_name(self):
+        self.assertTrue(bank_details.delete_bank_detail(self.user, self.bank.pk))
+        self.assertFalse(bank_details.delete_bank_detail(self.user, self.bank.pk))
+        user = self.fresh_user()
+        self.assertEqual(bank_details.get_bank_details(user), [])
+
+        detail = bank_details.resolve_bank_detail(user, 'Сбербанк')
+        self.assertEqual(detail.pk, self.bank.pk)
+        self.bank.refresh_from_db()
+        self.assertFalse(self.bank.is_deleted)
+        self.assertEqual(len(bank_details.get_bank_details(self.fresh_user())), 1)
+
+
+class ScreenshotPipelineTests(TestCase):
+    # Скриншоты: дедупликация по хэшу и пережатие в файлы по хэшу содержимого (orders/screenshots.py)
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        self.override = override_settings(MEDIA_ROOT=self.media.name, SCREENSHOT_FORMAT='WEBP')
+        self.override.enable()
+        self.addCleanup(self.override.disable)
+        self.user = User.objects.create_user('shots', 'shots@example.com', 'x')
+        self.order = Order.objects.create(user=self.user, price=1, amount=1, cost=1)
+
+    def upload(self, color='red', size=(2400, 1200)):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, color).save(buffer, format='PNG')
+        return SimpleUploadedFile('shot.png', buffer.getvalue(), content_type='image/png')
+
+    def test_upload_is_processed_into_content_addressed_webp(self):
+        shot = screenshots.attach_screenshot(self.order, self.upload())
+        raw_name = shot.image.name
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.screenshot, raw_name)
+
+        with self.captureOnCommitCallbacks(execute=True):  # исходник удаляется после коммита
+            self.assertEqual(screenshots.process_pending(), 1)
+        shot.refresh_from_db()
+        self.assertEqual(shot.status, 'READY')
+        self.assertEqual(shot.image.name, screenshots.content_path(shot.content_hash, '', 'webp'))
+        self.assertEqual(shot.thumbnail.name, screenshots.content_path(shot.content_hash, '_thumb', 'webp'))
+        self.assertEqual((shot.width, shot.height), (1920, 960))
+        with default_storage.open(shot.thumbnail.name) as thumb:
+            self.assertEqual(Image.open(thumb).size, (320, 160))
+        self.assertFalse(default_storage.exists(raw_name))
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.screenshot, shot.image.name)
+        self.assertEqual(self.order.screenshot_thumbnail, shot.thumbnail.name)
+
+    def test_same_image_reuses_processed_files(self):
+        first = screenshots.attach_screenshot(self.order, self.upload())
+        screenshots.process_pending()
+        first.refresh_from_db()
+
+        self.assertEqual(screenshots.attach_screenshot(self.order, self.upload()).pk, first.pk)
+        other = Order.objects.create(user=self.user, price=1, amount=1, cost=1)
+        copy = screenshots.attach_screenshot(other, self.upload())
+        self.assertEqual(copy.status, 'READY')
+        self.assertEqual(copy.image.name, first.image.name)
+        self.assertEqual(OrderScreenshot.objects.filter(status='PENDING').count(), 0)
+
+    def test_pending_copy_shares_the_raw_file_and_its_processing(self):
+        first = screenshots.attach_screenshot(self.order, self.upload())
+        other = Order.objects.create(user=self.user, price=1, amount=1, cost=1)
+        copy = screenshots.attach_screenshot(other, self.upload())
+        self.assertEqual((copy.status, copy.image.name), ('PENDING', first.image.name))
+        _, files = default_storage.listdir(first.image.name.rsplit('/', 1)[0])
+        self.assertEqual(len(files), 1)  # второй исходник не записан
+
+        raw_name = first.image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(screenshots.process_pending(), 1)  # вторую копию обработка уже закрыла
+        copy.refresh_from_db()
+        first.refresh_from_db()
+        self.assertEqual((copy.status, copy.image.name), ('READY', first.image.name))
+        other.refresh_from_db()
+        self.assertEqual(other.screenshot, first.image.name)
+        self.assertFalse(default_storage.exists(raw_name))
+
+    def test_raw_file_survives_rollback(self):
+        shot = screenshots.attach_screenshot(self.order, self.upload())
+        with mock.patch.object(screenshots, 'show_screenshot', side_effect=RuntimeError('сбой')):
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                screenshots.process_pending()
+        self.assertEqual(callbacks, [])
+        shot.refresh_from_db()
+        self.assertEqual(shot.status, 'FAILED')
+        self.assertTrue(default_storage.exists(shot.image.name))
+
+    def test_not_an_image_is_marked_failed(self):
+        shot = screenshots.attach_screenshot(
+            self.order, SimpleUploadedFile('check.pdf', b'%PDF-1.4', content_type='application/pdf'),
+        )
+        self.assertEqual(screenshots.process_pending(), 1)
+        shot.refresh_from_db()
+        self.assertEqual(shot.status, 'FAILED')
+        self.assertTrue(default_storage.exists(shot.image.name))
+
+
+class OrderExportTests(TestCase):
+    # Потоковая выгрузка ордеров и оборота в CSV/XLSX (orders/exports.py)
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('accountant', 'accountant@example.com', 'x')
+        self.client.force_login(self.admin)
+        self.user = User.objects.create_user('trader', 'trader@example.com', 'x')
+        self.bank = BankDetail.objects.create(user=self.user, name='Сбербанк')
+        day = timezone.make_aware(timezone.datetime(2026, 3, 1, 12))
+        for i in range(5):
+            Order.objects.create(
+                user=self.user, external_id=f'X{i}', operation_type='BUY' if i % 2 else 'SELL',
+                price=100, amount=i + 1, cost=100 * (i + 1), commission=1, commission_type='PERCENT',
+                bank_detail=self.bank, created_at=day + timedelta(minutes=i),
+            )
+        Order.objects.create(user=self.user, external_id='LATE', price=1, amount=1, cost=1, created_at=day + timedelta(days=3))
+
+    def export(self, kind='orders', **params):
+        params = {'start': '2026-03-01', 'end': '2026-03-01', **params}
+        return self.client.get(reverse(f'admin_export_{kind}'), params)
+
+    def read_csv(self, response):
+        self.assertTrue(response.streaming)
+        text = b''.join(response.streaming_content).decode()
+        self.assertTrue(text.startswith('\ufeff'))
+        return list(csv.reader(io.StringIO(text[1:]), delimiter=';'))
+
+    def test_csv_streams_filtered_orders_in_chunks(self):
+        with mock.patch.object(exports, 'EXPORT_CHUNK_SIZE', 2):
+            response = self.export(user_id=self.user.pk)
+            chunks = list(response.streaming_content)
+        self.assertEqual(response['X-Accel-Buffering'], 'no')
+        self.assertIn(f'orders_{self.user.pk}_2026-03-01_2026-03-01.csv', response['Content-Disposition'])
+        self.assertGreaterEqual(len(chunks), 4)  # заголовок и пачки по две строки
+
+        rows = list(csv.reader(io.StringIO(b''.join(chunks).decode()[1:]), delimiter=';'))
+        self.assertEqual(rows[0], [title for title, _ in exports.ORDER_COLUMNS])
+        self.assertEqual([row[2] for row in rows[1:]], ['X0', 'X1', 'X2', 'X3', 'X4'])
+        self.assertEqual(rows[1][3], '2026-03-01 12:00:00')
+        self.assertEqual(rows[1][-1], 'Сбербанк')
+
+        sells = self.read_csv(self.export(orders='SELL'))
+        self.assertEqual([row[2] for row in sells[1:]], ['X0', 'X2', 'X4'])
+
+    def test_xlsx_is_a_valid_workbook(self):
+        response = self.export(format='xlsx')
+        self.assertIn('.xlsx', response['Content-Disposition'])
+        book = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertIsNone(book.testzip())
+        self.assertIn('[Content_Types].xml', book.namelist())
+        sheet = book.read('xl/worksheets/sheet1.xml').decode()
+        self.assertEqual(sheet.count('<row>'), 6)
+        self.assertIn('<t>X4</t>', sheet)
+        self.assertIn('<c><v>500.00</v></c>', sheet)
+
+    def test_xlsx_cells_escape_text(self):
+        self.assertEqual(exports.xlsx_cell('<a & b>'), '<c t="inlineStr"><is><t>&lt;a &amp; b&gt;</t></is></c>')
+        self.assertEqual(exports.xlsx_cell(None), '<c/>')
+        self.assertEqual(exports.xlsx_cell(Decimal('1.50')), '<c><v>1.50</v></c>')
+
+    def test_turnover_export_and_validation(self):
+        rows = self.read_csv(self.export('turnover'))
+        self.assertEqual(rows[0], [title for title, _ in exports.TURNOVER_COLUMNS])
+        self.assertEqual(sum(int(row[-1]) for row in rows[1:]), 5)
+
+        self.assertEqual(self.export(format='pdf').status_code, 400)
+        self.assertEqual(self.export(start='вчера').status_code, 400)
+        self.assertEqual(self.export(user_id='1; DROP').status_code, 400)
+        self.client.force_login(self.user)
+        self.assertEqual(self.export().status_code, 302)
+
+
+class CommissionColumnTests(TestCase):
+    # Комиссия в ₽ и сумма с комиссией как generated columns (Order.commission_rub / net_cost)
+
+    def setUp(self):
+        self.user = User.objects.create_user('fees', 'fees@example.com', 'x')
+
+    def order(self, operation_type, commission_type, commission):
+        order = Order.objects.create(
+            user=self.user, operation_type=operation_type, price=100, amount=10, cost=1000,
+            commission=commission, commission_type=commission_type,
+        )
+        order.refresh_from_db()
+        return order
+
+    def test_columns_match_commission_in_rub(self):
+        cases = [
+            ('BUY', 'PERCENT', Decimal('1.5'), Decimal('15.00'), Decimal('1015.00')),
+            ('SELL', 'PERCENT', Decimal('1.5'), Decimal('15.00'), Decimal('985.00')),
+            ('BUY', 'FIX', Decimal('20'), Decimal('20.00'), Decimal('1020.00')),
+            ('SELL', 'FIX', Decimal('20'), Decimal('20.00'), Decimal('980.00')),
+            ('BUY', 'PERCENT', Decimal('0'), Decimal('0.00'), Decimal('1000.00')),
+        ]
+        for operation_type, commission_type, commission, commission_rub, net_cost in cases:
+            with self.subTest(operation_type=operation_type, commission_type=commission_type, commission=commission):
+                order = self.order(operation_type, commission_type, commission)
+                self.assertEqual(order.commission_rub, commission_rub)
+                self.assertEqual(order.commission_rub, order.commission_in_rub())
+                self.assertEqual(order.net_cost, net_cost)
+
+    def test_columns_follow_queryset_updates(self):
+        order = self.order('SELL', 'PERCENT', 2)
+        Order.objects.filter(pk=order.pk).update(commission_type='FIX', commission=50)
+        order.refresh_from_db()
+        self.assertEqual((order.commission_rub, order.net_cost), (Decimal('50.00'), Decimal('950.00')))
+
+    def test_turnover_sums_commission_rub(self):
+        self.order('BUY', 'PERCENT', 1)
+        self.order('BUY', 'FIX', 5)
+        rollups.rebuild_turnover(user_id=self.user.pk)
+        row = DailyTurnover.objects.get(user=self.user)
+        self.assertEqual(row.commission_sum, Decimal('15.00'))
+        self.assertEqual(row.orders_count, 2)
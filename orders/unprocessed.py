@@ -0,0 +1,107 @@
+# orders/unprocessed.py
+# Принятие синхронизированных с биржи ордеров (UnprocessedOrder) в "Мои ордеры" пачкой:
+# выбранные строки или все по фильтру (даты, сторона, биржа) с общими реквизитом и комиссией.
+# Ордера пишутся одним bulk_create, строки из списка удаляются одним DELETE — в одной транзакции.
+# bulk_create сигналов не шлёт, поэтому оборот, P&L, версия и чеки — явно, одним вызовом на пачку
+from decimal import Decimal
+
+from django.db import transaction
+
+from .bank_details import resolve_bank_detail
+from .events import publish
+from .models import Order, UnprocessedOrder, User
+from .receipts import enqueue_receipts
+from .rollups import order_day
+from .services import ORDER_EXCHANGE_NAMES
+from .signals import orders_bulk_changed
+
+ACCEPT_LIMIT = 2000  # строк за запрос: дольше держать блокировку пользователя не стоит
+COMMISSION_TYPES = ('PERCENT', 'FIX')
+EXTERNAL_ID_LENGTH = Order._meta.get_field('external_id').max_length
+
+
+def select_unprocessed(user, ids=None, date_from=None, date_to=None, operation='', exchange=''):
+    # ids — выбранные строки; иначе фильтр. date_to — начало дня после последнего (как в filter_orders)
+    rows = UnprocessedOrder.objects.filter(user=user)
+    if ids is not None:
+        rows = rows.filter(pk__in=ids)
+    if date_from:
+        rows = rows.filter(created_at__gte=date_from)
+    if date_to:
+        rows = rows.filter(created_at__lt=date_to)
+    if operation:
+        rows = rows.filter(operation_type=operation)
+    if exchange:
+        rows = rows.filter(exchange_type=exchange)
+    return rows
+
+
+def accept_unprocessed(user, rows, bank_name='', commission=Decimal(0), commission_type='PERCENT'):
+    # rows — QuerySet из select_unprocessed. Возвращает, сколько ордеров создано,
+    # сколько строк уже было среди ордеров (например, сохранены расширением) и сколько осталось сверх лимита
+    if commission_type not in COMMISSION_TYPES:
+        raise ValueError(f"commission_type: ожидается {'/'.join(COMMISSION_TYPES)} ({commission_type!r})")
+    if commission < 0:
+        raise ValueError("Комиссия не может быть отрицательной")
+
+    with transaction.atomic():
+        # Принятие и запись из расширения (orders/order_writes.py) одного пользователя — по очереди
+        list(User.objects.select_for_update().filter(pk=user.pk).values_list('pk'))
+        staged = list(
+            rows.order_by('created_at', 'id')
+            .values('id', 'order_id', 'exchange_type', 'operation_type', 'price', 'amount', 'created_at')[:ACCEPT_LIMIT + 1]
+        )
+        remaining = max(len(staged) - ACCEPT_LIMIT, 0)
+        staged = staged[:ACCEPT_LIMIT]
+        if not staged:
+            return {'accepted': 0, 'skipped': 0, 'remaining': 0}
+
+        known = existing_orders(user, staged)
+        bank = resolve_bank_detail(user, bank_name) if bank_name else None
+        orders = []
+        for row in staged:
+            exchange = ORDER_EXCHANGE_NAMES.get(row['exchange_type'], row['exchange_type'])
+            external_id = row['order_id'][:EXTERNAL_ID_LENGTH]
+            if (exchange, external_id) in known:
+                continue
+            known.add((exchange, external_id))
+            orders.append(Order(
+                user=user,
+                external_id=external_id,
+                exchange_type=exchange,
+                operation_type=row['operation_type'],
+                price=row['price'],
+                amount=row['amount'],
+                cost=(row['price'] * row['amount']).quantize(Decimal('0.01')),
+                bank_detail=bank,
+                commission=commission,
+                commission_type=commission_type,
+                created_at=row['created_at'],
+            ))
+
+        Order.objects.bulk_create(orders, batch_size=500)
+        UnprocessedOrder.objects.filter(pk__in=[row['id'] for row in staged]).delete()
+        publish(user.pk, 'unprocessed', removed=len(staged))
+        if orders:
+            enqueue_receipts(user, orders)
+            days = [order_day(order.created_at) for order in orders]
+            orders_bulk_changed(user.pk, min(days), max(days))
+
+    return {'accepted': len(orders), 'skipped': len(staged) - len(orders), 'remaining': remaining}
+
+
+def existing_orders(user, staged):
+    # Уже сохранённые ордера среди выбранных строк: по IN-запросу на биржу
+    by_exchange = {}
+    for row in staged:
+        exchange = ORDER_EXCHANGE_NAMES.get(row['exchange_type'], row['exchange_type'])
+        by_exchange.setdefault(exchange, []).append(row['order_id'][:EXTERNAL_ID_LENGTH])
+
+    known = set()
+    for exchange, ids in by_exchange.items():
+        known.update(
+            (exchange, external_id)
+            for external_id in Order.objects.filter(user=user, exchange_type=exchange, external_id__in=ids)
+            .values_list('external_id', flat=True)
+        )
+    return known
@@ -16,13 +16,32 @@ urlpatterns = [
     path('delete/<int:order_id>/', views.delete_order, name='delete_order'),
     path('upload_screen/<int:order_id>/', views.upload_screenshot, name='upload_screenshot'),
     path('upload-screenshot/<int:order_id>/', views.upload_screenshot, name='upload_screenshot'),
+    path('screenshot/<int:order_id>/', views.order_screenshot, name='order_screenshot'),
+    path('screenshot/<int:order_id>/thumb/', views.order_screenshot, {'thumbnail': True}, name='order_screenshot_thumb'),
     path('p2p-admin/login/', views.admin_login, name='admin_login'),
     path('p2p-admin/logout/', views.admin_logout, name='admin_logout'),
 
     path('p2p-admin/users/', views.admin_users_list, name='admin_users'),
     path('p2p-admin/orders/', views.admin_orders_editor, name='admin_orders_editor'),
     path('p2p-admin/statistics/', views.admin_statistics, name='admin_stats'),
+    path('p2p-admin/import/', views.admin_import_orders, name='admin_import_orders'),
     path('p2p-admin/turnover/', views.admin_turnover_control, name='admin_turnover_control'),
     path('p2p-admin/api/search-users/', views.api_search_users, name='api_search_users'),
     path('p2p-admin/api/get-turnover/<int:user_id>/', views.api_get_turnover, name='api_get_turnover'),
+    path('p2p-admin/export/orders/', views.admin_export, {'kind': 'orders'}, name='admin_export_orders'),
+    path('p2p-admin/export/turnover/', views.admin_export, {'kind': 'turnover'}, name='admin_export_turnover'),
+    path('p2p-admin/profiling/', views.admin_profiling, name='admin_profiling'),
+
+    # API для браузерного расширения (TokenAuthentication)
+    path('api/order', views.api_order, name='api_order'),
+    path('api/order/by-string-id', views.api_order_by_string_id, name='api_order_by_string_id'),
+    path('api/details', views.api_details, name='api_details'),
+    path('api/details/<int:detail_id>', views.api_detail_delete, name='api_detail_delete'),
+    path('api/users/me', views.api_users_me, name='api_users_me'),
+    path('api/order/screenshot', views.api_order_screenshot, name='api_order_screenshot'),
+    path('api/order/status-batch', views.api_orders_status_batch, name='api_orders_status_batch'),
+    path('api/orders/batch', views.api_orders_batch, name='api_orders_batch'),
+    path('api/unprocessed/accept', views.api_unprocessed_accept, name='api_unprocessed_accept'),
+    path('api/events', views.order_events, name='order_events'),
+    path('api/events/token', views.api_events_token, name='order_events_token'),
 ]
\ No newline at end of file
@@ -0,0 +1,53 @@
+# orders/versions.py
+# Версии данных пользователя для условных GET (ETag / If-None-Match) в API расширения.
+# Версия растёт при каждом изменении, поэтому по ней можно ответить 304, не читая таблицу ордеров.
+import hashlib
+import json
+
+from django.db.models import F
+from django.utils.http import parse_etags, quote_etag
+from rest_framework.response import Response
+
+from .models import User
+
+
+def bump_orders_version(user_id):
+    User.objects.filter(pk=user_id).update(orders_version=F('orders_version') + 1)
+
+
+def bump_details_version(user_id):
+    # Название реквизита входит и в ответ по ордеру, поэтому меняются обе версии
+    User.objects.filter(pk=user_id).update(
+        details_version=F('details_version') + 1,
+        orders_version=F('orders_version') + 1,
+    )
+
+
+def make_etag(*parts):
+    return quote_etag('-'.join(str(part) for part in parts))
+
+
+def payload_etag(payload):
+    # Для ответов без своей версии (профиль) — хэш самого содержимого
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return quote_etag(hashlib.sha1(raw.encode()).hexdigest())
+
+
+def not_modified(request, etag):
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    etags = parse_etags(header)
+    return '*' in etags or etag in etags
+
+
+def etag_headers(etag):
+    # no-cache: браузер хранит ответ, но каждый раз перепроверяет его по If-None-Match
+    return {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+
+
+def conditional_response(request, etag, build):
+    # build() вызывается только если у клиента нет актуальной версии
+    if not_modified(request, etag):
+        return Response(status=304, headers=etag_headers(etag))
+    return Response(build(), headers=etag_headers(etag))
@@ -1,18 +1,38 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from .services import sync_bybit_orders
+from .sync import request_sync
+from .services import ORDER_EXCHANGE_NAMES
+from .exports import EXPORT_FORMATS, export_orders, export_response, export_turnover
+from .events import can_stream, event_stream, events_enabled, issue_stream_token, stream_token_user_id
+from .bank_details import delete_bank_detail, get_bank_details, resolve_bank_detail
+from .importers import IMPORT_FORMATS, import_orders, parse_decimal
+from .media import serve_file
+from .order_writes import ORDER_BATCH_LIMIT, write_orders
+from .pnl import DEFAULT_METHOD, PNL_METHODS, realized_pnl
+from .screenshots import attach_screenshot
+from .search import search_users
+from .unprocessed import ACCEPT_LIMIT, accept_unprocessed, select_unprocessed
+from core.profiling import slowest_requests
+from .versions import conditional_response, etag_headers, make_etag, not_modified, payload_etag
 
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.forms import AuthenticationForm
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
-from .models import Order, BankDetail, UnprocessedOrder, User
+from .models import Order, BankDetail, UnprocessedOrder, User, SyncState, DailyTurnover
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.hashers import make_password
 from django.utils import timezone
 from .models import Order, BankDetail 
 import datetime
-from django.http import JsonResponse, HttpResponse
+import json
+from decimal import Decimal
+from urllib.parse import urlencode
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+from django.http import JsonResponse, HttpResponse, Http404, StreamingHttpResponse
+from rest_framework.authtoken.models import Token
 from .models import Order, User 
 
 from django.shortcuts import render, redirect
@@ -23,7 +43,8 @@ from django.contrib.auth.models import User  # Или твоя модель по
 from .models import Order # Убедись, что импорт правильный
 
 
-from django.db.models import Sum, Q
+from django.db import IntegrityError
+from django.db.models import Sum, Q, Count
 from django.contrib.auth.decorators import user_passes_test
 
 from django.shortcuts import render, redirect
@@ -42,47 +63,127 @@ def my_orders_list(request):
     # ЛОГИКА СОЗДАНИЯ
     if request.method == 'POST' and 'create_order' in request.POST:
         raw_date = request.POST.get('created_at')
-        order_date = datetime.datetime.strptime(raw_date, '%Y-%m-%dT%H:%M') if raw_date else timezone.now()
+        order_date = timezone.make_aware(datetime.datetime.strptime(raw_date, '%Y-%m-%dT%H:%M')) if raw_date else timezone.now()
 
         # 1. Получаем название банка из формы
         bank_name = request.POST.get('details') 
         
-        # 2. Ищем этот банк в базе данных пользователя или создаем новый, если его нет
+        # 2. Ищем этот банк среди реквизитов пользователя или создаем новый, если его нет
         # Это превращает строку "Сбербанк" в объект, который понимает база данных
-        bank_instance, created = BankDetail.objects.get_or_create(
-            user=request.user,
-            name=bank_name
-        )
+        bank_instance = resolve_bank_detail(request.user, bank_name)
 
         # 3. Теперь создаем ордер, передавая готовый объект банка
-        Order.objects.create(
-            user=request.user,
-            external_id=request.POST.get('external_id'),
-            price=request.POST.get('price') or 0,
-            amount=request.POST.get('amount') or 0,
-            cost=request.POST.get('cost') or 0,
-            operation_type=request.POST.get('operation_type'),
-            exchange_type=request.POST.get('exchange'),
-            
-            # ВАЖНО: передаем объект, а не строку
-            bank_detail=bank_instance, 
-            
-            commission=request.POST.get('commission_value') or 0,
-            commission_type=request.POST.get('commission_type'),
-            created_at=order_date
-        )
+        try:
+            Order.objects.create(
+                user=request.user,
+                external_id=request.POST.get('external_id'),
+                price=request.POST.get('price') or 0,
+                amount=request.POST.get('amount') or 0,
+                cost=request.POST.get('cost') or 0,
+                operation_type=request.POST.get('operation_type'),
+                exchange_type=request.POST.get('exchange'),
+
+                # ВАЖНО: передаем объект, а не строку
+                bank_detail=bank_instance,
+
+                commission=request.POST.get('commission_value') or 0,
+                commission_type=request.POST.get('commission_type'),
+                created_at=order_date
+            )
+        except IntegrityError:
+            messages.error(request, duplicate_order_message(request.POST))
         return redirect('my_orders')
 
-    orders = Order.objects.filter(user=request.user).order_by('-created_at')
+    orders, filters = filter_orders(request, Order.objects.filter(user=request.user))
+    page = keyset_page(request, orders.select_related('bank_detail'))
     current_time = timezone.now().strftime('%Y-%m-%dT%H:%M')
     
     return render(request, 'orders/my_orders.html', {
-        'orders': orders,
+        'orders': page['items'],
+        'page': page,
+        'filters': filters,
+        'filter_query': urlencode({k: v for k, v in filters.items() if v}),
+        'exchanges': ORDER_EXCHANGE_NAMES.values(),
         'default_banks': default_banks,
         'current_time': current_time
     })
 
 
+ORDERS_PAGE_SIZE = 50
+CURSOR_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+def encode_cursor(order):
+    # Курсор = (created_at в микросекундах, id): точная позиция в сортировке без OFFSET
+    micros = (order.created_at - CURSOR_EPOCH) // datetime.timedelta(microseconds=1)
+    return f"{micros}_{order.pk}"
+
+def decode_cursor(raw):
+    try:
+        micros, pk = raw.split('_')
+        return CURSOR_EPOCH + datetime.timedelta(microseconds=int(micros)), int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+def parse_filter_date(raw):
+    try:
+        day = datetime.datetime.strptime(raw, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        return None
+    return timezone.make_aware(day)
+
+def filter_orders(request, orders):
+    # Фильтры страницы "Мои ордеры" — в SQL, а не в шаблоне
+    filters = {
+        'date_from': request.GET.get('date_from', ''),
+        'date_to': request.GET.get('date_to', ''),
+        'exchange': request.GET.get('exchange', ''),
+        'operation': request.GET.get('operation', ''),
+    }
+
+    # Диапазон по самому created_at (без приведения к дате), чтобы работал индекс
+    date_from = parse_filter_date(filters['date_from'])
+    if date_from:
+        orders = orders.filter(created_at__gte=date_from)
+    date_to = parse_filter_date(filters['date_to'])
+    if date_to:
+        orders = orders.filter(created_at__lt=date_to + datetime.timedelta(days=1))
+    if filters['exchange']:
+        orders = orders.filter(exchange_type=filters['exchange'])
+    if filters['operation']:
+        orders = orders.filter(operation_type=filters['operation'])
+
+    return orders, filters
+
+def keyset_page(request, orders, page_size=ORDERS_PAGE_SIZE):
+    # Keyset-пагинация по (created_at, id): время страницы не зависит от её номера
+    after = decode_cursor(request.GET.get('after'))
+    before = decode_cursor(request.GET.get('before'))
+
+    if before:
+        created_at, pk = before
+        rows = list(
+            orders.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk))
+            .order_by('created_at', 'id')[:page_size + 1]
+        )
+        has_prev = len(rows) > page_size
+        items = rows[:page_size][::-1]
+        has_next = True
+    else:
+        if after:
+            created_at, pk = after
+            orders = orders.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+        rows = list(orders.order_by('-created_at', '-id')[:page_size + 1])
+        has_next = len(rows) > page_size
+        items = rows[:page_size]
+        has_prev = bool(after)
+
+    return {
+        'items': items,
+        'next_cursor': encode_cursor(items[-1]) if items and has_next else None,
+        'prev_cursor': encode_cursor(items[0]) if items and has_prev else None,
+    }
+
+
 
 @login_required
 def edit_order(request, order_id):
@@ -93,10 +194,7 @@ def edit_order(request, order_id):
         bank_name = request.POST.get('details')
         
         # 2. Находим или создаем объект BankDetail для этого пользователя
-        bank_instance, created = BankDetail.objects.get_or_create(
-            user=request.user,
-            name=bank_name
-        )
+        bank_instance = resolve_bank_detail(request.user, bank_name)
 
         # 3. Обновляем поля ордера
         order.external_id = request.POST.get('external_id')
@@ -115,11 +213,19 @@ def edit_order(request, order_id):
         # Обработка даты
         raw_date = request.POST.get('created_at')
         if raw_date:
-            order.created_at = datetime.datetime.strptime(raw_date, '%Y-%m-%dT%H:%M')
+            order.created_at = timezone.make_aware(datetime.datetime.strptime(raw_date, '%Y-%m-%dT%H:%M'))
 
-        order.save()
+        try:
+            order.save()
+        except IntegrityError:
+            messages.error(request, duplicate_order_message(request.POST))
         return redirect('my_orders')
-    
+
+
+def duplicate_order_message(data):
+    # Номер ордера биржи уникален у пользователя (ограничение order_unique_external_id)
+    return f"Ордер {data.get('exchange')} с номером '{data.get('external_id')}' уже сохранён."
+
 
 @login_required
 def delete_order(request, order_id):
@@ -131,12 +237,24 @@ def delete_order(request, order_id):
 def upload_screenshot(request, order_id):
     if request.method == 'POST' and request.FILES.get('screenshot'):
         order = get_object_or_404(Order, id=order_id, user=request.user)
-        order.screenshot = request.FILES.get('screenshot')
-        order.save()
+        # Пережатие и миниатюру сделает manage.py process_screenshots
+        attach_screenshot(order, request.FILES['screenshot'])
     return redirect('my_orders')
 
 
 
+@login_required
+def order_screenshot(request, order_id, thumbnail=False):
+    # Файл отдаёт nginx/Apache (X-Accel-Redirect / X-Sendfile) — здесь только проверка владельца
+    orders = Order.objects.all() if is_admin(request.user) else Order.objects.filter(user=request.user)
+    order = get_object_or_404(orders.only('id', 'screenshot', 'screenshot_thumbnail'), pk=order_id)
+    field = order.screenshot_thumbnail if thumbnail else order.screenshot
+    if not field:
+        raise Http404("Скриншот не загружен")
+    return serve_file(request, field.name)
+
+
+
 @login_required
 def profile_settings(request):
     user = request.user
@@ -159,6 +277,8 @@ def profile_settings(request):
         user.bybit_api_secret = request.POST.get('bybit_secret')
         
         user.save()
+        # Ключи могли поменяться — подтягиваем ордера, не дожидаясь расписания
+        request_sync(user)
         return redirect('settings')
         
     return render(request, 'orders/settings.html')
@@ -166,17 +286,70 @@ def profile_settings(request):
 
 @login_required
 def unprocessed_orders_list(request):
-    # Синхронизация при заходе на страницу
-    sync_bybit_orders(request.user)
-    
+    # Синхронизация идёт в фоне (manage.py sync_orders), здесь только просим обновить пораньше
+    if request.method == 'POST' and 'sync_now' in request.POST:
+        request_sync(request.user)
+        return redirect('unprocessed_orders')
+
+    # Принять выбранные (или все по фильтру) в "Мои ордеры" одним запросом
+    if request.method == 'POST' and 'accept' in request.POST:
+        try:
+            rows, options = unprocessed_accept_params(request.user, request.POST, request.POST.getlist('ids'))
+            outcome = accept_unprocessed(request.user, rows, **options)
+        except ValueError as e:
+            messages.error(request, str(e))
+        else:
+            messages.success(request, unprocessed_accept_message(outcome))
+        return redirect('unprocessed_orders')
+
     # Получаем список для текущего юзера
     unprocessed_orders = UnprocessedOrder.objects.filter(user=request.user).order_by('-created_at')
+    sync_state = SyncState.objects.filter(user=request.user).first()
     
     return render(request, 'orders/unprocessed.html', {
-        'unprocessed_orders': unprocessed_orders
+        'unprocessed_orders': unprocessed_orders,
+        'sync_state': sync_state,
+        'bank_details': get_bank_details(request.user),
+        'accept_limit': ACCEPT_LIMIT,
     })
 
 
+def unprocessed_accept_params(user, data, ids):
+    # Общий разбор для страницы и API: выбранные id или фильтр + реквизит и комиссия
+    try:
+        ids = [int(pk) for pk in ids] if ids else None
+    except (TypeError, ValueError):
+        raise ValueError("ids: ожидаются числа")
+    date_from = parse_filter_date(data.get('date_from'))
+    date_to = parse_filter_date(data.get('date_to'))
+    operation = (data.get('operation') or '').upper()
+    if operation not in ('', 'BUY', 'SELL'):
+        raise ValueError(f"operation: ожидается BUY/SELL ({operation!r})")
+    if ids is None and not (date_from or date_to or operation or data.get('all')):
+        raise ValueError("Не выбрано ни одного ордера")
+
+    commission = str(data.get('commission') or '').strip()
+    rows = select_unprocessed(
+        user, ids=ids, date_from=date_from,
+        date_to=date_to + datetime.timedelta(days=1) if date_to else None,
+        operation=operation, exchange=(data.get('exchange') or '').upper(),
+    )
+    return rows, {
+        'bank_name': (data.get('bank') or '').strip(),
+        'commission': parse_decimal(commission, 'commission', allow_zero=True) if commission else Decimal(0),
+        'commission_type': (data.get('commission_type') or 'PERCENT').upper(),
+    }
+
+
+def unprocessed_accept_message(outcome):
+    message = f"Принято ордеров: {outcome['accepted']}"
+    if outcome['skipped']:
+        message += f", уже были сохранены: {outcome['skipped']}"
+    if outcome['remaining']:
+        message += f". Осталось ещё {outcome['remaining']} — повторите"
+    return message
+
+
 
 
 
@@ -229,7 +402,7 @@ def admin_users_list(request):
             'login': user.username,
             'bybit': bool(user.bybit_api_key and user.bybit_api_secret),
             'htx': bool(user.htx_access_key and user.htx_private_key),
-            'mexc': False, # Заглушка, если нет в модели
+            'mexc': bool(user.mexc_api_key and user.mexc_api_secret),
             'evotor': bool(user.evotor_login and user.evotor_password),
         })
 
@@ -334,56 +507,86 @@ def admin_turnover_control(request):
 @login_required
 @user_passes_test(is_admin)
 def api_search_users(request):
-    query = request.GET.get('q', '').strip()
-    if len(query) < 1:
-        return JsonResponse([], safe=False)
-    
-    # Теперь User.objects ссылается на твою таблицу orders_user
-    users = User.objects.filter(
-        Q(username__icontains=query) | Q(id__icontains=query)
-    )[:10]
-    
-    results = [{'id': u.id, 'username': u.username} for u in users]
+    # Точный ID, префикс логина и нечёткий поиск — по индексам, с коротким кэшем (orders/search.py)
+    results = search_users(request.GET.get('q', ''))
     return JsonResponse(results, safe=False)
 
 # API: Получение статистики
+def turnover_period(request):
+    # Период [start 00:00, end+1 00:00) по самому created_at — без приведения к дате, индекс работает
+    start = parse_filter_date(request.GET.get('start'))
+    end = parse_filter_date(request.GET.get('end'))
+    if not start or not end:
+        return None
+    return start, end + datetime.timedelta(days=1)
+
+TURNOVER_ORDERS_LIMIT = 500
+
 @login_required
 @user_passes_test(is_admin)
 def api_get_turnover(request, user_id):
-    start_date = request.GET.get('start')
-    end_date = request.GET.get('end')
-    
-    orders = Order.objects.filter(
-        user_id=user_id, 
-        created_at__date__range=[start_date, end_date]
-    ).order_by('-created_at')
-    
-    buy_orders = orders.filter(operation_type='BUY')
-    sell_orders = orders.filter(operation_type='SELL')
-    
-    buy_sum = buy_orders.aggregate(Sum('amount'))['amount__sum'] or 0
-    sell_sum = sell_orders.aggregate(Sum('amount'))['amount__sum'] or 0
+    period = turnover_period(request)
+    if period is None:
+        return JsonResponse({'error': 'Некорректный период'}, status=400)
+
+    orders = Order.objects.filter(user_id=user_id, created_at__gte=period[0], created_at__lt=period[1])
+
+    # Списки ордеров — отдельными постраничными запросами (?orders=BUY&after=...)
+    side = request.GET.get('orders')
+    if side in ('BUY', 'SELL'):
+        try:
+            limit = min(int(request.GET.get('limit', 100)), TURNOVER_ORDERS_LIMIT)
+        except ValueError:
+            limit = 100
+        page = keyset_page(request, orders.filter(operation_type=side).only('id', 'amount', 'cost', 'created_at'), page_size=limit)
+        return JsonResponse({
+            'orders': [{
+                'id': o.pk,
+                'amount': float(o.amount),
+                'cost': float(o.cost),
+                'date': o.created_at.strftime('%d.%m %H:%M')
+            } for o in page['items']],
+            'next_cursor': page['next_cursor'],
+        })
+
+    # Итоги — из дневного оборота (несколько строк на день), одним запросом
+    buy = Q(operation_type='BUY')
+    sell = Q(operation_type='SELL')
+    totals = DailyTurnover.objects.filter(
+        user_id=user_id, day__gte=period[0].date(), day__lt=period[1].date()
+    ).aggregate(
+        buy_sum=Sum('amount_sum', filter=buy, default=0),
+        buy_cost=Sum('cost_sum', filter=buy, default=0),
+        buy_count=Sum('orders_count', filter=buy, default=0),
+        sell_sum=Sum('amount_sum', filter=sell, default=0),
+        sell_cost=Sum('cost_sum', filter=sell, default=0),
+        sell_count=Sum('orders_count', filter=sell, default=0),
+    )
+    buy_sum = totals['buy_sum']
+    sell_sum = totals['sell_sum']
+
+    # Прибыль — реализованный P&L в ₽ (продажи против себестоимости покупок с комиссиями)
+    method = request.GET.get('method', DEFAULT_METHOD)
+    if method not in PNL_METHODS:
+        method = DEFAULT_METHOD
+    pnl = realized_pnl(user_id, period[0], period[1], method)
     
     def fmt(val):
         return f"{val:,.2f}".replace(',', ' ').replace('.', ',')
 
-    def serialize(qs):
-        return [{
-            'id': o.pk, 
-            'amount': float(o.amount),
-            'cost': float(o.cost) if hasattr(o, 'cost') else 0,
-            'date': o.created_at.strftime('%d.%m %H:%M')
-        } for o in qs]
-
     data = {
         'buy_sum': fmt(buy_sum),
-        'buy_count': buy_orders.count(),
+        'buy_cost': fmt(totals['buy_cost']),
+        'buy_count': totals['buy_count'],
         'sell_sum': fmt(sell_sum),
-        'sell_count': sell_orders.count(),
+        'sell_cost': fmt(totals['sell_cost']),
+        'sell_count': totals['sell_count'],
         'total_sum': fmt(buy_sum + sell_sum),
-        'profit': fmt(sell_sum - buy_sum),
-        'buy_orders': serialize(buy_orders),
-        'sell_orders': serialize(sell_orders),
+        'profit': fmt(pnl['pnl']),
+        'profit_method': method,
+        'proceeds': fmt(pnl['proceeds']),
+        'cost_basis': fmt(pnl['cost_basis']),
+        'unmatched_amount': fmt(pnl['unmatched']),
     }
     return JsonResponse(data)
 
@@ -391,6 +594,384 @@ def api_get_turnover(request, user_id):
 @login_required
 def admin_statistics(request):
     if not request.user.is_superuser: return redirect('my_orders')
-    return render(request, 'admin/statistics.html')
 
+    # По умолчанию — сегодняшний день; всё считается по дневному обороту, а не по Order
+    today = timezone.localdate()
+    start = parse_filter_date(request.GET.get('start')) or timezone.make_aware(datetime.datetime.combine(today, datetime.time()))
+    end = parse_filter_date(request.GET.get('end')) or start
+    rows = DailyTurnover.objects.filter(day__gte=start.date(), day__lte=end.date())
+
+    by_exchange = (
+        rows.values('exchange_type', 'operation_type')
+        .annotate(amount=Sum('amount_sum'), cost=Sum('cost_sum'), commission=Sum('commission_sum'), count=Sum('orders_count'))
+        .order_by('exchange_type', 'operation_type')
+    )
+    top_users = (
+        rows.values('user__username')
+        .annotate(cost=Sum('cost_sum'), count=Sum('orders_count'))
+        .order_by('-cost')[:20]
+    )
+    by_day = (
+        rows.values('day')
+        .annotate(cost=Sum('cost_sum'), commission=Sum('commission_sum'), count=Sum('orders_count'))
+        .order_by('day')
+    )
+    totals = rows.aggregate(
+        cost=Sum('cost_sum', default=0),
+        commission=Sum('commission_sum', default=0),
+        count=Sum('orders_count', default=0),
+    )
+
+    return render(request, 'admin/statistics.html', {
+        'start': start.date(),
+        'end': end.date(),
+        'totals': totals,
+        'by_exchange': by_exchange,
+        'top_users': top_users,
+        'by_day': by_day,
+    })
+
+
+
+# Выгрузка ордеров / оборота (CSV или XLSX) с фильтрами страницы оборота.
+# Без user_id — по всем пользователям
+EXPORTS = {'orders': export_orders, 'turnover': export_turnover}
+
+@login_required
+@user_passes_test(is_admin)
+def admin_export(request, kind):
+    period = turnover_period(request)
+    if period is None:
+        return JsonResponse({'error': 'Некорректный период'}, status=400)
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return JsonResponse({'error': 'Неизвестный формат'}, status=400)
+    user_id = request.GET.get('user_id')
+    if user_id and not user_id.isdigit():
+        return JsonResponse({'error': 'Некорректный пользователь'}, status=400)
+    side = request.GET.get('orders')
+
+    columns, queryset = EXPORTS[kind](
+        period[0], period[1], user_id=user_id, operation_type=side if side in ('BUY', 'SELL') else None,
+    )
+    end = period[1] - datetime.timedelta(days=1)
+    filename = f"{kind}_{user_id or 'all'}_{period[0]:%Y-%m-%d}_{end:%Y-%m-%d}"
+    return export_response(columns, queryset, fmt, filename)
+
+
+# Импорт ордеров из CSV (большие файлы — через manage.py import_orders)
+@login_required
+@user_passes_test(is_admin)
+def admin_import_orders(request):
+    result = None
+    error = None
+    if request.method == 'POST' and request.FILES.get('file'):
+        user = User.objects.filter(username=request.POST.get('username', '').strip()).first()
+        if user is None:
+            error = 'Пользователь не найден'
+        else:
+            try:
+                result = import_orders(
+                    user,
+                    request.FILES['file'],
+                    request.POST.get('format', 'generic'),
+                    exchange=request.POST.get('exchange') or None,
+                    use_copy=bool(request.POST.get('use_copy')),
+                )
+            except ValueError as e:
+                error = str(e)
+
+    return render(request, 'admin/import_orders.html', {
+        'formats': sorted(IMPORT_FORMATS),
+        'exchanges': list(EXTENSION_EXCHANGE_TYPES.values()),
+        'result': result,
+        'error': error,
+    })
+
+
+# Самые медленные профилированные запросы (core/profiling.py). POST — очистить буфер
+@login_required
+@user_passes_test(is_admin)
+def admin_profiling(request):
+    if request.method == 'POST':
+        slowest_requests.clear()
+        return redirect('admin_profiling')
+    requests_list, sampled = slowest_requests.snapshot()
+    return render(request, 'admin/profiling.html', {
+        'enabled': getattr(settings, 'PROFILING_ENABLED', False),
+        'sample_rate': getattr(settings, 'PROFILING_SAMPLE_RATE', 0.05),
+        'requests': requests_list,
+        'sampled': sampled,
+    })
+
+
+#API ДЛЯ РАСШИРЕНИЯ____________________________________________________________________________________________________________________
+
+# exchangeType из расширения -> Order.exchange_type
+EXTENSION_EXCHANGE_TYPES = {
+    1: 'Bybit',
+    2: 'HTX',
+    3: 'MEXC',
+}
+
+ORDER_STATUS_BATCH_LIMIT = 500
+
+
+def extension_exchange(raw, default=1):
+    try:
+        return EXTENSION_EXCHANGE_TYPES.get(int(raw if raw not in (None, '') else default))
+    except (TypeError, ValueError):
+        return None
+
+
+# API: Статусы (сохранён / чек / скриншот) сразу для всех ордеров на странице биржи
+@api_view(['POST'])
+def api_orders_status_batch(request):
+    exchange = extension_exchange(request.data.get('exchangeType'))
+    if exchange is None:
+        return Response({'message': 'Неизвестный тип биржи'}, status=400)
+
+    ids = request.data.get('ids')
+    if not isinstance(ids, list):
+        return Response({'message': 'Ожидается список ids'}, status=400)
+    if len(ids) > ORDER_STATUS_BATCH_LIMIT:
+        return Response({'message': f'Не больше {ORDER_STATUS_BATCH_LIMIT} ордеров за запрос'}, status=400)
+
+    # ID ордеров бирж длиннее 2^53, поэтому работаем только со строками
+    ids = {str(order_id).strip() for order_id in ids if str(order_id).strip()}
+
+    # Один IN-запрос по уникальному индексу (user, exchange_type, external_id)
+    rows = Order.objects.filter(
+        user=request.user, exchange_type=exchange, external_id__in=ids,
+    ).values_list('external_id', 'screenshot', 'receipt_status')
+
+    return Response({
+        'orders': {
+            external_id: {
+                'saved': True,
+                'receipt': receipt_status == 'DONE',
+                'receiptStatus': receipt_status or None,
+                'screenshot': bool(screenshot),
+            }
+            for external_id, screenshot, receipt_status in rows
+        }
+    })
+
+
+# exchange_type ордера -> exchangeType расширения
+ORDER_EXTENSION_TYPES = {name: code for code, name in EXTENSION_EXCHANGE_TYPES.items()}
+
+
+def order_payload(order):
+    bank = order.bank_detail
+    return {
+        'id': order.pk,
+        'orderId': order.external_id,
+        'exchangeType': ORDER_EXTENSION_TYPES.get(order.exchange_type),
+        'type': order.operation_type,
+        'price': str(order.price),
+        'amount': str(order.amount),
+        'cost': str(order.cost),
+        'details': {'id': bank.pk, 'name': bank.name} if bank else None,
+        'commission': str(order.commission),
+        # В расширении фиксированная комиссия называется MONEY
+        'commissionType': 'PERCENT' if order.commission_type == 'PERCENT' else 'MONEY',
+        # Фискальные реквизиты пробитого чека (orders/receipts.py), иначе null
+        'receipt': order.receipt_data if order.receipt_status == 'DONE' else None,
+        'receiptStatus': order.receipt_status or None,
+        'screenshot': order.screenshot_link,
+        'createdAt': order.created_at.isoformat(),
+        'version': order.version,
+    }
 
+
+def extension_order_response(request, external_id):
+    exchange = extension_exchange(request.query_params.get('exchangeType'))
+    external_id = (external_id or '').strip()
+    if exchange is None or not external_id:
+        return Response({'message': 'Не указан ордер или тип биржи'}, status=400)
+
+    # Версия ордеров пользователя уже загружена вместе с токеном — 304 отдаём без запроса к ордерам
+    user = request.user
+    etag = make_etag('order', user.pk, user.orders_version, exchange, external_id)
+    if not_modified(request, etag):
+        return Response(status=304, headers=etag_headers(etag))
+
+    order = (
+        Order.objects.select_related('bank_detail')
+        .filter(user=user, exchange_type=exchange, external_id=external_id)
+        .first()
+    )
+    if order is None:
+        return Response({'message': 'Ордер не найден'}, status=404, headers=etag_headers(etag))
+    return Response(order_payload(order), headers=etag_headers(etag))
+
+
+# API: Ордер по номеру с биржи (Bybit/HTX — числовой id). POST — сохранить один ордер
+# (та же идемпотентная запись, что и у пачки), в ответе — тот же объект, что в results пачки:
+# {"status", "key", "orderId", "id", "version"}
+@api_view(['GET', 'POST'])
+def api_order(request):
+    if request.method == 'POST':
+        exchange = extension_exchange(request.data.get('exchangeType'))
+        outcome, = write_orders(request.user, [(exchange, request.data)])
+        if outcome['status'] == 'error':
+            return Response({'message': outcome['message']}, status=400)
+        return Response(outcome, status=201 if outcome['status'] == 'created' else 200)
+    return extension_order_response(request, request.query_params.get('id'))
+
+
+# API: Пакетное сохранение ордеров со страницы биржи: JSON {"exchangeType", "orders": [...]}
+# или multipart (orders — JSON-строка, скриншоты — файлы, ордер ссылается на имя части
+# полем "screenshot"). У каждого ордера может быть idempotencyKey — повтор запроса безопасен
+@api_view(['POST'])
+def api_orders_batch(request):
+    orders = request.data.get('orders')
+    if isinstance(orders, str):
+        try:
+            orders = json.loads(orders)
+        except ValueError:
+            return Response({'message': 'orders: некорректный JSON'}, status=400)
+    if not isinstance(orders, list):
+        return Response({'message': 'Ожидается список orders'}, status=400)
+    if len(orders) > ORDER_BATCH_LIMIT:
+        return Response({'message': f'Не больше {ORDER_BATCH_LIMIT} ордеров за запрос'}, status=400)
+
+    default_exchange = request.data.get('exchangeType')
+    items = [
+        (extension_exchange(order.get('exchangeType', default_exchange) if isinstance(order, dict) else default_exchange), order)
+        for order in orders
+    ]
+    results = write_orders(request.user, items, request.FILES)
+    counts = {}
+    for outcome in results:
+        counts[outcome['status']] = counts.get(outcome['status'], 0) + 1
+    return Response({'results': results, 'counts': counts})
+
+
+# API: Принять синхронизированные ордера пачкой: {"ids": [...]} или фильтр
+# {"date_from", "date_to", "operation", "exchange"} ({"all": true} — все), плюс bank/commission/commission_type
+@api_view(['POST'])
+def api_unprocessed_accept(request):
+    try:
+        rows, options = unprocessed_accept_params(request.user, request.data, request.data.get('ids'))
+        outcome = accept_unprocessed(request.user, rows, **options)
+    except ValueError as e:
+        return Response({'message': str(e)}, status=400)
+    return Response(outcome)
+
+
+# API: Ордер по строковому номеру (MEXC)
+@api_view(['GET'])
+def api_order_by_string_id(request):
+    return extension_order_response(request, request.query_params.get('stringOrderId'))
+
+
+# API: Реквизиты пользователя (список — из кэша по details_version)
+@api_view(['GET', 'POST'])
+def api_details(request):
+    user = request.user
+    if request.method == 'POST':
+        detail = resolve_bank_detail(user, request.data.get('name'))
+        if detail is None:
+            return Response({'message': 'Не указано название реквизита'}, status=400)
+        return Response({'id': detail.pk, 'name': detail.name}, status=201)
+
+    etag = make_etag('details', user.pk, user.details_version)
+    return conditional_response(request, etag, lambda: get_bank_details(user))
+
+
+@api_view(['DELETE'])
+def api_detail_delete(request, detail_id):
+    if not delete_bank_detail(request.user, detail_id):
+        return Response({'message': 'Реквизит не найден'}, status=404)
+    return Response(status=204)
+
+
+# API: Профиль текущего пользователя
+@api_view(['GET'])
+def api_users_me(request):
+    user = request.user
+    payload = {
+        'id': user.pk,
+        'login': user.username,
+        'email': user.email,
+        'inn': user.inn or '',
+        'kktId': user.kkt_id or '',
+        'evotorLogin': user.evotor_login or '',
+        # Сам пароль расширению не нужен — только факт, что он заполнен
+        'evotorPassword': '********' if user.evotor_password else '',
+        'paymentAddress': user.payment_address or '',
+        'taxType': user.tax_type or '',
+    }
+    return conditional_response(request, payload_etag(payload), lambda: payload)
+
+
+# API: Скриншот ордера из расширения. POST — загрузка (multipart: file + name "<orderId>.png"),
+# GET ?name=<orderId>.png[&thumb=1] — получение файла
+@api_view(['GET', 'POST'])
+def api_order_screenshot(request):
+    params = request.data if request.method == 'POST' else request.query_params
+    external_id = (params.get('name') or '').rsplit('.', 1)[0].strip()
+    if not external_id:
+        return Response({'message': 'Не указан номер ордера'}, status=400)
+
+    orders = Order.objects.filter(user=request.user, external_id=external_id)
+    if params.get('exchangeType'):
+        orders = orders.filter(exchange_type=extension_exchange(params.get('exchangeType')))
+    order = orders.order_by('-created_at').first()
+    if order is None:
+        return Response({'message': 'Ордер не найден'}, status=404)
+
+    if request.method == 'GET':
+        field = order.screenshot_thumbnail if params.get('thumb') else order.screenshot
+        if not field:
+            return Response({'message': 'Скриншот не загружен'}, status=404)
+        return serve_file(request, field.name)
+
+    upload = request.FILES.get('file')
+    if upload is None:
+        return Response({'message': 'Нет файла'}, status=400)
+    shot = attach_screenshot(order, upload)
+    return Response({'id': shot.pk, 'status': shot.status}, status=201)
+
+
+# API: События пользователя в реальном времени (Server-Sent Events, только под ASGI).
+# Страницы — по сессии, расширение — коротким подписанным токеном в ?token=
+# (EventSource не умеет заголовки), токен выдаёт api_events_token.
+# Без ASGI или при выключенных событиях — 204: EventSource на него не переподключается
+async def order_events(request):
+    if not can_stream(request):
+        return HttpResponse(status=204)
+    user = await events_user(request)
+    if user is None:
+        return JsonResponse({'message': 'Не авторизован'}, status=401)
+    response = StreamingHttpResponse(event_stream(user.pk), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx не должен копить поток в буфере
+    return response
+
+
+async def events_user(request):
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Token '):
+        token = await Token.objects.select_related('user').filter(
+            key=header.split(' ', 1)[1].strip(), user__is_active=True,
+        ).afirst()
+        return token.user if token else None
+    if request.GET.get('token'):
+        user_id = stream_token_user_id(request.GET['token'])
+        return await User.objects.filter(pk=user_id, is_active=True).afirst() if user_id else None
+    user = await request.auser()
+    return user if user.is_authenticated else None
+
+
+# API: Токен подключения к /api/events для расширения (живёт EVENTS_TOKEN_MAX_AGE секунд)
+@api_view(['POST'])
+def api_events_token(request):
+    if not events_enabled():
+        return Response({'message': 'События отключены'}, status=501)
+    return Response({
+        'token': issue_stream_token(request.user.pk),
+        'expires_in': getattr(settings, 'EVENTS_TOKEN_MAX_AGE', 60),
+    })
@@ -901,6 +901,12 @@ function collectFormData() {
     const orderInfo = parseOrderInfo();
     formData.createdAt = orderInfo.createdAt;
     formData.type = orderInfo.type;
+
+    // Price, quantity and total from the order summary: the server needs them when
+    // the order has not been synced from Bybit yet
+    formData.price = parseNumberOrNull(parsePriceFromPage());
+    formData.quantity = parseNumberOrNull(parseQuantityFromPage());
+    formData.cost = parseNumberOrNull(parseAmountFromPage());
     
     console.log('P2P Analytics: ====== FINAL FORM DATA ======');
     console.log('P2P Analytics: Bank:', formData.bank, '(ID:', formData.bankId + ')');
@@ -909,6 +915,7 @@ function collectFormData() {
     console.log('P2P Analytics: Receipt data:', formData.receipt);
     console.log('P2P Analytics: Order type:', formData.type);
     console.log('P2P Analytics: Created at:', formData.createdAt);
+    console.log('P2P Analytics: Price / quantity / cost:', formData.price, formData.quantity, formData.cost);
     console.log('P2P Analytics: =========================');
     
     return formData;
@@ -1011,6 +1018,9 @@ async function handleFormSubmission() {
                 receipt: receiptValue,
                 createdAt: formData.createdAt,
                 type: formData.type,
+                price: formData.price,
+                amount: formData.quantity, // Bybit: amount is the crypto quantity, cost is the RUB total
+                cost: formData.cost,
                 exchangeType: EXCHANGE_TYPE_BYBIT // Bybit
             };
         
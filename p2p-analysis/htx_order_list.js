@@ -183,9 +183,10 @@
         if (!P2P) throw new Error('Auth not ready');
         const isAuth = await P2P.isAuthenticated();
         if (!isAuth) throw new Error('Не авторизован');
-        const res = await P2P.makeAuthenticatedRequest(`${P2P.API_BASE_URL}/api/order?id=${encodeURIComponent(orderId)}&exchangeType=2`, { method: 'GET' });
-        const data = await res.json();
-        return data;
+        // Rows of one page are collected into a single /api/order/status-batch request
+        const status = await getStatusBatcher().load(orderId);
+        if (!status || !status.saved) throw new Error('404 Not found');
+        return status;
     }
 
     function formatBadgeState(order) {
@@ -201,43 +202,16 @@
         console.log('[P2P HTX] Row states cleared for new page');
     }
 
-    // Request queue to limit concurrent API calls (prevents rate limiting)
-    class RequestQueue {
-        constructor(maxConcurrent = 3) {
-            this.maxConcurrent = maxConcurrent;
-            this.running = 0;
-            this.queue = [];
-        }
-
-        async add(fn) {
-            return new Promise((resolve, reject) => {
-                this.queue.push({ fn, resolve, reject });
-                this.process();
-            });
-        }
-
-        async process() {
-            if (this.running >= this.maxConcurrent || this.queue.length === 0) {
-                return;
-            }
+    // One batch status request per page instead of a request per row
+    let statusBatcher = null;
 
-            this.running++;
-            const { fn, resolve, reject } = this.queue.shift();
-
-            try {
-                const result = await fn();
-                resolve(result);
-            } catch (error) {
-                reject(error);
-            } finally {
-                this.running--;
-                this.process();
-            }
+    function getStatusBatcher() {
+        if (!statusBatcher) {
+            statusBatcher = window.P2POrderAPI.createOrderStatusBatcher(2);
         }
+        return statusBatcher;
     }
 
-    const requestQueue = new RequestQueue(3); // Max 3 concurrent requests
-
     async function processRow(row) {
         const orderId = extractOrderIdFromRow(row);
         if (!orderId) return;
@@ -246,8 +220,7 @@
         const prev = rowStates.get(orderId);
         if (prev && (prev.status === 'loading' || prev.status === 'stop404')) return;
 
-        // Add to queue to prevent overwhelming the API
-        return requestQueue.add(async () => {
+        return (async () => {
             rowStates.set(orderId, { status: 'loading', ts: Date.now() });
 
             try {
@@ -294,14 +267,14 @@
                 console.error('[P2P HTX] Error processing row:', err);
                 rowStates.set(orderId, { status: 'error', ts: Date.now() });
             }
-        });
+        })();
     }
 
     async function processAllVisibleRows() {
         // HTX Order table rows wrapper
         const rows = $all('.my-order .table .row-wrapper .row');
         
-        // Process rows through queue (automatically throttled to 3 concurrent)
+        // Rows are resolved together by one batch status request
         const promises = rows.map(row => processRow(row).catch(err => {
             console.error('[P2P HTX] Error in processRow:', err);
         }));
@@ -224,9 +224,10 @@
         if (!P2P) throw new Error('Auth not ready');
         const isAuth = await P2P.isAuthenticated();
         if (!isAuth) throw new Error('Не авторизован');
-        const res = await P2P.makeAuthenticatedRequest(`${P2P.API_BASE_URL}/api/order/by-string-id?stringOrderId=${encodeURIComponent(orderId)}&exchangeType=3`, { method: 'GET' });
-        const data = await res.json();
-        return data;
+        // Rows of one page are collected into a single /api/order/status-batch request
+        const status = await getStatusBatcher().load(orderId);
+        if (!status || !status.saved) throw new Error('404 Not found');
+        return status;
     }
 
     function formatBadgeState(order) {
@@ -235,48 +236,16 @@
         return { isSaved, hasReceipt };
     }
 
-    // Request queue to limit concurrent API calls (prevents rate limiting)
-    class RequestQueue {
-        constructor(maxConcurrent = 3) {
-            this.maxConcurrent = maxConcurrent;
-            this.running = 0;
-            this.queue = [];
-        }
+    // One batch status request per page instead of a request per row
+    let statusBatcher = null;
 
-        async add(fn) {
-            return new Promise((resolve, reject) => {
-                this.queue.push({ fn, resolve, reject });
-                this.process();
-            });
-        }
-
-        async process() {
-            if (this.running >= this.maxConcurrent || this.queue.length === 0) {
-                return;
-            }
-
-            this.running++;
-            const { fn, resolve, reject } = this.queue.shift();
-
-            try {
-                const result = await fn();
-                resolve(result);
-            } catch (error) {
-                reject(error);
-            } finally {
-                this.running--;
-                this.process();
-            }
-        }
-        
-        // Очистка очереди при смене страницы/пагинации
-        clear() {
-            this.queue = [];
+    function getStatusBatcher() {
+        if (!statusBatcher) {
+            statusBatcher = window.P2POrderAPI.createOrderStatusBatcher(3);
         }
+        return statusBatcher;
     }
 
-    const requestQueue = new RequestQueue(3); // Max 3 concurrent requests
-
     function clearAllBadges() {
         // Remove all badges from the page
         const allBadgeWrappers = $all('.p2p-analytics-badges-wrapper');
@@ -345,8 +314,7 @@
         row.setAttribute('data-p2p-version', String(version));
         row.setAttribute('data-p2p-timestamp', String(now));
 
-        // Add to queue to prevent overwhelming the API
-        return requestQueue.add(async () => {
+        return (async () => {
             // Проверяем, что DOM элемент всё ещё содержит тот же ордер
             const currentOrderIdBeforeRequest = extractOrderIdFromRow(row);
             if (currentOrderIdBeforeRequest !== orderId) {
@@ -424,7 +392,7 @@
                 console.error('[P2P MEXC] Error processing row:', err);
                 row.setAttribute('data-p2p-status', 'error');
             }
-        });
+        })();
     }
 
     // Единый механизм планирования обработки с debounce
@@ -449,7 +417,7 @@
             const currentVersion = ++processingVersion;
             
             // Очищаем очередь запросов от старых операций
-            requestQueue.clear();
+            if (statusBatcher) statusBatcher.clear();
             
             // Используем сохранённый флаг очистки
             if (pendingClearStates) {
@@ -482,7 +450,7 @@
             return;
         }
         
-        // Process rows through queue (automatically throttled to 3 concurrent)
+        // Rows are resolved together by one batch status request
         const promises = rows.map(row => processRow(row, version).catch(err => {
             console.error('[P2P MEXC] Error in processRow:', err);
         }));
@@ -693,7 +661,7 @@
     function cleanup() {
         console.log('[P2P MEXC] Cleaning up order list script...');
         stopListObserver();
-        requestQueue.clear();
+        if (statusBatcher) statusBatcher.clear();
     }
 
     function waitAuthReady() {
@@ -124,11 +124,92 @@ async function checkOrderExists(orderId, exchangeType) {
     }
 }
 
+/**
+ * Fetch saved/receipt state for many orders in one request
+ * @param {string[]} orderIds - Order IDs (strings to preserve precision for large IDs)
+ * @param {number} exchangeType - Exchange type (1=Bybit, 2=HTX, 3=MEXC)
+ * @returns {Promise<Object>} Map orderId -> {saved, receipt, screenshot}; unsaved orders are absent
+ */
+async function fetchOrdersStatusBatch(orderIds, exchangeType) {
+    const response = await window.P2PAuth.makeAuthenticatedRequest(
+        `${window.P2PAuth.API_BASE_URL}/api/order/status-batch`,
+        {
+            method: 'POST',
+            body: JSON.stringify({
+                exchangeType: exchangeType,
+                ids: orderIds.map(String)
+            })
+        }
+    );
+    const data = await response.json();
+    return data.orders || {};
+}
+
+// Max IDs per batch request (backend limit is 500)
+const ORDER_STATUS_BATCH_SIZE = 200;
+
+/**
+ * Collects order IDs requested during a short window and resolves them
+ * with a single batch request instead of one request per table row
+ */
+class OrderStatusBatcher {
+    constructor(exchangeType, delayMs = 50) {
+        this.exchangeType = exchangeType;
+        this.delayMs = delayMs;
+        this.pending = new Map(); // orderId -> [{resolve, reject}]
+        this.timer = null;
+    }
+
+    load(orderId) {
+        const id = String(orderId);
+        return new Promise((resolve, reject) => {
+            if (!this.pending.has(id)) this.pending.set(id, []);
+            this.pending.get(id).push({ resolve, reject });
+            if (!this.timer) {
+                this.timer = setTimeout(() => this.flush(), this.delayMs);
+            }
+        });
+    }
+
+    async flush() {
+        this.timer = null;
+        const batch = this.pending;
+        this.pending = new Map();
+
+        const ids = Array.from(batch.keys());
+        for (let i = 0; i < ids.length; i += ORDER_STATUS_BATCH_SIZE) {
+            const chunk = ids.slice(i, i + ORDER_STATUS_BATCH_SIZE);
+            try {
+                const statuses = await fetchOrdersStatusBatch(chunk, this.exchangeType);
+                chunk.forEach(id => batch.get(id).forEach(w => w.resolve(statuses[id] || null)));
+            } catch (error) {
+                chunk.forEach(id => batch.get(id).forEach(w => w.reject(error)));
+            }
+        }
+    }
+
+    // Drop queued IDs (page/pagination change)
+    clear() {
+        if (this.timer) {
+            clearTimeout(this.timer);
+            this.timer = null;
+        }
+        const cancelled = new Error('Запрос отменён');
+        this.pending.forEach(waiters => waiters.forEach(w => w.reject(cancelled)));
+        this.pending = new Map();
+    }
+}
+
+function createOrderStatusBatcher(exchangeType, delayMs) {
+    return new OrderStatusBatcher(exchangeType, delayMs);
+}
+
 /**
  * Save Order to API
  * @param {Object} orderData - Order data to save
  * @param {string} orderData.orderId - Order ID (MUST be string to preserve precision for large IDs)
- * @returns {Promise<{success: boolean, orderId?: string, message?: string, error?: string}>}
+ * @returns {Promise<{success: boolean, orderId?: number, status?: string, version?: number, message?: string, error?: string}>}
+ *   orderId is the server-side id of the saved order; status is "created" or "updated"
  */
 async function saveOrder(orderData) {
     try {
@@ -155,10 +236,12 @@ async function saveOrder(orderData) {
             }
         );
 
-        const orderId = await response.json();
+        const saved = await response.json();
         return {
             success: true,
-            orderId: orderId,
+            orderId: saved.id,
+            status: saved.status,
+            version: saved.version,
             message: 'Order saved successfully'
         };
     } catch (error) {
@@ -174,6 +257,164 @@ async function saveOrder(orderData) {
     }
 }
 
+/**
+ * Save several orders in one request (idempotent: repeated orders are not duplicated)
+ * @param {Array<Object>} orders - Orders in the same format as saveOrder; optional "key" is the idempotency key
+ * @param {number} exchangeType - Default exchange type for orders without exchangeType
+ * @param {Object<string, Blob>} [screenshots] - Screenshot files by name; an order references one via "screenshot"
+ * @returns {Promise<{success: boolean, results?: Array<Object>, counts?: Object, error?: string}>}
+ */
+async function saveOrdersBatch(orders, exchangeType, screenshots = {}) {
+    try {
+        const isAuth = await window.P2PAuth.isAuthenticated();
+        if (!isAuth) {
+            window.P2PAuth.showAuthError('Необходимо авторизоваться для сохранения заказов');
+            return {
+                success: false,
+                error: 'Не авторизован'
+            };
+        }
+
+        const payload = orders.map(order => ({
+            ...order,
+            orderId: order.orderId ? String(order.orderId) : order.orderId
+        }));
+        const url = `${window.P2PAuth.API_BASE_URL}/api/orders/batch`;
+        const names = Object.keys(screenshots || {});
+
+        let response;
+        if (names.length === 0) {
+            response = await window.P2PAuth.makeAuthenticatedRequest(url, {
+                method: 'POST',
+                body: JSON.stringify({ exchangeType, orders: payload })
+            });
+        } else {
+            const authData = await window.P2PAuth.getAuthData();
+            if (!authData) {
+                throw new Error('Не авторизован. Пожалуйста, войдите в систему.');
+            }
+            const formData = new FormData();
+            formData.append('exchangeType', String(exchangeType));
+            formData.append('orders', JSON.stringify(payload));
+            names.forEach(name => formData.append(name, screenshots[name], `${name}.png`));
+
+            response = await fetch(url, {
+                method: 'POST',
+                headers: {
+                    'Authorization': `${authData.tokenType} ${authData.token}`
+                    // Content-Type не указываем для FormData
+                },
+                body: formData
+            });
+            if (!response.ok) {
+                throw new Error(`Ошибка сохранения заказов: ${response.status}`);
+            }
+        }
+
+        const data = await response.json();
+        return {
+            success: true,
+            results: data.results,
+            counts: data.counts
+        };
+    } catch (error) {
+        console.error('Error saving orders batch:', error);
+        window.P2PAuth.showAuthError(error.message);
+        return {
+            success: false,
+            error: error.message
+        };
+    }
+}
+
+/**
+ * Subscribe to the user's order events (Server-Sent Events) instead of re-polling statuses
+ * @param {Object<string, Function>} handlers - Handlers by event type: unprocessed, order, orders,
+ *   receipt, screenshot; "resync" and "hello" (after every (re)connect) mean "re-read everything"
+ * @returns {Promise<{close: Function}|null>} Call close() on it to unsubscribe; null when the
+ *   server has events switched off
+ */
+async function subscribeOrderEvents(handlers) {
+    const authData = await window.P2PAuth.getAuthData();
+    if (!authData || !authData.token || typeof EventSource === 'undefined') {
+        return null;
+    }
+
+    let source = null;
+    let closed = false;
+    let retryTimer = null;
+    let failures = 0;  // connections in a row that closed without ever opening
+
+    // EventSource cannot send headers, and the API token must not end up in URLs (proxy logs,
+    // history): every connection uses a short-lived signed token from /api/events/token.
+    // Returns false when the server has events switched off - the caller keeps polling
+    async function connect() {
+        retryTimer = null;
+        let streamToken;
+        try {
+            const response = await window.P2PAuth.makeAuthenticatedRequest(
+                `${window.P2PAuth.API_BASE_URL}/api/events/token`,
+                { method: 'POST' }
+            );
+            if (response.status === 501 || response.status === 404) {
+                return false;
+            }
+            streamToken = (await response.json()).token;
+        } catch (error) {
+            console.warn('Order events: could not get a stream token', error);
+            reconnectLater();
+            return true;
+        }
+        if (closed) return true;
+
+        let opened = false;
+        source = new EventSource(`${window.P2PAuth.API_BASE_URL}/api/events?token=${encodeURIComponent(streamToken)}`);
+        source.onopen = () => {
+            opened = true;
+            failures = 0;
+        };
+        Object.keys(handlers).forEach(type => {
+            source.addEventListener(type, event => {
+                let data = {};
+                try {
+                    data = JSON.parse(event.data);
+                } catch (_) { /* ignore parse errors */ }
+                handlers[type](data);
+            });
+        });
+        source.onerror = () => {
+            // The browser reconnects by itself with the same URL; once the token has expired the
+            // server answers 401 and the source closes - then start over with a fresh token.
+            // A server that cannot hold streams (no ASGI) answers 204 every time: give up then
+            if (source.readyState !== EventSource.CLOSED) return;
+            if (!opened && ++failures >= 3) {
+                console.warn('Order events: stream unavailable, staying on polling');
+                closed = true;
+                return;
+            }
+            reconnectLater();
+        };
+        return true;
+    }
+
+    function reconnectLater() {
+        if (closed || retryTimer) return;
+        if (source) source.close();
+        retryTimer = setTimeout(connect, 3000 + Math.random() * 2000);
+    }
+
+    if (!(await connect())) {
+        return null;
+    }
+    return {
+        close() {
+            closed = true;
+            clearTimeout(retryTimer);
+            if (source) source.close();
+        }
+    };
+}
+
 /**
  * Delete Order from API
  * @param {string} orderId - Order ID to delete (MUST be string to preserve precision for large IDs)
@@ -407,7 +648,11 @@ if (typeof window !== 'undefined') {
         // API Functions
         fetchBankDetails,
         checkOrderExists,
+        fetchOrdersStatusBatch,
+        createOrderStatusBatcher,
         saveOrder,
+        saveOrdersBatch,
+        subscribeOrderEvents,
         deleteOrder,
         checkEvotorCredentials,
         
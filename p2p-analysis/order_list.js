@@ -209,10 +209,10 @@
         if (!P2P) throw new Error('Auth not ready');
         const isAuth = await P2P.isAuthenticated();
         if (!isAuth) throw new Error('Не авторизован');
-        const res = await P2P.makeAuthenticatedRequest(`${P2P.API_BASE_URL}/api/order?id=${encodeURIComponent(orderId)}`, { method: 'GET' });
-        // 404 handled by makeAuthenticatedRequest as non-ok -> throw; try parse if ok
-        const data = await res.json();
-        return data;
+        // Rows of one page are collected into a single /api/order/status-batch request
+        const status = await getStatusBatcher().load(orderId);
+        if (!status || !status.saved) throw new Error('404 Not found');
+        return status;
     }
 
     function formatBadgeState(order) {
@@ -228,43 +228,16 @@
         console.log('[P2P] Row states cleared for new page');
     }
 
-    // Request queue to limit concurrent API calls (prevents rate limiting)
-    class RequestQueue {
-        constructor(maxConcurrent = 3) {
-            this.maxConcurrent = maxConcurrent;
-            this.running = 0;
-            this.queue = [];
-        }
+    // One batch status request per page instead of a request per row
+    let statusBatcher = null;
 
-        async add(fn) {
-            return new Promise((resolve, reject) => {
-                this.queue.push({ fn, resolve, reject });
-                this.process();
-            });
-        }
-
-        async process() {
-            if (this.running >= this.maxConcurrent || this.queue.length === 0) {
-                return;
-            }
-
-            this.running++;
-            const { fn, resolve, reject } = this.queue.shift();
-
-            try {
-                const result = await fn();
-                resolve(result);
-            } catch (error) {
-                reject(error);
-            } finally {
-                this.running--;
-                this.process();
-            }
+    function getStatusBatcher() {
+        if (!statusBatcher) {
+            statusBatcher = window.P2POrderAPI.createOrderStatusBatcher(1);
         }
+        return statusBatcher;
     }
 
-    const requestQueue = new RequestQueue(3); // Max 3 concurrent requests
-
     async function processRow(row) {
         const orderId = extractOrderIdFromRow(row);
         if (!orderId) return;
@@ -273,8 +246,7 @@
         const prev = rowStates.get(orderId);
         if (prev && (prev.status === 'loading' || prev.status === 'stop404')) return;
 
-        // Add to queue to prevent overwhelming the API
-        return requestQueue.add(async () => {
+        return (async () => {
             rowStates.set(orderId, { status: 'loading', ts: Date.now() });
 
             try {
@@ -351,7 +323,7 @@
                 console.error('[P2P] Error processing row:', err);
                 rowStates.set(orderId, { status: 'error', ts: Date.now() });
             }
-        });
+        })();
     }
 
     async function processAllVisibleRows() {
@@ -359,7 +331,7 @@
         if (!table) return;
         const rows = $all('tbody > tr', table);
         
-        // Process rows through queue (automatically throttled to 3 concurrent)
+        // Rows are resolved together by one batch status request
         const promises = rows.map(row => processRow(row).catch(err => {
             console.error('[P2P] Error in processRow:', err);
         }));
@@ -442,6 +414,37 @@
         }
     }
 
+    // Server pushes order changes (saved elsewhere, receipt issued, screenshot attached):
+    // re-check only what changed instead of re-polling every row
+    // Without events on the server (no ASGI) the list keeps re-checking rows on page changes
+    let orderEvents = null;
+    let orderEventsTried = false;
+
+    async function startOrderEvents() {
+        if (orderEvents || orderEventsTried || !window.P2POrderAPI.subscribeOrderEvents) return;
+        orderEventsTried = true;
+        const refreshAll = () => {
+            if (!isTargetPage()) return;
+            clearRowStates();
+            processAllVisibleRows();
+        };
+        orderEvents = await window.P2POrderAPI.subscribeOrderEvents({
+            order: (data) => {
+                if (!isTargetPage()) return;
+                if (data.orderId) {
+                    rowStates.delete(String(data.orderId));
+                    processAllVisibleRows();
+                } else {
+                    refreshAll();
+                }
+            },
+            orders: refreshAll,
+            receipt: refreshAll,
+            screenshot: refreshAll,
+            resync: refreshAll
+        });
+    }
+
     function cleanup() {
         console.log('[P2P] Cleaning up order list script...');
         stopListObserver();
@@ -506,6 +509,7 @@
         
         processAllVisibleRows();
         startListObserver();
+        startOrderEvents();
         
         initInProgress = false;
         console.log('[P2P] Initialization complete');